@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, OTPRequest
+from .models import User, OTPRequest, OTPOutbox
 
 
 @admin.register(User)
@@ -17,3 +17,16 @@ class OTPRequestAdmin(admin.ModelAdmin):
     search_fields = ("phone_number", "otp")
     list_filter = ("created_at",)
     ordering = ("-created_at",)
+
+
+@admin.register(OTPOutbox)
+class OTPOutboxAdmin(admin.ModelAdmin):
+    list_display = ("phone_number", "status", "attempts", "next_attempt_at", "created_at")
+    search_fields = ("phone_number", "message_id")
+    list_filter = ("status", "created_at")
+    exclude = ("otp",)
+    readonly_fields = ("phone_number", "status", "attempts", "next_attempt_at", "last_error", "message_id", "created_at", "updated_at")
+    ordering = ("-created_at",)
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,52 @@
+import asyncio
+import signal
+from asgiref.sync import sync_to_async
+from django import db
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from authentication.otp_outbox import RateLimiter, claim_batch, create_http_client, save_results, send_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver queued WhatsApp OTP messages from the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50, help="Messages claimed (and sent concurrently) per batch.")
+        parser.add_argument("--rate", type=float, default=None, help="Messages per second (default: WHATSAPP_SEND_RATE).")
+        parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument("--once", action="store_true", help="Exit once no message is due instead of polling.")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.work(
+            options["batch_size"],
+            options["rate"] or settings.WHATSAPP_SEND_RATE,
+            options["poll_interval"],
+            options["once"],
+        ))
+
+    async def work(self, batch_size, rate, poll_interval, once):
+        stopping = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+        limiter = RateLimiter(rate)
+        sent = failed = 0
+
+        async with create_http_client(batch_size) as client:
+            while not stopping.is_set():
+                messages = await sync_to_async(claim_batch)(batch_size)
+                if not messages:
+                    if once:
+                        break
+                    await sync_to_async(db.close_old_connections)()
+                    try:
+                        await asyncio.wait_for(stopping.wait(), poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                ok = await send_batch(client, limiter, messages)
+                await sync_to_async(save_results)(messages)
+                sent += ok
+                failed += len(messages) - ok
+                self.stdout.write(f"batch of {len(messages)}: {ok} sent")
+
+        self.stdout.write(f"OTP sender stopped: {sent} sent, {failed} not sent")
@@ -0,0 +1,58 @@
+import asyncio
+import json
+import random
+import uvicorn
+from django.core.management.base import BaseCommand
+
+# What the WhatsApp Cloud API returns for an accepted message
+SAMPLE_RESPONSE = {
+    "messaging_product": "whatsapp",
+    "contacts": [
+        {"input": "919876543210", "wa_id": "919876543210"}
+    ],
+    "messages": [
+        {"id": "wamid.HBgMOTE5ODc2NTQzMjEwFQIAEhggODc0NUI5MTlGQkE5QkFBQTQ2RjQwQzYyMjg0MkE2RDI"}
+    ]
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stand-in for the WhatsApp messages API, for testing run_otp_sender. "
+        "Start the sender with WHATSAPP_API_BASE_URL=http://127.0.0.1:<port>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=8090)
+        parser.add_argument("--latency", type=float, default=0.2, help="Seconds to wait before answering.")
+        parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with 503.")
+        parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429.")
+
+    def handle(self, *args, **options):
+        stats = {"accepted": 0, "failed": 0, "rate_limited": 0}
+
+        async def app(scope, receive, send):
+            if scope["type"] != "http":
+                return
+            while (await receive()).get("more_body"):
+                pass
+            await asyncio.sleep(options["latency"])
+
+            roll = random.random()
+            if roll < options["rate_limit_rate"]:
+                status, body, headers = 429, {"error": {"message": "rate limited"}}, [(b"retry-after", b"1")]
+                stats["rate_limited"] += 1
+            elif roll < options["rate_limit_rate"] + options["fail_rate"]:
+                status, body, headers = 503, {"error": {"message": "unavailable"}}, []
+                stats["failed"] += 1
+            else:
+                status, body, headers = 200, SAMPLE_RESPONSE, []
+                stats["accepted"] += 1
+
+            await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")] + headers})
+            await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+        try:
+            uvicorn.run(app, host="127.0.0.1", port=options["port"], log_level="warning")
+        finally:
+            self.stdout.write(f"Stub server stopped: {stats}")
@@ -0,0 +1,200 @@
+"""
+Request middleware for authentication.
+
+RateLimitMiddleware: token-bucket rate limiting for the OTP endpoints.
+
+Each rule gives a client `capacity` requests, refilled evenly over `period`
+seconds, per phone number (from the JSON body) and per client IP. Buckets live
+in the "shared" cache so every worker sees the same budget. Requests over
+budget get a 429 before any RPC or WhatsApp send. Every limited response
+carries X-RateLimit-Limit/-Remaining/-Reset for the tightest bucket.
+
+Concurrent requests for the same key can both read a bucket before either
+writes it back, so a burst may slightly overshoot; that is fine for throttling.
+
+AuthTokenMiddleware: resolves the AuthToken header on user and order
+endpoints to request.auth_user_id (see tokens.py), rejecting unknown tokens
+before the view runs.
+"""
+import json
+import math
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from .tokens import aresolve_token, parse_token, resolve_token
+
+# path -> [(scope, capacity, period seconds)], overridable with settings.AUTH_RATE_LIMITS
+DEFAULT_RATE_LIMITS = {
+    "/auth/request_otp/": [("phone", 3, 10 * 60), ("ip", 20, 10 * 60)],
+    "/auth/verify_otp/": [("phone", 5, 10 * 60), ("ip", 30, 10 * 60)],
+}
+
+
+def get_rate_limits():
+    return getattr(settings, "AUTH_RATE_LIMITS", DEFAULT_RATE_LIMITS)
+
+
+def client_ip(request):
+    if getattr(settings, "RATE_LIMIT_TRUST_X_FORWARDED_FOR", False):
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def request_phone(request):
+    try:
+        phone_number = str(json.loads(request.body.decode("utf-8")).get("phone_number", "")).strip()
+    except (ValueError, AttributeError):
+        return None
+    return phone_number if phone_number.isdigit() and len(phone_number) == 10 else None
+
+
+def bucket_keys(request, rules):
+    """(cache key, capacity, period) for each rule that applies to this request."""
+    identities = {"ip": client_ip(request), "phone": request_phone(request)}
+    return [
+        (f"ratelimit:{request.path_info}:{scope}:{identities[scope]}", capacity, period)
+        for scope, capacity, period in rules
+        if identities.get(scope)
+    ]
+
+
+def take(state, capacity, period, now):
+    """
+    Refill a (tokens, updated) bucket and try to take one token.
+    Returns (allowed, new state, remaining, seconds until full).
+    """
+    rate = capacity / period
+    tokens, updated = state or (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    return allowed, (tokens, now), int(tokens), math.ceil((capacity - tokens) / rate)
+
+
+def evaluate(keys, states, now):
+    """Decide the request against every bucket; buckets are only charged if all allow it."""
+    results = [take(states.get(key), capacity, period, now) for key, capacity, period in keys]
+    allowed = all(result[0] for result in results)
+    tightest = min(range(len(keys)), key=lambda i: (results[i][0], results[i][2]))
+    _, _, remaining, reset = results[tightest]
+    headers = {
+        "X-RateLimit-Limit": str(keys[tightest][1]),
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset": str(reset),
+    }
+    if not allowed:
+        capacity, period = keys[tightest][1], keys[tightest][2]
+        tokens = results[tightest][1][0]
+        headers["Retry-After"] = str(math.ceil((1 - tokens) * period / capacity))
+    updates = {key: result[1] for (key, _, _), result in zip(keys, results)} if allowed else {}
+    return allowed, headers, updates
+
+
+def with_headers(response, headers):
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def too_many_requests(headers):
+    return with_headers(JsonResponse({"status": "error", "message": "Too many requests. Try again later."}, status=429), headers)
+
+
+class RateLimitMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cache = caches["shared"]
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        rules = get_rate_limits().get(request.path_info)
+        if not rules or request.method != "POST":
+            return self.get_response(request)
+
+        keys = bucket_keys(request, rules)
+        if not keys:
+            return self.get_response(request)
+        allowed, headers, updates = evaluate(keys, self.cache.get_many([key for key, _, _ in keys]), time.time())
+        if not allowed:
+            return too_many_requests(headers)
+        for key, capacity, period in keys:
+            self.cache.set(key, updates[key], timeout=period)
+        return with_headers(self.get_response(request), headers)
+
+    async def __acall__(self, request):
+        rules = get_rate_limits().get(request.path_info)
+        if not rules or request.method != "POST":
+            return await self.get_response(request)
+
+        keys = bucket_keys(request, rules)
+        if not keys:
+            return await self.get_response(request)
+        states = await self.cache.aget_many([key for key, _, _ in keys])
+        allowed, headers, updates = evaluate(keys, states, time.time())
+        if not allowed:
+            return too_many_requests(headers)
+        for key, capacity, period in keys:
+            await self.cache.aset(key, updates[key], timeout=period)
+        return with_headers(await self.get_response(request), headers)
+
+
+def auth_token_paths():
+    return getattr(settings, "AUTH_TOKEN_PATH_PREFIXES", ("/user/", "/order/"))
+
+
+def invalid_token(status):
+    return JsonResponse({"status": "error", "message": "Invalid auth token"}, status=status)
+
+
+class AuthTokenMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def check(self, request):
+        """The parsed token, or a response rejecting it; missing tokens are left to the view."""
+        request.auth_user_id = None
+        raw = request.headers.get("AuthToken")
+        if not raw or not request.path_info.startswith(auth_token_paths()):
+            return None, None
+        token = parse_token(raw)
+        if token is None:
+            return None, invalid_token(400)
+        return token, None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token, rejected = self.check(request)
+        if rejected:
+            return rejected
+        if token:
+            request.auth_user_id = resolve_token(token)
+            if request.auth_user_id is None:
+                return invalid_token(401)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        token, rejected = self.check(request)
+        if rejected:
+            return rejected
+        if token:
+            request.auth_user_id = await aresolve_token(token)
+            if request.auth_user_id is None:
+                return invalid_token(401)
+        return await self.get_response(request)
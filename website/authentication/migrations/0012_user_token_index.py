@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0011_otpoutbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['user_token'], name='idx_user_token'),
+        ),
+    ]
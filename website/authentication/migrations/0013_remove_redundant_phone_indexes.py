@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0012_user_token_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='otprequest',
+            name='idx_otp_phone',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='idx_user_phone',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:15
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0013_remove_redundant_phone_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='otpoutbox',
+            name='otp',
+            field=models.CharField(blank=True, max_length=6, validators=[django.core.validators.RegexValidator(message='OTP must be exactly 6 digits.', regex='^\\d{6}$')]),
+        ),
+    ]
@@ -2,6 +2,7 @@ import uuid
 from django.db import models
 from django.core.validators import RegexValidator, MaxLengthValidator, MinLengthValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 # Validators
 phone_regex = RegexValidator(regex=r'^\d{10}$', message="Phone number must be exactly 10 digits.")
@@ -22,8 +23,9 @@ class User(models.Model):
         ordering = ['-created_at']
         verbose_name = "User"
         verbose_name_plural = "Users"
+        # phone_number is indexed by its unique constraint
         indexes = [
-            models.Index(fields=['phone_number'], name='idx_user_phone')
+            models.Index(fields=['user_token'], name='idx_user_token'),
         ]
 
     def __str__(self):
@@ -47,9 +49,44 @@ class OTPRequest(models.Model):
     class Meta:
         db_table = 'otp_request'
         ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.phone_number} - {self.otp}"
+
+
+class OTPOutbox(models.Model):
+    """
+    An OTP waiting to be delivered over WhatsApp.
+
+    request_otp writes a row and returns; `manage.py run_otp_sender` delivers
+    it, retrying with backoff until it is sent or too old to be useful.
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+        ("expired", "Expired"),
+    ]
+
+    phone_number = models.CharField(max_length=10, validators=[phone_regex])
+    # Blanked once the message is sent, failed or expired
+    otp = models.CharField(max_length=6, blank=True, validators=[otp_regex])
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    # When a pending message may be sent next; while sending, when its lease expires
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    message_id = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'otp_outbox'
+        ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['phone_number'], name='idx_otp_phone')
+            models.Index(fields=['status', 'next_attempt_at'], name='idx_otp_outbox_due'),
         ]
 
     def __str__(self):
-        return f"{self.phone_number} - {self.otp}"
+        return f"{self.phone_number} ({self.status})"
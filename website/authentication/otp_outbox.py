@@ -0,0 +1,176 @@
+"""
+Outbox for WhatsApp OTP messages.
+
+request_otp only writes an OTPOutbox row; `manage.py run_otp_sender` claims
+due rows in batches and sends them concurrently over one pooled HTTP client,
+under a messages-per-second limit. Rate limits (429), server errors and network
+failures are retried with exponential backoff; messages older than
+OTP_OUTBOX_TTL are dropped, since the user has asked for a new code by then.
+A message's OTP is blanked as soon as it is sent, failed or expired.
+
+request_otp queues the message before the request_otp RPC stores the code,
+held back for HOLD_SECONDS, and makes it due once the RPC accepts the code
+(or deletes it if the RPC does not). A code is therefore never stored
+without a message to deliver it.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import timedelta
+import httpx
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import OTPOutbox
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 60
+# A message claimed by a sender that died becomes claimable again after this long
+LEASE_SECONDS = 60
+# How long a newly queued message waits for request_otp to confirm the code.
+# If the request dies in between, the message goes out after this anyway.
+HOLD_SECONDS = 30
+
+
+def build_otp_payload(phone_number, otp):
+    return {
+        "messaging_product": "whatsapp",
+        "to": "91" + phone_number,
+        "type": "template",
+        "template": {
+            "name": "auth",
+            "language": {"code": "en"},
+            "components": [
+                {
+                    "type": "body",
+                    "parameters": [
+                        {"type": "text", "text": str(otp)}
+                    ]
+                },
+                {
+                    "type": "button",
+                    "sub_type": "url",
+                    "index": "0",
+                    "parameters": [
+                        {"type": "text", "text": str(otp)}
+                    ]
+                }
+            ]
+        }
+    }
+
+
+def held_until():
+    return timezone.now() + timedelta(seconds=HOLD_SECONDS)
+
+
+def messages_url():
+    return f"{settings.WHATSAPP_API_BASE_URL.rstrip('/')}/{settings.WHATSAPP_PHONE_NUMBER_ID}/messages"
+
+
+def create_http_client(concurrency):
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(10, connect=5),
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        headers={"Authorization": f"Bearer {settings.WHATSAPP_TOKEN}"},
+    )
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` acquisitions per second, with bursts of up to `rate`."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def claim_batch(size):
+    """Atomically take up to `size` due messages. Safe to call from many senders."""
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OTPOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status__in=["pending", "sending"], next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:size]
+        )
+        expired_before = now - timedelta(seconds=settings.OTP_OUTBOX_TTL)
+        expired = [m.pk for m in messages if m.created_at < expired_before]
+        if expired:
+            OTPOutbox.objects.filter(pk__in=expired).update(status="expired", otp="", updated_at=now)
+
+        messages = [m for m in messages if m.pk not in expired]
+        for message in messages:
+            message.status = "sending"
+            message.attempts += 1
+            message.next_attempt_at = now + timedelta(seconds=LEASE_SECONDS)
+            message.updated_at = now
+        OTPOutbox.objects.bulk_update(messages, ["status", "attempts", "next_attempt_at", "updated_at"])
+    return messages
+
+
+def backoff_seconds(attempts, retry_after=None):
+    if retry_after:
+        return retry_after
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+async def send_message(client, limiter, message):
+    """Send one message and update it in memory; returns True once it is sent."""
+    await limiter.acquire()
+    retry_after = None
+    try:
+        resp = await client.post(messages_url(), json=build_otp_payload(message.phone_number, message.otp))
+        if resp.status_code == 200:
+            message.status = "sent"
+            message.otp = ""
+            message.message_id = (resp.json().get("messages") or [{}])[0].get("id", "")
+            message.last_error = ""
+            return True
+        error = f"HTTP {resp.status_code}: {resp.text[:500]}"
+        retryable = resp.status_code == 429 or resp.status_code >= 500
+        if resp.headers.get("Retry-After", "").isdigit():
+            retry_after = int(resp.headers["Retry-After"])
+    except httpx.HTTPError as e:
+        error = f"{type(e).__name__}: {e}"
+        retryable = True
+
+    logger.warning("OTP message %s failed (attempt %s): %s", message.pk, message.attempts, error)
+    message.last_error = error
+    if retryable and message.attempts < MAX_ATTEMPTS:
+        message.status = "pending"
+        message.next_attempt_at = timezone.now() + timedelta(seconds=backoff_seconds(message.attempts, retry_after))
+    else:
+        message.status = "failed"
+        message.otp = ""
+    return False
+
+
+async def send_batch(client, limiter, messages):
+    results = await asyncio.gather(*(send_message(client, limiter, m) for m in messages))
+    return sum(results)
+
+
+def save_results(messages):
+    now = timezone.now()
+    for message in messages:
+        message.updated_at = now
+    OTPOutbox.objects.bulk_update(messages, ["status", "otp", "message_id", "last_error", "next_attempt_at", "updated_at"])
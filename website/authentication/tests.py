@@ -1,3 +1,190 @@
-from django.test import TestCase
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from website.tests import CacheIsolationMixin
+from . import tokens
+from .middleware import AuthTokenMiddleware, take
+from .models import OTPOutbox, User
+from .otp_outbox import MAX_ATTEMPTS, RateLimiter, claim_batch, create_http_client, save_results, send_batch
 
-# Create your tests here.
+
+def rpc_returning(data):
+    client = mock.Mock()
+    client.rpc.return_value.execute = mock.AsyncMock(return_value=mock.Mock(data=data))
+    return client
+
+
+class RequestOTPTests(CacheIsolationMixin, TestCase):
+    def request_otp(self, phone_number, client):
+        with mock.patch("authentication.views.get_async_supabase", return_value=client):
+            return self.client.post("/auth/request_otp/", {"phone_number": phone_number}, content_type="application/json")
+
+    def test_accepted_code_is_queued(self):
+        client = rpc_returning({"status": "success"})
+        response = self.request_otp("9000000001", client)
+        self.assertEqual(response.status_code, 200)
+        message = OTPOutbox.objects.get(phone_number="9000000001")
+        self.assertEqual(message.status, "pending")
+        self.assertLessEqual(message.next_attempt_at, timezone.now())
+        self.assertEqual(client.rpc.call_args.args[1]["otp_input"], message.otp)
+
+    def test_refused_code_is_not_queued(self):
+        response = self.request_otp("9000000002", rpc_returning({"status": "wait", "message": "Try again later"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(OTPOutbox.objects.filter(phone_number="9000000002").exists())
+
+    def test_queue_failure_stores_no_code(self):
+        client = rpc_returning({"status": "success"})
+        with mock.patch("authentication.views.OTPOutbox.objects.acreate", side_effect=DatabaseError("down")), \
+                self.assertLogs("authentication.views", "ERROR"):
+            response = self.request_otp("9000000003", client)
+        self.assertEqual(response.status_code, 503)
+        client.rpc.assert_not_called()
+
+
+class RateLimitTests(CacheIsolationMixin, TestCase):
+    def test_bucket_refills_over_the_period(self):
+        state = None
+        for _ in range(3):
+            allowed, state, _, _ = take(state, 3, 60, now=1000)
+            self.assertTrue(allowed)
+        allowed, _, remaining, _ = take(state, 3, 60, now=1000)
+        self.assertEqual((allowed, remaining), (False, 0))
+        # One token comes back every period / capacity seconds
+        self.assertFalse(take(state, 3, 60, now=1019)[0])
+        self.assertTrue(take(state, 3, 60, now=1020)[0])
+
+    def test_request_otp_is_limited_per_phone_before_the_rpc(self):
+        client = rpc_returning({"status": "success"})
+        with mock.patch("authentication.views.get_async_supabase", return_value=client):
+            responses = [
+                self.client.post("/auth/request_otp/", {"phone_number": "9000000007"}, content_type="application/json")
+                for _ in range(4)
+            ]
+            other_phone = self.client.post("/auth/request_otp/", {"phone_number": "9000000008"}, content_type="application/json")
+        self.assertEqual([r.status_code for r in responses], [200, 200, 200, 429])
+        self.assertIn("Retry-After", responses[-1])
+        self.assertEqual(responses[-1]["X-RateLimit-Remaining"], "0")
+        self.assertEqual(other_phone.status_code, 200)
+        self.assertEqual(client.rpc.call_count, 4)
+
+    @override_settings(AUTH_RATE_LIMITS={"/auth/request_otp/": [("ip", 2, 60)]})
+    def test_request_otp_is_limited_per_ip(self):
+        client = rpc_returning({"status": "success"})
+        with mock.patch("authentication.views.get_async_supabase", return_value=client):
+            statuses = [
+                self.client.post("/auth/request_otp/", {"phone_number": f"900000002{i}"}, content_type="application/json").status_code
+                for i in range(3)
+            ]
+        self.assertEqual(statuses, [200, 200, 429])
+
+
+class TokenCacheTests(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(phone_number="9000000010")
+
+    def setUp(self):
+        super().setUp()
+        tokens._tokens.clear()
+        tokens._invalid.clear()
+
+    def test_resolved_token_is_cached(self):
+        self.assertEqual(tokens.resolve_token(self.user.user_token), self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(tokens.resolve_token(self.user.user_token), self.user.pk)
+
+    def test_unknown_token_is_cached_as_a_miss(self):
+        token = uuid.uuid4()
+        self.assertIsNone(tokens.resolve_token(token))
+        with self.assertNumQueries(0):
+            self.assertIsNone(tokens.resolve_token(token))
+
+    def test_rotation_invalidates_tokens_cached_by_every_worker(self):
+        old_token = self.user.user_token
+        self.assertEqual(tokens.resolve_token(old_token), self.user.pk)
+        # verify_otp in another worker: only the shared cache tells this one
+        User.objects.filter(pk=self.user.pk).update(user_token=uuid.uuid4())
+        tokens.forget_user(self.user.pk)
+
+        middleware = AuthTokenMiddleware(lambda request: HttpResponse())
+        response = middleware(RequestFactory().get("/user/cart/", HTTP_AUTHTOKEN=str(old_token)))
+        self.assertEqual(response.status_code, 401)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class OTPSenderTests(TestCase):
+    """run_otp_sender's steps against `manage.py whatsapp_stub_server`."""
+
+    def start_stub(self, *args):
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "manage.py", "whatsapp_stub_server", "--port", str(port), "--latency", "0", *args],
+            cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.addCleanup(server.wait)
+        self.addCleanup(server.terminate)
+        deadline = time.monotonic() + 20
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    self.fail("whatsapp_stub_server did not start")
+                time.sleep(0.1)
+        return override_settings(WHATSAPP_API_BASE_URL=f"http://127.0.0.1:{port}", WHATSAPP_PHONE_NUMBER_ID="1")
+
+    def send_due(self):
+        messages = claim_batch(10)
+
+        async def send():
+            async with create_http_client(5) as client:
+                return await send_batch(client, RateLimiter(100), messages)
+
+        sent = asyncio.run(send())
+        save_results(messages)
+        return sent
+
+    def test_sent_message_forgets_otp(self):
+        OTPOutbox.objects.create(phone_number="9000000004", otp="123456")
+        with self.start_stub():
+            self.assertEqual(self.send_due(), 1)
+        message = OTPOutbox.objects.get()
+        self.assertEqual((message.status, message.otp), ("sent", ""))
+        self.assertTrue(message.message_id.startswith("wamid."))
+
+    def test_server_errors_are_retried_then_given_up(self):
+        OTPOutbox.objects.create(phone_number="9000000005", otp="123456")
+        with self.start_stub("--fail-rate", "1"), self.assertLogs("authentication.otp_outbox", "WARNING"):
+            self.assertEqual(self.send_due(), 0)
+            message = OTPOutbox.objects.get()
+            self.assertEqual((message.status, message.otp, message.attempts), ("pending", "123456", 1))
+            self.assertIn("HTTP 503", message.last_error)
+
+            OTPOutbox.objects.update(attempts=MAX_ATTEMPTS - 1, next_attempt_at=timezone.now())
+            self.assertEqual(self.send_due(), 0)
+        message = OTPOutbox.objects.get()
+        self.assertEqual((message.status, message.otp), ("failed", ""))
+
+    def test_expired_message_forgets_otp(self):
+        message = OTPOutbox.objects.create(phone_number="9000000006", otp="123456")
+        OTPOutbox.objects.update(created_at=timezone.now() - timedelta(seconds=settings.OTP_OUTBOX_TTL + 1))
+        self.assertEqual(claim_batch(10), [])
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.otp), ("expired", ""))
@@ -0,0 +1,111 @@
+"""
+Resolve AuthToken headers to user ids without a database query per request.
+
+Resolved tokens are kept in a bounded per-process TTL cache, and tokens that
+match no user are cached (for a shorter time) as misses, so repeated bad
+tokens never reach the database. Each cached token is stamped with its user's
+token generation, which lives in the "shared" cache: verify_otp replaces the
+generation when it issues a new token, so every worker stops trusting the
+user's old tokens on their next request. Checking the generation costs one
+shared-cache read per request instead of a database query.
+"""
+import threading
+import uuid
+from cachetools import TTLCache
+from django.conf import settings
+from django.core.cache import caches
+from .models import User
+
+_MISS = object()
+_lock = threading.Lock()
+# token -> (user id, generation)
+_tokens = TTLCache(maxsize=settings.AUTH_TOKEN_CACHE_SIZE, ttl=settings.AUTH_TOKEN_CACHE_TTL)
+_invalid = TTLCache(maxsize=settings.AUTH_TOKEN_CACHE_SIZE, ttl=settings.AUTH_TOKEN_NEGATIVE_TTL)
+
+# A generation that expires or is evicted is replaced by a new one, which only
+# costs each worker one database lookup per cached token
+GENERATION_TIMEOUT = 24 * 60 * 60
+
+
+def parse_token(raw):
+    """The UUID in an AuthToken header (with or without "Bearer "), or None."""
+    if not raw:
+        return None
+    if raw.lower().startswith("bearer "):
+        raw = raw.split(" ", 1)[1]
+    try:
+        return uuid.UUID(raw.strip())
+    except ValueError:
+        return None
+
+
+def generation_key(user_id):
+    return f"auth:{user_id}:token_generation"
+
+
+def get_generation(user_id):
+    cache = caches["shared"]
+    generation = cache.get(generation_key(user_id))
+    if generation is None:
+        cache.add(generation_key(user_id), uuid.uuid4().hex, timeout=GENERATION_TIMEOUT)
+        generation = cache.get(generation_key(user_id))
+    return generation
+
+
+async def aget_generation(user_id):
+    cache = caches["shared"]
+    generation = await cache.aget(generation_key(user_id))
+    if generation is None:
+        await cache.aadd(generation_key(user_id), uuid.uuid4().hex, timeout=GENERATION_TIMEOUT)
+        generation = await cache.aget(generation_key(user_id))
+    return generation
+
+
+def cached_entry(token):
+    """The cached (user id, generation), None for a known-bad token, or _MISS."""
+    with _lock:
+        entry = _tokens.get(token, _MISS)
+        if entry is _MISS and token in _invalid:
+            return None
+    return entry
+
+
+def remember(token, user_id, generation=None):
+    with _lock:
+        if user_id is None:
+            _invalid[token] = True
+        else:
+            _tokens[token] = (user_id, generation)
+
+
+def resolve_token(token):
+    entry = cached_entry(token)
+    if entry is None:
+        return None
+    if entry is not _MISS and get_generation(entry[0]) == entry[1]:
+        return entry[0]
+    user_id = User.objects.filter(user_token=token).values_list("id", flat=True).first()
+    remember(token, user_id, None if user_id is None else get_generation(user_id))
+    return user_id
+
+
+async def aresolve_token(token):
+    entry = cached_entry(token)
+    if entry is None:
+        return None
+    if entry is not _MISS and await aget_generation(entry[0]) == entry[1]:
+        return entry[0]
+    user_id = await User.objects.filter(user_token=token).values_list("id", flat=True).afirst()
+    remember(token, user_id, None if user_id is None else await aget_generation(user_id))
+    return user_id
+
+
+def forget_user(user_id):
+    """Stop trusting a user's cached tokens in every worker (after their token was rotated)."""
+    caches["shared"].set(generation_key(user_id), uuid.uuid4().hex, timeout=GENERATION_TIMEOUT)
+
+
+async def aforget_phone(phone_number):
+    user_id = await User.objects.filter(phone_number=phone_number).values_list("id", flat=True).afirst()
+    if user_id is not None:
+        await caches["shared"].aset(generation_key(user_id), uuid.uuid4().hex, timeout=GENERATION_TIMEOUT)
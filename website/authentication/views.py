@@ -1,87 +1,24 @@
-from supabase import create_client, Client
+from website.supabase_client import get_async_supabase
+from django.db import DatabaseError
 from django.http import JsonResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 import json
-import os
 from django.views.decorators.http import require_http_methods
+import logging
 import secrets
-import requests  # ✅ instead of aiohttp
+from .models import OTPOutbox
+from .otp_outbox import held_until
+from .tokens import aforget_phone
 
-# Initializing supabase client
-SUPABASE_URL = os.getenv("DEV_DB_URL")
-SUPABASE_KEY = os.getenv("DEV_DB_API_KEY")
-WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
-WHATSAPP_PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+logger = logging.getLogger(__name__)
 
 # -------------------------
-# Sync WhatsApp OTP Sender
-# -------------------------
-def send_whatsapp_otp(phone_number: str, otp: int):
-    url = f"https://graph.facebook.com/v22.0/{WHATSAPP_PHONE_NUMBER_ID}/messages"
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": "91" + phone_number,
-        "type": "template",
-        "template": {
-            "name": "auth",
-            "language": {"code": "en"},
-            "components": [
-                {
-                    "type": "body",
-                    "parameters": [
-                        {"type": "text", "text": str(otp)}
-                    ]
-                },
-                {
-                    "type": "button",
-                    "sub_type": "url",
-                    "index": "0",
-                    "parameters": [
-                        {"type": "text", "text": str(otp)}
-                    ]
-                }
-            ]
-        }
-    }
-
-    # for testing purpose, do not remove
-    response_json = {
-        "messaging_product": "whatsapp",
-        "contacts": [
-            {"input": "919876543210", "wa_id": "919876543210"}
-        ],
-        "messages": [
-            {"id": "wamid.HBgMOTE5ODc2NTQzMjEwFQIAEhggODc0NUI5MTlGQkE5QkFBQTQ2RjQwQzYyMjg0MkE2RDI"}
-        ]
-    }
-
-    try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=10)
-        try:
-            return {
-                "status_code": 200,   # force success for testing
-                "response": response_json
-            }
-        except Exception:
-            return {"status_code": resp.status_code, "response": {}}
-    except Exception:
-        return {
-            "status_code": 400,
-            "status": "error",
-            "message": "could not send otp"
-        }
-
-# -------------------------
-# Sync Request OTP
+# Async Request OTP
 # -------------------------
 @csrf_exempt
 @require_http_methods(["POST"])
-def request_otp(request):
+async def request_otp(request):
     try:
         data = json.loads(request.body.decode("utf-8"))
     except json.JSONDecodeError:
@@ -94,19 +31,17 @@ def request_otp(request):
     if not phone_number.isdigit() or len(phone_number) != 10:
         return JsonResponse({"error": "Phone number must be exactly 10 digits"}, status=400)
 
+    otp = secrets.randbelow(900000) + 100000
     try:
-        otp = secrets.randbelow(900000) + 100000
+        # Queued (held, not yet due) before the RPC stores the code, so a code
+        # is never stored without a message to deliver it
+        message = await OTPOutbox.objects.acreate(phone_number=phone_number, otp=str(otp), next_attempt_at=held_until())
+    except DatabaseError:
+        logger.exception("Could not queue OTP message")
+        return JsonResponse({"status": "error", "message": "Could not send OTP, please try again"}, status=503)
 
-        # ✅ Sync WhatsApp OTP call
-        send_response = send_whatsapp_otp(phone_number, otp)
-
-        if send_response["status_code"] != 200:
-            return JsonResponse({
-                "status": "error",
-                "message": "Failed to send OTP via WhatsApp. Try again later."
-            }, status=500)
-
-        response = supabase.rpc(
+    try:
+        response = await get_async_supabase().rpc(
             "request_otp",
             {"phone_number_input": phone_number, "otp_input": str(otp)}
         ).execute()
@@ -114,14 +49,20 @@ def request_otp(request):
         supabase_result = response.data
 
         if not supabase_result or "status" not in supabase_result:
+            await message.adelete()
             return JsonResponse({"status": "error", "message": "Invalid Supabase response"}, status=500)
 
         if supabase_result["status"] == "wait":
+            await message.adelete()
             return JsonResponse(supabase_result)
 
         if supabase_result["status"] == "error":
+            await message.adelete()
             return JsonResponse(supabase_result, status=500)
 
+        # Delivered by `manage.py run_otp_sender`; the request doesn't wait for WhatsApp
+        await OTPOutbox.objects.filter(pk=message.pk).aupdate(next_attempt_at=timezone.now())
+
         return JsonResponse({
             "status": "success",
             "phone_number": phone_number,
@@ -129,15 +70,16 @@ def request_otp(request):
         })
 
     except Exception as e:
+        # The RPC may have stored the code before failing, so the held message still goes out
         return JsonResponse({"status": "error", "error": str(e)}, status=500)
 
 
 # -------------------------
-# Sync Verify OTP
+# Async Verify OTP
 # -------------------------
 @csrf_exempt
 @require_http_methods(["POST"])
-def verify_otp(request):
+async def verify_otp(request):
     try:
         data = json.loads(request.body.decode("utf-8"))
     except json.JSONDecodeError:
@@ -156,7 +98,7 @@ def verify_otp(request):
         return JsonResponse({"error": "OTP must be exactly 6 digits"}, status=400)
 
     try:
-        response = supabase.rpc(
+        response = await get_async_supabase().rpc(
             'verify_otp',
             {
                 'phone_number_input': phone_number,
@@ -171,6 +113,9 @@ def verify_otp(request):
             }, status=500)
 
         result = response.data[0]
+        if result.get('status') == 'success':
+            # verify_otp may have issued a new token; stop trusting cached ones
+            await aforget_phone(phone_number)
         return JsonResponse(result, status=200 if result.get('status') == 'success' else 400)
 
     except Exception as e:
@@ -1,6 +1,7 @@
 # orders/admin.py
-from django.contrib import admin
-from .models import PaymentMethod, Order, OrderItem
+from django.contrib import admin, messages
+from store.admin_utils import AutocompleteFilter, AutocompleteFilterMixin, LargeTableAdminMixin
+from .models import PaymentMethod, Order, OrderItem, recompute_totals
 
 
 @admin.register(PaymentMethod)
@@ -17,21 +18,35 @@ class OrderItemInline(admin.TabularInline):
     readonly_fields = ("product", "quantity", "price", "subtotal")  # subtotal works now!
     can_delete = False
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("product")
+
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdminMixin, AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ("id", "user", "status", "payment_method", "total_price", "created_at")
-    list_filter = ("status", "payment_method", "created_at")
-    search_fields = ("id", "user__username", "user__email")
+    list_select_related = ("user", "payment_method")
+    list_filter = ("status", "payment_method", ("user", AutocompleteFilter), "created_at")
+    search_fields = ("=id", "=user__phone_number")
+    autocomplete_fields = ("user",)
     readonly_fields = ("subtotal_price", "delivery_price", "discount", "total_price", "created_at", "updated_at")
     inlines = [OrderItemInline]
     ordering = ("-created_at",)
+    actions = ["recompute_selected_totals"]
+
+    @admin.action(description="Recompute totals of selected orders")
+    def recompute_selected_totals(self, request, queryset):
+        count = recompute_totals(queryset)
+        messages.success(request, f"Totals recomputed for {count} order(s)")
 
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(LargeTableAdminMixin, AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ("order", "product", "quantity", "price", "subtotal")
-    search_fields = ("order__id", "product__name")
-    list_filter = ("order__status", "product")
+    # Order.__str__ shows the user
+    list_select_related = ("order__user", "product")
+    search_fields = ("=order__id", "product__name")
+    list_filter = ("order__status", ("product", AutocompleteFilter))
+    autocomplete_fields = ("order", "product")
     ordering = ("-order__created_at",)
 
@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from orders.models import Order, recompute_totals
+
+
+class Command(BaseCommand):
+    help = "Recompute order subtotals and totals from their items, one UPDATE per batch of orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Orders updated per statement.")
+        parser.add_argument("--status", action="append", default=[], help="Only orders with this status (repeatable).")
+        parser.add_argument("--since", default="", help="Only orders created at or after this ISO datetime.")
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if options["status"]:
+            orders = orders.filter(status__in=options["status"])
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if since is None:
+                raise CommandError("--since must be an ISO datetime")
+            orders = orders.filter(created_at__gte=since)
+
+        start = time.perf_counter()
+        updated, last_id = 0, 0
+        while True:
+            # Keyset batches over the primary key, so each batch is an index range
+            ids = list(orders.filter(pk__gt=last_id).order_by("pk").values_list("pk", flat=True)[:options["batch_size"]])
+            if not ids:
+                break
+            updated += recompute_totals(orders.filter(pk__gte=ids[0], pk__lte=ids[-1]))
+            last_id = ids[-1]
+        self.stdout.write(f"Recomputed totals of {updated} orders in {time.perf_counter() - start:.2f}s")
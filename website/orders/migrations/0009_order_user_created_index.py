@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0013_remove_redundant_phone_indexes'),
+        ('orders', '0008_remove_order_address_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='authentication.user'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at'], name='idx_order_user_created'),
+        ),
+    ]
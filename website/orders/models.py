@@ -1,9 +1,20 @@
+from decimal import Decimal
 from django.db import models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Now
 from authentication.models import User
 from users.models import Address, CartItem
 from store.models import Product, Category
 
 
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+
+
+def item_subtotal_sum():
+    """SUM(price * quantity) over order items, 0 when there are none."""
+    return Coalesce(Sum(F("price") * F("quantity"), output_field=MONEY), Value(Decimal("0")), output_field=MONEY)
+
+
 class PaymentMethod(models.Model):
     name = models.CharField(max_length=50, unique=True)   # e.g. "Cash on Delivery"
     charges = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # extra fee if any
@@ -25,7 +36,8 @@ class Order(models.Model):
         ("cancelled", "Cancelled"),
     ]
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="orders")
+    # Indexed by idx_order_user_created instead
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="orders", db_index=False)
     address = models.TextField(null=False, blank=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
 
@@ -39,14 +51,20 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Order history: a user's orders, newest first
+            models.Index(fields=["user", "-created_at"], name="idx_order_user_created"),
+        ]
+
     def calculate_totals(self):
-        subtotal = sum(item.subtotal() for item in self.items.all())
+        subtotal = self.items.aggregate(subtotal=item_subtotal_sum())["subtotal"]
         self.subtotal_price = subtotal
         total = subtotal + self.delivery_price - self.discount
         if total < 0:
             total = 0
         self.total_price = total
-        self.save()
+        self.save(update_fields=["subtotal_price", "total_price", "updated_at"])
         return total
 
     def __str__(self):
@@ -71,3 +89,26 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} (Order #{self.order.id})"
+
+
+def recompute_totals(orders):
+    """
+    Recompute subtotal_price and total_price of every order in a queryset
+    with a single UPDATE; returns the number of orders updated.
+    """
+    subtotal = Coalesce(
+        Subquery(
+            OrderItem.objects.filter(order=OuterRef("pk"))
+            .values("order")
+            .annotate(subtotal=Sum(F("price") * F("quantity"), output_field=MONEY))
+            .values("subtotal"),
+            output_field=MONEY,
+        ),
+        Value(Decimal("0")),
+        output_field=MONEY,
+    )
+    return orders.order_by().update(
+        subtotal_price=subtotal,
+        total_price=Greatest(subtotal + F("delivery_price") - F("discount"), Value(Decimal("0")), output_field=MONEY),
+        updated_at=Now(),
+    )
@@ -1,3 +1,134 @@
+import io
+from decimal import Decimal
+from unittest import mock, skipUnless
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from authentication.models import User
+from store.models import Category, Product
+from store.tests import analyze
+from .models import Order, OrderItem, PaymentMethod, recompute_totals
 
-# Create your tests here.
+
+@skipUnless(connection.vendor == "postgresql", "query plans are checked on PostgreSQL only")
+class OrderIndexPlanTests(TestCase):
+    """Order queries against realistically sized tables, planner defaults on."""
+
+    USERS = 200
+    ORDERS_PER_USER = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(User(phone_number=f"9{i:09d}") for i in range(cls.USERS))
+        cls.user = users[0]
+        payment_method = PaymentMethod.objects.create(name="Cash on Delivery")
+        category = Category.objects.create(name="Fruits")
+        products = Product.objects.bulk_create(
+            Product(category=category, name=f"Product {i}", original_price=100, discounted_price=90) for i in range(500)
+        )
+        cls.product = products[0]
+        orders = Order.objects.bulk_create(
+            (Order(user=user, address="Somewhere", payment_method=payment_method) for user in users for _ in range(cls.ORDERS_PER_USER)),
+            batch_size=2000,
+        )
+        OrderItem.objects.bulk_create(
+            (
+                OrderItem(order=order, product=products[(i * 3 + j) % len(products)], quantity=1, price=90)
+                for i, order in enumerate(orders)
+                for j in range(3)
+            ),
+            batch_size=2000,
+        )
+        analyze(User, Product, Order, OrderItem)
+
+    def test_order_history(self):
+        plan = Order.objects.filter(user=self.user).order_by("-created_at").values("id")[:20].explain()
+        self.assertIn("using idx_order_user_created on", plan)
+        self.assertNotIn("Sort", plan)
+
+    def test_order_items_by_product(self):
+        # The foreign key's own index (plain or bitmap scan); no extra one is declared for it
+        plan = OrderItem.objects.filter(product=self.product).values("id").explain()
+        self.assertRegex(plan, r"(using|Bitmap Index Scan on) orders_orderitem_product_id_[0-9a-f]+ ")
+
+
+class OrderTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(phone_number="9000000201")
+        cls.payment_method = PaymentMethod.objects.create(name="Cash on Delivery")
+        category = Category.objects.create(name="Fruits")
+        cls.mango = Product.objects.create(category=category, name="Mango", original_price=100, discounted_price=90)
+        cls.apple = Product.objects.create(category=category, name="Apple", original_price=50, discounted_price=50)
+
+    def order(self, items=(), **fields):
+        fields = {"delivery_price": Decimal("20"), "status": "pending", **fields}
+        order = Order.objects.create(user=self.user, address="Somewhere", payment_method=self.payment_method, **fields)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=quantity, price=price) for product, quantity, price in items
+        )
+        return order
+
+    def totals(self, order):
+        order.refresh_from_db()
+        return order.subtotal_price, order.total_price
+
+    def test_sum_of_items(self):
+        order = self.order([(self.mango, 3, Decimal("89.50")), (self.apple, 2, Decimal("50"))], discount=Decimal("10"))
+        self.assertEqual(order.calculate_totals(), Decimal("378.50"))
+        self.assertEqual(self.totals(order), (Decimal("368.50"), Decimal("378.50")))
+
+        other = self.order([(self.apple, 1, Decimal("50"))])
+        Order.objects.update(subtotal_price=0, total_price=0)
+        self.assertEqual(recompute_totals(Order.objects.all()), 2)
+        self.assertEqual(self.totals(order), (Decimal("368.50"), Decimal("378.50")))
+        self.assertEqual(self.totals(other), (Decimal("50"), Decimal("70")))
+
+    def test_empty_order(self):
+        order = self.order()
+        self.assertEqual(order.calculate_totals(), Decimal("20"))
+        self.assertEqual(self.totals(order), (Decimal("0"), Decimal("20")))
+        recompute_totals(Order.objects.filter(pk=order.pk))
+        self.assertEqual(self.totals(order), (Decimal("0"), Decimal("20")))
+
+    def test_discount_never_makes_the_total_negative(self):
+        order = self.order([(self.apple, 1, Decimal("50"))], discount=Decimal("100"))
+        self.assertEqual(order.calculate_totals(), 0)
+        self.assertEqual(self.totals(order), (Decimal("50"), Decimal("0")))
+        Order.objects.update(total_price=1)
+        recompute_totals(Order.objects.all())
+        self.assertEqual(self.totals(order), (Decimal("50"), Decimal("0")))
+
+    def test_other_fields_are_left_alone(self):
+        order = self.order([(self.mango, 1, Decimal("90"))])
+        # Changed elsewhere after this copy was loaded
+        Order.objects.filter(pk=order.pk).update(status="confirmed", address="Elsewhere", discount=Decimal("5"))
+        order.calculate_totals()
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.address, order.discount), ("confirmed", "Elsewhere", Decimal("5")))
+
+        Order.objects.filter(pk=order.pk).update(status="delivered")
+        recompute_totals(Order.objects.filter(pk=order.pk))
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.total_price), ("delivered", Decimal("105")))
+
+    def test_command_batches_cover_every_order_once(self):
+        orders = [self.order([(self.apple, n, Decimal("50"))], status="cancelled" if n % 3 == 0 else "pending") for n in range(1, 9)]
+        Order.objects.update(subtotal_price=0, total_price=0)
+        batches = []
+
+        def recompute(queryset):
+            batches.append(list(queryset.order_by("pk").values_list("pk", flat=True)))
+            return recompute_totals(queryset)
+
+        out = io.StringIO()
+        with mock.patch("orders.management.commands.recompute_order_totals.recompute_totals", side_effect=recompute):
+            call_command("recompute_order_totals", "--batch-size", "2", "--status", "pending", stdout=out)
+
+        pending = [order.pk for order in orders if order.status == "pending"]
+        self.assertEqual([pk for batch in batches for pk in batch], pending)
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        self.assertIn(f"Recomputed totals of {len(pending)} orders", out.getvalue())
+        for order in orders:
+            subtotal, total = self.totals(order)
+            self.assertEqual(total, subtotal + 20 if order.status == "pending" else 0)
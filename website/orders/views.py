@@ -2,17 +2,14 @@
 import json
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from supabase import create_client
-from django.conf import settings
+from website.supabase_client import get_async_supabase
+from users import cart
 from django.views.decorators.http import require_http_methods
 import uuid
 
-# Initialize Supabase client
-supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-
 @csrf_exempt
 @require_http_methods(["POST"])
-def review_order_view(request):
+async def review_order_view(request):
     if request.method != "POST":
         return JsonResponse({"status": "error", "message": "Invalid method"}, status=405)
 
@@ -24,7 +21,7 @@ def review_order_view(request):
         if not auth_token or not address_id:
             return JsonResponse({"status": "error", "message": "AuthToken and address_id required"}, status=400)
 
-        response = supabase.rpc(
+        response = await get_async_supabase().rpc(
             "order_summary",
             {"auth_token": auth_token, "p_address_id": int(address_id)}
         ).execute()
@@ -48,7 +45,7 @@ def review_order_view(request):
 
 @require_http_methods(["POST"])
 @csrf_exempt
-def create_order_view(request):
+async def create_order_view(request):
     try:
         # Parse body
         body = json.loads(request.body.decode("utf-8"))
@@ -68,7 +65,7 @@ def create_order_view(request):
             auth_token = auth_token.split(" ", 1)[1]
 
         # Call Supabase function
-        response = supabase.rpc(
+        response = await get_async_supabase().rpc(
             "create_order",
             {
                 "auth_token": auth_token,
@@ -85,6 +82,9 @@ def create_order_view(request):
         if not data:
             return JsonResponse({"status": "error", "message": "Unexpected response from database"}, status=500)
 
+        # Placing the order empties the cart
+        if request.auth_user_id is not None:
+            await cart.ainvalidate([request.auth_user_id])
         return JsonResponse(data, status=200)
 
     except json.JSONDecodeError:
@@ -95,7 +95,7 @@ def create_order_view(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
-def get_user_orders_view(request):
+async def get_user_orders_view(request):
     try:
         auth_token = request.headers.get("AuthToken")
 
@@ -103,7 +103,7 @@ def get_user_orders_view(request):
             return JsonResponse({"status": "error", "message": "AuthToken required"}, status=400)
 
         # Call Supabase RPC
-        response = supabase.rpc(
+        response = await get_async_supabase().rpc(
             "get_user_orders",  # name of the Supabase function
             {"auth_token": auth_token}
         ).execute()
@@ -123,14 +123,14 @@ def get_user_orders_view(request):
     
 @csrf_exempt
 @require_http_methods(["GET"])
-def order_details_view(request, order_id):
+async def order_details_view(request, order_id):
     try:
         auth_token = request.headers.get("AuthToken")
         if not auth_token:
             return JsonResponse({"status": "error", "message": "AuthToken required"}, status=400)
 
         # Call Supabase RPC
-        response = supabase.rpc(
+        response = await get_async_supabase().rpc(
             "get_order_details",
             {"auth_token": auth_token, "p_order_id": int(order_id)}
         ).execute()
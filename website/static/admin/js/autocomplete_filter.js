@@ -0,0 +1,25 @@
+'use strict';
+{
+    // Reload the change list when an AutocompleteFilter changes
+    const $ = django.jQuery;
+
+    $(function() {
+        $('select.autocomplete-filter').each(function() {
+            const select = this;
+            $(select).on('change', function() {
+                const params = new URLSearchParams(window.location.search);
+                if (select.value) {
+                    params.set(select.name, select.value);
+                } else {
+                    params.delete(select.name);
+                }
+                params.delete('p');
+                window.location.search = params.toString();
+            });
+            // An empty value would be sent as a lookup on "" and rejected
+            $(select).closest('form').on('submit', function() {
+                select.disabled = !select.value;
+            });
+        });
+    });
+}
@@ -1,9 +1,9 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.contrib import messages
-from .models import Product, Category, Banner
-from .forms import ProductAdminForm, CategoryAdminForm, BannerAdminForm
-from .utils.google_drive import upload_file_to_drive
+from .models import Product, Category, Banner, DriveUploadJob
+from .forms import IMAGE_MAX_SIZES, ProductAdminForm, CategoryAdminForm, BannerAdminForm
+from .upload_queue import admin_update_fields, enqueue_image_upload, retry_jobs
 
 
 def get_full_image_url(google_file_id: str) -> str:
@@ -16,11 +16,21 @@ def get_thumbnail_url(google_file_id: str, size=200) -> str:
     return f"https://drive.google.com/thumbnail?id={google_file_id}&sz=w{size}" if google_file_id else ""
 
 
+class UploadTargetAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        if change:
+            # Leaves alone the image fields an upload finishing meanwhile has written
+            obj.save(update_fields=admin_update_fields(obj, form.changed_data))
+        else:
+            obj.save()
+
+
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(UploadTargetAdmin):
     form = CategoryAdminForm
-    list_display = ("name", "image_link", "image_preview", "file_size_info")
-    readonly_fields = ("image_link", "image_preview", "file_size_info")
+    list_display = ("name", "upload_status", "image_link", "image_preview", "file_size_info")
+    list_filter = ("upload_status",)
+    readonly_fields = ("upload_status", "image_link", "image_preview", "file_size_info")
 
     class Media:
         css = {
@@ -44,26 +54,26 @@ class CategoryAdmin(admin.ModelAdmin):
                     image_file,
                     output_format=output_format,
                     compression_level=compression_level,
-                    max_size=(800, 800)
+                    max_size=IMAGE_MAX_SIZES["category"]
                 )
 
                 # Get file size info
                 file_size_mb = processed_file.getbuffer().nbytes / (1024 * 1024)
 
-                google_id, uuid_val = upload_file_to_drive(processed_file, ext=ext)
-                obj.google_file_id = google_id
-                obj.image_uuid = uuid_val
-
-                # Show success message with compression info
-                compression_info = f"Image processed with {compression_level} compression ({file_size_mb:.2f}MB)"
-                messages.success(request, compression_info)
-
             except Exception as e:
                 messages.error(request, f"Error processing image: {str(e)}")
                 return
 
         super().save_model(request, obj, form, change)
 
+        if image_file:
+            # Uploaded to Drive by run_drive_upload_worker; the current image stays until then
+            enqueue_image_upload(obj, processed_file, ext, source=image_file)
+
+            # Show success message with compression info
+            compression_info = f"Image processed with {compression_level} compression ({file_size_mb:.2f}MB), upload queued"
+            messages.success(request, compression_info)
+
     def image_link(self, obj):
         if obj.google_file_id:
             return format_html(
@@ -90,11 +100,12 @@ class CategoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(UploadTargetAdmin):
     form = ProductAdminForm
-    list_display = ("name", "category", "stock", "is_active", "image_link", "image_preview")
-    readonly_fields = ("image_link", "image_preview")
-    list_filter = ("category", "is_active")
+    list_display = ("name", "category", "stock", "is_active", "upload_status", "image_link", "image_preview")
+    list_select_related = ("category",)
+    readonly_fields = ("upload_status", "image_link", "image_preview")
+    list_filter = ("category", "is_active", "upload_status")
     search_fields = ("name", "description")
 
     class Media:
@@ -119,25 +130,24 @@ class ProductAdmin(admin.ModelAdmin):
                     image_file,
                     output_format=output_format,
                     compression_level=compression_level,
-                    max_size=(1200, 1200)
+                    max_size=IMAGE_MAX_SIZES["product"]
                 )
 
                 file_size_mb = processed_file.getbuffer().nbytes / (1024 * 1024)
 
-                google_id, uuid_val = upload_file_to_drive(processed_file, ext=ext)
-                obj.google_file_id = google_id
-                obj.image_uuid = uuid_val
-
-                # Show success message with processing info
-                processing_info = f"Image processed with {compression_level} compression ({file_size_mb:.2f}MB)"
-                messages.success(request, processing_info)
-
             except Exception as e:
                 messages.error(request, f"Error processing image: {str(e)}")
                 return
 
         super().save_model(request, obj, form, change)
 
+        if image_file:
+            enqueue_image_upload(obj, processed_file, ext, source=image_file)
+
+            # Show success message with processing info
+            processing_info = f"Image processed with {compression_level} compression ({file_size_mb:.2f}MB), upload queued"
+            messages.success(request, processing_info)
+
     def image_link(self, obj):
         if obj.google_file_id:
             return format_html(
@@ -157,13 +167,13 @@ class ProductAdmin(admin.ModelAdmin):
     image_preview.short_description = "Preview"
 
 @admin.register(Banner)
-class BannerAdmin(admin.ModelAdmin):
+class BannerAdmin(UploadTargetAdmin):
     form = BannerAdminForm
-    list_display = ("id", "title", "text", "banner_type", "is_active", "image_link", "image_preview")
-    list_filter = ("is_active", "banner_type")  # Added banner_type filter
+    list_display = ("id", "title", "text", "banner_type", "is_active", "upload_status", "image_link", "image_preview")
+    list_filter = ("is_active", "banner_type", "upload_status")  # Added banner_type filter
     search_fields = ("title", "text", "search_query")  # Added search_query
     ordering = ("-id",)
-    readonly_fields = ("image_link", "image_preview")
+    readonly_fields = ("upload_status", "image_link", "image_preview")
 
     class Media:
         css = {
@@ -187,24 +197,22 @@ class BannerAdmin(admin.ModelAdmin):
                     image_file,
                     output_format=output_format,
                     compression_level=compression_level,
-                    max_size=(1600, 600)
+                    max_size=IMAGE_MAX_SIZES["banner"]
                 )
                 file_size_mb = processed_file.getbuffer().nbytes / (1024 * 1024)
-
-                google_id, uuid_val = upload_file_to_drive(processed_file, ext=ext)
-                obj.google_file_id = google_id
-                obj.image_uuid = uuid_val
-
-                messages.success(
-                    request,
-                    f"Banner image processed ({compression_level}, {file_size_mb:.2f}MB)"
-                )
             except Exception as e:
                 messages.error(request, f"Error uploading banner image: {str(e)}")
                 return
 
         super().save_model(request, obj, form, change)
 
+        if image_file:
+            enqueue_image_upload(obj, processed_file, ext, source=image_file)
+            messages.success(
+                request,
+                f"Banner image processed ({compression_level}, {file_size_mb:.2f}MB), upload queued"
+            )
+
     def image_link(self, obj):
         if getattr(obj, "google_file_id", None):
             return format_html(
@@ -222,3 +230,22 @@ class BannerAdmin(admin.ModelAdmin):
             )
         return "No Image"
     image_preview.short_description = "Preview"
+
+
+@admin.register(DriveUploadJob)
+class DriveUploadJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "target_model", "target_id", "kind", "rendition_format", "rendition_width", "status", "attempts", "next_attempt_at", "created_at")
+    list_filter = ("status", "target_model", "kind")
+    search_fields = ("=target_id", "=batch", "google_file_id")
+    exclude = ("payload",)
+    readonly_fields = ("target_model", "target_id", "batch", "kind", "rendition_format", "rendition_width", "ext", "google_file_id", "status", "attempts", "next_attempt_at", "last_error", "created_at", "updated_at")
+    ordering = ("-created_at",)
+    actions = ["retry_selected"]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Retry selected uploads now")
+    def retry_selected(self, request, queryset):
+        count = retry_jobs(queryset)
+        messages.success(request, f"{count} upload job(s) queued for retry")
@@ -0,0 +1,188 @@
+"""
+Search-as-you-type suggestions for product and category names.
+
+Every word position of every name is a key in one sorted array ("green apple
+juice", "apple juice", "juice"), so a typed prefix is a bisect plus a scan
+of the matching run. Suggestions are ranked by weight: how often a product
+was ordered, plus its discount; a category weighs what its products do.
+Results for one- and two-letter prefixes, whose runs are long, are memoized
+until the index changes.
+
+Like the search index, each worker keeps one copy tagged with the catalog
+version. Local saves update it in place, and anything else makes it stale and
+triggers a background rebuild. It is also rebuilt every
+AUTOCOMPLETE_MAX_AGE seconds so popularity follows new orders.
+"""
+import bisect
+import heapq
+import logging
+import math
+import threading
+import time
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+from .cache import get_catalog_version
+from .models import Category
+from .pagination import product_queryset
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_WEIGHT = 1.0
+DISCOUNT_WEIGHT = 2.0
+MEMO_PREFIX_LENGTH = 2
+MAX_LIMIT = 20
+
+
+def get_max_age():
+    return getattr(settings, "AUTOCOMPLETE_MAX_AGE", 60 * 60)
+
+
+def product_weight(order_count, discount):
+    return POPULARITY_WEIGHT * math.log1p(order_count) + DISCOUNT_WEIGHT * discount / 100
+
+
+class AutocompleteIndex:
+    def __init__(self, version=None):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.keys = []        # sorted (key, entry id)
+        self.entries = {}     # entry id -> (weight, text, type, id)
+        self.entry_keys = {}  # entry id -> its keys
+        self.memo = {}
+
+    def add(self, entry_id, text, kind, obj_id, weight, keep_sorted=True):
+        """Add or replace an entry. Bulk loads pass keep_sorted=False, then call finish()."""
+        self.remove(entry_id)
+        words = tokenize(text)
+        keys = [(" ".join(words[i:]), entry_id) for i in range(len(words))]
+        for key in keys:
+            if keep_sorted:
+                bisect.insort(self.keys, key)
+            else:
+                self.keys.append(key)
+        self.entries[entry_id] = (weight, text, kind, obj_id)
+        self.entry_keys[entry_id] = keys
+        self.memo.clear()
+
+    def finish(self):
+        self.keys.sort()
+
+    def remove(self, entry_id):
+        for key in self.entry_keys.pop(entry_id, ()):
+            del self.keys[bisect.bisect_left(self.keys, key)]
+        if self.entries.pop(entry_id, None) is not None:
+            self.memo.clear()
+
+    def suggest(self, query, limit):
+        prefix = " ".join(tokenize(query))
+        if not prefix:
+            return []
+        if len(prefix) <= MEMO_PREFIX_LENGTH:
+            if prefix not in self.memo:
+                self.memo[prefix] = self._top(prefix, MAX_LIMIT)
+            return self.memo[prefix][:limit]
+        return self._top(prefix, limit)
+
+    def _top(self, prefix, limit):
+        matched = set()
+        for i in range(bisect.bisect_left(self.keys, (prefix,)), len(self.keys)):
+            key, entry_id = self.keys[i]
+            if not key.startswith(prefix):
+                break
+            matched.add(entry_id)
+        best = heapq.nlargest(limit, matched, key=lambda entry_id: (self.entries[entry_id][0], entry_id))
+        return [
+            {"text": text, "type": kind, "id": obj_id}
+            for _, text, kind, obj_id in (self.entries[entry_id] for entry_id in best)
+        ]
+
+
+# Worker-wide index ------------------------------------------------------------
+
+_index = None
+_lock = threading.Lock()
+_refreshing = threading.Event()
+
+
+def order_counts(product_ids=None):
+    OrderItem = apps.get_model("orders", "OrderItem")
+    items = OrderItem.objects.all()
+    if product_ids is not None:
+        items = items.filter(product_id__in=product_ids)
+    return dict(items.values_list("product_id").annotate(count=Sum("quantity")))
+
+
+def build_index():
+    index = AutocompleteIndex(get_catalog_version())
+    counts = order_counts()
+    category_weights = {}
+    for product_id, name, discount, category_id in product_queryset().values_list("id", "name", "discount", "category_id"):
+        weight = product_weight(counts.get(product_id, 0), discount)
+        category_weights[category_id] = category_weights.get(category_id, 0) + weight
+        index.add(("product", product_id), name, "product", product_id, weight, keep_sorted=False)
+    for category_id, name in Category.objects.values_list("id", "name"):
+        index.add(("category", category_id), name, "category", category_id, category_weights.get(category_id, 0), keep_sorted=False)
+    index.finish()
+    return index
+
+
+def refresh_index():
+    global _index
+    try:
+        index = build_index()
+        with _lock:
+            _index = index
+    except Exception:
+        logger.exception("Autocomplete index rebuild failed")
+    finally:
+        connection.close()
+        _refreshing.clear()
+
+
+def get_index(version):
+    """
+    (index, stale): the worker's index, or None before the first build, and
+    whether it lags catalog `version`. A stale or old index triggers a
+    background rebuild but is still served meanwhile: a suggestion that is a
+    few seconds out of date is harmless, as long as it isn't cached under
+    the new version's ETag.
+    """
+    index = _index
+    stale = index is None or index.version != version
+    if (stale or time.monotonic() - index.built_at > get_max_age()) and not _refreshing.is_set():
+        _refreshing.set()
+        threading.Thread(target=refresh_index, name="autocomplete-refresh", daemon=True).start()
+    return index, stale
+
+
+def suggest(index, query, limit):
+    with _lock:
+        return index.suggest(query, limit)
+
+
+def apply_change(product_ids=(), category_id=None, old_version=None, new_version=None):
+    """Update products/categories saved in this process, see search.apply_change()."""
+    index = _index
+    if index is None:
+        return
+    if category_id is not None:
+        category = Category.objects.filter(pk=category_id).values_list("name", flat=True).first()
+    products = list(product_queryset().filter(id__in=product_ids).values_list("id", "name", "discount"))
+    counts = order_counts(product_ids)
+
+    with _lock:
+        if category_id is not None:
+            if category is None:
+                index.remove(("category", category_id))
+            else:
+                weight = index.entries.get(("category", category_id), (0,))[0]
+                index.add(("category", category_id), category, "category", category_id, weight)
+        for product_id in product_ids:
+            index.remove(("product", product_id))
+        for product_id, name, discount in products:
+            index.add(("product", product_id), name, "product", product_id, product_weight(counts.get(product_id, 0), discount))
+        if index.version == old_version:
+            index.version = new_version
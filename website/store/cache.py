@@ -0,0 +1,113 @@
+import hashlib
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from website.cache import aget_or_compute, get_or_compute
+from website.responses import PreparedJSON
+
+# Every cached catalog payload is keyed under the current catalog version, so
+# bumping the version (on any Category/Product/Banner change) invalidates all
+# of them at once without having to know which keys exist.
+CATALOG_VERSION_KEY = "store:catalog:version"
+
+# Seconds each RPC result may be served from cache, overridable with
+# settings.STORE_CACHE_TTLS = {"get_banners": 60, ...}
+DEFAULT_CACHE_TTLS = {
+    "get_categories": 60 * 30,
+    "get_banners": 60 * 10,
+    "get_home_data": 60 * 5,
+    "get_products_by_category": 60 * 2,
+}
+
+
+def get_cache_ttl(rpc_name):
+    ttls = {**DEFAULT_CACHE_TTLS, **getattr(settings, "STORE_CACHE_TTLS", {})}
+    return ttls.get(rpc_name, 60)
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Start from a clock value rather than 1 so that a version evicted from
+        # the cache never restarts at a number that already has entries stored.
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        return get_catalog_version()
+
+
+def normalize_params(params):
+    """Drop empty values and trim strings so equivalent requests share a key."""
+    normalized = {}
+    for key, value in (params or {}).items():
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "":
+            continue
+        normalized[key] = value
+    return normalized
+
+
+async def aget_catalog_version():
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        version = await sync_to_async(get_catalog_version, thread_sensitive=False)()
+    return version
+
+
+def make_cache_key(rpc_name, params=None, version=None):
+    payload = json.dumps(normalize_params(params), sort_keys=True, default=str)
+    digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+    if version is None:
+        version = get_catalog_version()
+    return f"store:{rpc_name}:v{version}:{digest}"
+
+
+def cached_rpc(client, rpc_name, params=None):
+    """
+    Read-through cache around client.rpc(rpc_name, params).execute().
+    Returns the response data; errors raised by the RPC are not cached, and
+    when a hot key expires only one worker re-runs the RPC.
+    """
+    def fetch():
+        if params is None:
+            return client.rpc(rpc_name).execute().data
+        return client.rpc(rpc_name, params).execute().data
+
+    return get_or_compute(make_cache_key(rpc_name, params), fetch, timeout=get_cache_ttl(rpc_name))
+
+
+async def acached_rpc(client, rpc_name, params=None):
+    """cached_rpc() for async views, with an async Supabase client."""
+    async def fetch():
+        if params is None:
+            return (await client.rpc(rpc_name).execute()).data
+        return (await client.rpc(rpc_name, params).execute()).data
+
+    key = make_cache_key(rpc_name, params, version=await aget_catalog_version())
+    return await aget_or_compute(key, fetch, timeout=get_cache_ttl(rpc_name))
+
+
+async def acached_json(client, rpc_name, params=None, render=None):
+    """
+    acached_rpc() that caches the encoded response instead of the RPC data:
+    render(data) builds the response payload, which is stored as a
+    website.responses.PreparedJSON ready to send.
+    """
+    async def fetch():
+        if params is None:
+            data = (await client.rpc(rpc_name).execute()).data
+        else:
+            data = (await client.rpc(rpc_name, params).execute()).data
+        return PreparedJSON.from_data(render(data))
+
+    key = make_cache_key(f"{rpc_name}:json", params, version=await aget_catalog_version())
+    return await aget_or_compute(key, fetch, timeout=get_cache_ttl(rpc_name))
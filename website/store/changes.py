@@ -0,0 +1,113 @@
+"""
+Change feed for incremental catalog sync.
+
+Every Category/Product/Banner save or delete appends a CatalogChange row
+(signals.py; import_catalog writes them for its bulk writes). Publishing it
+drops the object's older rows, so the log holds one row per object and
+`since=0` returns the whole catalog. The row is written in the same transaction as
+the change, so it commits (or rolls back) with it. A client stores the
+`version` of each response and passes it back as `since`. Objects that are
+gone or inactive come back as tombstones under "deleted".
+
+The feed is ordered by `position`, not by id. Ids are taken on insert but
+become visible on commit, so a transaction that stays open can commit a
+lower id after a client has read past it. Positions are handed out by
+publish() instead, only to rows that have already committed, one publisher
+at a time, so a row that commits later always lands after everything
+served so far. Only older positions are ever dropped, so the highest one
+stays in the table and numbering never goes back.
+"""
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import Max
+from .models import Banner, CatalogChange, Category
+from .pagination import PRODUCT_FIELDS, product_queryset, serialize
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+MAX_PUBLISH = 10000
+# pg_advisory_xact_lock key serializing publish()
+PUBLISH_LOCK = 0x63686773
+
+# kind -> key in the response
+KINDS = {"product": "products", "category": "categories", "banner": "banners"}
+CATEGORY_FIELDS = ["id", "name", "image_uuid", "google_file_id"]
+BANNER_FIELDS = ["id", "title", "text", "banner_type", "image_uuid", "google_file_id", "search_query"]
+
+
+def record(kind, object_ids):
+    """Log objects of one kind as changed; call inside the transaction that wrote them."""
+    object_ids = list(object_ids)
+    if object_ids:
+        CatalogChange.objects.bulk_create([CatalogChange(kind=kind, object_id=pk) for pk in object_ids])
+
+
+def publish():
+    """
+    Give committed rows without a position the next positions, in id order,
+    and drop the rows they supersede.
+    """
+    if not CatalogChange.objects.filter(position__isnull=True).exists():
+        return
+    with transaction.atomic():
+        # Held until commit, so positions become visible in the order they were given
+        # (SQLite runs one write transaction at a time anyway)
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [PUBLISH_LOCK])
+        last = CatalogChange.objects.aggregate(last=Max("position"))["last"] or 0
+        latest = {}
+        superseded = []
+        for change in CatalogChange.objects.filter(position__isnull=True).order_by("id")[:MAX_PUBLISH]:
+            previous = latest.pop((change.kind, change.object_id), None)
+            if previous is not None:
+                superseded.append(previous.id)
+            latest[(change.kind, change.object_id)] = change
+        if superseded:
+            CatalogChange.objects.filter(id__in=superseded).delete()
+
+        pending = sorted(latest.values(), key=lambda change: change.id)
+        for offset, change in enumerate(pending, 1):
+            change.position = last + offset
+        CatalogChange.objects.bulk_update(pending, ["position"], batch_size=1000)
+        for kind in KINDS:
+            object_ids = [object_id for change_kind, object_id in latest if change_kind == kind]
+            for start in range(0, len(object_ids), 1000):
+                CatalogChange.objects.filter(
+                    kind=kind, object_id__in=object_ids[start:start + 1000], position__lte=last
+                ).delete()
+
+
+async def fetch_rows(kind, ids):
+    if kind == "product":
+        return {row["id"]: serialize(row) async for row in product_queryset().filter(id__in=ids).values(*PRODUCT_FIELDS)}
+    if kind == "category":
+        rows = Category.objects.filter(id__in=ids).values(*CATEGORY_FIELDS)
+    else:
+        rows = Banner.objects.filter(id__in=ids, is_active=True).values(*BANNER_FIELDS)
+    return {row["id"]: {**row, "image_uuid": str(row["image_uuid"])} async for row in rows}
+
+
+async def changes_since(since, limit=DEFAULT_LIMIT):
+    """The feed page after position `since`, in the shape store/changes/ returns."""
+    await sync_to_async(publish)()
+    changes = [
+        change
+        async for change in CatalogChange.objects.filter(position__gt=since)
+        .order_by("position")
+        .values_list("position", "kind", "object_id")[:limit]
+    ]
+
+    page = {
+        "status": "success",
+        "since": since,
+        "version": changes[-1][0] if changes else since,
+        "has_more": len(changes) == limit,
+        "deleted": {},
+    }
+    for kind, key in KINDS.items():
+        ids = [object_id for _, change_kind, object_id in changes if change_kind == kind]
+        rows = await fetch_rows(kind, ids) if ids else {}
+        page[key] = list(rows.values())
+        page["deleted"][key] = [object_id for object_id in ids if object_id not in rows]
+    return page
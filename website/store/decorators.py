@@ -0,0 +1,77 @@
+"""
+HTTP caching for public catalog GET endpoints.
+
+Every payload these views return is a function of the URL and the catalog
+version (bumped on any Category/Product/Banner change, see cache.py), so the
+version is a strong validator on its own: a request whose If-None-Match
+carries the current version's ETag gets a 304 before the view runs, without
+any Supabase call. Compressed responses get the coding appended to the ETag
+("...-gzip") since a strong ETag names exactly one representation; the
+suffix is ignored when comparing. A view that sets its own ETag (a
+PreparedJSON's, see website.responses) keeps it and answers it itself.
+"""
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from website.responses import parse_etags
+from .cache import aget_catalog_version, get_catalog_version
+
+
+def catalog_etag(version):
+    return f'"catalog-{version}"'
+
+
+def matches(if_none_match, etag):
+    tags = parse_etags(if_none_match)
+    if tags == ["*"]:
+        return True
+    return any(tag == etag or (tag.startswith(etag[:-1] + "-") and tag.endswith('"')) for tag in tags)
+
+
+def not_modified(etag, cache_control):
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+def add_headers(response, etag, cache_control):
+    # Errors are not cached: they may not depend on the catalog at all. Nor are
+    # responses whose view already chose their caching (e.g. interim results)
+    if response.status_code != 200 or response.has_header("Cache-Control"):
+        return response
+    if not response.has_header("ETag"):
+        coding = response.get("Content-Encoding")
+        response["ETag"] = f'{etag[:-1]}-{coding}"' if coding else etag
+    response["Cache-Control"] = cache_control
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+def catalog_cached(max_age=60, stale_while_revalidate=300):
+    """
+    Give a view's 200 responses the catalog ETag and a public Cache-Control,
+    and answer conditional requests for the current version with 304.
+    """
+    cache_control = f"public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}"
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                etag = catalog_etag(await aget_catalog_version())
+                if matches(request.headers.get("If-None-Match"), etag):
+                    return not_modified(etag, cache_control)
+                return add_headers(await view(request, *args, **kwargs), etag, cache_control)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                etag = catalog_etag(get_catalog_version())
+                if matches(request.headers.get("If-None-Match"), etag):
+                    return not_modified(etag, cache_control)
+                return add_headers(view(request, *args, **kwargs), etag, cache_control)
+        return wrapper
+
+    return decorator
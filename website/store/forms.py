@@ -2,11 +2,20 @@ from django import forms
 from .models import Product, Category, Banner
 from PIL import Image
 import io
+from .utils.image_encoding import compress_to_fit
 
 ALLOWED_EXTENSIONS = [".jpg", ".jpeg", ".png", ".webp"]
 MAX_FILE_SIZE_MB = 10
 DRIVE_MAX_SIZE_MB = 1
 
+# Widths (px) pre-encoded at upload time; the image endpoint snaps requested
+# sizes to one of these instead of having Drive resize on every request.
+RENDITION_WIDTHS = (100, 200, 400, 800, 1200)
+RENDITION_FORMATS = ("webp", "jpeg")
+RENDITION_QUALITY = {"webp": {"quality": 82, "method": 4}, "jpeg": {"quality": 85, "optimize": True, "progressive": True}}
+# Bounding box each target's image is resized into, for the image and its renditions
+IMAGE_MAX_SIZES = {"category": (800, 800), "product": (1200, 1200), "banner": (1600, 600)}
+
 FORMAT_CHOICES = [
     ("original", "Keep Original Format"),
     ("jpg", "JPG"),
@@ -80,6 +89,45 @@ class ImageProcessingMixin:
 
         return buffer, output_format
 
+    def generate_renditions(self, image_file, max_size=(1200, 1200)):
+        """
+        Encode the RENDITION_WIDTHS ladder (WebP plus JPEG fallback) from a single
+        decode. Returns a list of (width, format, buffer), largest first; widths
+        above the image's own width are skipped rather than upscaled.
+        """
+        image_file.seek(0)
+        img = Image.open(image_file)
+        img = img.convert('RGBA') if img.mode in ('RGBA', 'LA', 'P') else img.convert('RGB')
+        img.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+        widths = sorted({w for w in RENDITION_WIDTHS if w < img.width} | {min(img.width, RENDITION_WIDTHS[-1])}, reverse=True)
+
+        renditions = []
+        current = img
+        for width in widths:
+            # Each step downsizes the previous rendition, not the full image
+            if current.width > width:
+                current = current.resize(
+                    (width, max(1, round(current.height * width / current.width))),
+                    Image.Resampling.LANCZOS,
+                )
+
+            if current.mode == 'RGBA':
+                flattened = Image.new('RGB', current.size, (255, 255, 255))
+                flattened.paste(current, mask=current.split()[-1])
+            else:
+                flattened = current
+
+            for fmt in RENDITION_FORMATS:
+                buffer = io.BytesIO()
+                source = current if fmt == 'webp' else flattened
+                source.save(buffer, format=fmt.upper(), **RENDITION_QUALITY[fmt])
+                buffer.seek(0)
+                renditions.append((width, fmt, buffer))
+
+        image_file.seek(0)
+        return renditions
+
     def _get_no_compression_params(self, format):
         """Absolute highest quality possible"""
         if format.lower() in ['jpg', 'jpeg']:
@@ -132,63 +180,7 @@ class ImageProcessingMixin:
 
     def _gentle_compress_to_fit(self, img, format, max_bytes):
         """Gentler compression approach that prioritizes quality"""
-        if format.lower() in ['jpg', 'jpeg', 'webp']:
-            # Start from higher quality and reduce more gradually
-            quality_steps = [95, 92, 88, 85, 82, 78, 75, 72, 68, 65, 60, 55, 50]
-            
-            for quality in quality_steps:
-                buffer = io.BytesIO()
-                params = {'quality': quality, 'optimize': True, 'progressive': True}
-                if format.lower() == 'webp':
-                    params = {'quality': quality, 'method': 4}
-                    del params['progressive']  # WebP doesn't use progressive
-                
-                img.save(buffer, format=format.upper(), **params)
-                if buffer.getbuffer().nbytes <= max_bytes:
-                    buffer.seek(0)
-                    return buffer
-        else:
-            # For PNG, try gentle compression levels
-            for compress_level in range(2, 7):
-                buffer = io.BytesIO()
-                img.save(buffer, format=format.upper(), 
-                        compress_level=compress_level, optimize=True)
-                if buffer.getbuffer().nbytes <= max_bytes:
-                    buffer.seek(0)
-                    return buffer
-        
-        # Only reduce dimensions if compression isn't enough
-        original_size = img.size
-        scale_steps = [0.95, 0.9, 0.85, 0.8, 0.75, 0.7]
-        
-        for scale in scale_steps:
-            new_size = (int(original_size[0] * scale), int(original_size[1] * scale))
-            resized_img = img.copy()
-            resized_img.thumbnail(new_size, Image.Resampling.LANCZOS)
-            
-            buffer = io.BytesIO()
-            if format.lower() in ['jpg', 'jpeg']:
-                resized_img.save(buffer, format=format.upper(), quality=85, optimize=True, progressive=True)
-            elif format.lower() == 'webp':
-                resized_img.save(buffer, format=format.upper(), quality=85, method=4)
-            else:
-                resized_img.save(buffer, format=format.upper(), compress_level=3, optimize=True)
-            
-            if buffer.getbuffer().nbytes <= max_bytes:
-                buffer.seek(0)
-                return buffer
-        
-        # Last resort - but still maintain reasonable quality
-        buffer = io.BytesIO()
-        if format.lower() in ['jpg', 'jpeg']:
-            img.save(buffer, format=format.upper(), quality=65, optimize=True, progressive=True)
-        elif format.lower() == 'webp':
-            img.save(buffer, format=format.upper(), quality=65, method=4)
-        else:
-            img.save(buffer, format=format.upper(), compress_level=6, optimize=True)
-        
-        buffer.seek(0)
-        return buffer
+        return compress_to_fit(img, format, max_bytes)
 
 # Rest of your form classes remain the same
 class ProductAdminForm(forms.ModelForm, ImageProcessingMixin):
@@ -0,0 +1,121 @@
+"""
+Precomputed home feed snapshots for best_deals_view.
+
+get_home_data assembles deals for every category, which is too heavy to run
+on each app launch. Instead, each feed (the default one and one per
+category) is stored in the cache as a ready-to-send PreparedJSON (see
+website.responses) whose ETag is derived from its bytes. Snapshots are
+keyed by catalog version. They are rebuilt in a background thread after
+catalog changes (signals.py) and by `manage.py build_home_feed`, which
+runs on a schedule to pick up anything else that moves the deals. A snapshot that is missing, for example a
+category_name nobody asked for yet, is built on first request.
+
+Rebuilds are debounced: a process starts at most one rebuild thread, which
+waits HOME_FEED_REBUILD_DELAY seconds so a burst of saves is built once, and
+only the process holding REBUILD_LOCK_KEY in the shared cache builds.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from website.cache import aget_or_compute
+from website.responses import PreparedJSON
+from website.supabase_client import get_async_supabase, supabase
+from .cache import aget_catalog_version, get_catalog_version, normalize_params
+from .models import Category
+
+logger = logging.getLogger(__name__)
+
+REBUILD_LOCK_KEY = "store:home_feed:rebuild:lock"
+
+_rebuilding = threading.Event()
+
+
+def get_rebuild_delay():
+    return getattr(settings, "HOME_FEED_REBUILD_DELAY", 2)
+
+
+def get_snapshot_ttl():
+    return getattr(settings, "HOME_FEED_TTL", 60 * 15)
+
+
+def feed_params(category_id=None, category_name=None):
+    return {"p_category_id": category_id, "p_category_name": category_name}
+
+
+def snapshot_key(params, version):
+    payload = json.dumps(normalize_params(params), sort_keys=True)
+    return f"store:home_feed:json:v{version}:{hashlib.sha1(payload.encode()).hexdigest()}"
+
+
+def make_snapshot(data):
+    return PreparedJSON.from_data({"status": "success", "data": data})
+
+
+def build_snapshot(params, version):
+    snapshot = make_snapshot(supabase.rpc("get_home_data", params).execute().data)
+    cache.set(snapshot_key(params, version), snapshot, timeout=get_snapshot_ttl())
+    return snapshot
+
+
+def build_all(version=None):
+    """Build the default feed and every category's feed for `version` (default: current); returns how many."""
+    if version is None:
+        version = get_catalog_version()
+    feeds = [feed_params()] + [feed_params(category_id=pk) for pk in Category.objects.values_list("pk", flat=True)]
+    for params in feeds:
+        build_snapshot(params, version)
+    return len(feeds)
+
+
+def rebuild_in_background():
+    """
+    Called after a catalog change commits. Only one rebuild is pending per
+    process and only one runs across processes: changes committed while it
+    runs move the catalog version, so it runs again for the new version
+    instead of dropping them.
+    """
+    if _rebuilding.is_set():
+        return
+
+    def run():
+        version = None
+        locked = False
+        try:
+            time.sleep(get_rebuild_delay())
+            # Held by another process: its loop sees the version this change moved
+            locked = cache.add(REBUILD_LOCK_KEY, os.getpid(), timeout=get_snapshot_ttl())
+            if locked:
+                while version != (latest := get_catalog_version()):
+                    version = latest
+                    build_all(version)
+        except Exception:
+            logger.exception("Home feed rebuild failed")
+            version = None
+        finally:
+            if locked:
+                cache.delete(REBUILD_LOCK_KEY)
+            connection.close()
+            _rebuilding.clear()
+        # A change between the last check and releasing the locks found them still held
+        if version is not None and version != get_catalog_version():
+            rebuild_in_background()
+
+    _rebuilding.set()
+    threading.Thread(target=run, name="home-feed-rebuild", daemon=True).start()
+
+
+async def aget_snapshot(category_id=None, category_name=None):
+    """The PreparedJSON for a feed, building it here only if no snapshot exists yet."""
+    params = feed_params(category_id, category_name)
+
+    async def fetch():
+        return make_snapshot((await get_async_supabase().rpc("get_home_data", params).execute()).data)
+
+    key = snapshot_key(params, await aget_catalog_version())
+    return await aget_or_compute(key, fetch, timeout=get_snapshot_ttl())
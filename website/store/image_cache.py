@@ -0,0 +1,142 @@
+"""
+On-disk cache for images proxied from Google Drive.
+
+Files are content-addressed by (google_file_id, width, height): a Drive file id
+never changes content, so a cached rendition never needs revalidating. Writes go
+to a temp file in the same directory and are moved into place with os.replace,
+so readers never see a partial image. The directory is kept under
+IMAGE_CACHE_MAX_BYTES by evicting the least recently served files. By default
+it lives in the private RUNTIME_DIR (website/runtime.py), so no other local
+user can plant the images that get served.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from django.conf import settings
+from website.runtime import private_dir
+
+IMAGE_CACHE_MAX_BYTES = getattr(settings, "IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+EXTENSION_CONTENT_TYPES = {ext: ctype for ctype, ext in CONTENT_TYPE_EXTENSIONS.items()}
+
+# Evict at most once per EVICT_INTERVAL seconds per process; a directory scan
+# on every write would cost more than the downloads it saves.
+EVICT_INTERVAL = 60
+_evict_lock = threading.Lock()
+_last_evict = 0.0
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def get_cache_dir():
+    path = getattr(settings, "IMAGE_CACHE_DIR", "")
+    return private_dir(path or os.path.join(private_dir(settings.RUNTIME_DIR), "images"))
+
+
+def cache_key(google_file_id, width, height):
+    return hashlib.sha256(f"{google_file_id}:{width}:{height}".encode("utf-8")).hexdigest()
+
+
+def _base_path(key):
+    return os.path.join(get_cache_dir(), key[:2], key)
+
+
+def get_cached_image(key):
+    """Return (path, content_type) for a cached image, or None."""
+    base = _base_path(key)
+    for ext, content_type in EXTENSION_CONTENT_TYPES.items():
+        path = base + ext
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        # Record the hit in atime (used for LRU eviction) but keep mtime, which
+        # is served as Last-Modified.
+        try:
+            os.utime(path, (time.time(), stat.st_mtime))
+        except OSError:
+            pass
+        return path, content_type
+    return None
+
+
+def store_image(key, chunks, content_type):
+    """Write chunks to the cache atomically and return the final path."""
+    ext = CONTENT_TYPE_EXTENSIONS.get(content_type.split(";")[0].strip(), ".jpg")
+    path = _base_path(key) + ext
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        written = 0
+        with os.fdopen(fd, "wb") as tmp:
+            for chunk in chunks:
+                written += len(chunk)
+                if written > MAX_IMAGE_BYTES:
+                    raise ImageTooLarge(f"Image exceeds {MAX_IMAGE_BYTES} bytes")
+                tmp.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    maybe_evict()
+    return path
+
+
+def maybe_evict():
+    global _last_evict
+    now = time.monotonic()
+    if now - _last_evict < EVICT_INTERVAL or not _evict_lock.acquire(blocking=False):
+        return
+    try:
+        _last_evict = now
+        evict(IMAGE_CACHE_MAX_BYTES)
+    finally:
+        _evict_lock.release()
+
+
+def evict(max_bytes):
+    """Delete least recently served files until the cache fits in 90% of max_bytes."""
+    entries = []
+    total = 0
+    for root, _dirs, files in os.walk(get_cache_dir()):
+        for name in files:
+            if name.startswith(".tmp-"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+
+    if total <= max_bytes:
+        return
+
+    target = max_bytes * 0.9
+    entries.sort()
+    for _atime, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,85 @@
+import io
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image
+from store.forms import ImageProcessingMixin, DRIVE_MAX_SIZE_MB
+from store.utils.image_encoding import compress_to_fit, encode, encode_params, get_pool, get_worker_count
+
+# Quality steps of the previous linear scan, kept here as the baseline
+LINEAR_QUALITY_STEPS = [95, 92, 88, 85, 82, 78, 75, 72, 68, 65, 60, 55, 50]
+
+
+def linear_scan(img, format, max_bytes):
+    for quality in LINEAR_QUALITY_STEPS:
+        data = encode(img, format, encode_params(format, quality))
+        if len(data) <= max_bytes:
+            return data
+    return None
+
+
+def make_upload(size, format):
+    """A noisy photo-like image, which compresses about as badly as real uploads do."""
+    width, height = size
+    img = Image.effect_noise((width, height), 64).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((width, height))
+    img = Image.merge("RGB", (img.getchannel(0), gradient, img.getchannel(2)))
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    buffer.seek(0)
+    buffer.content_type = "image/png"
+    return buffer
+
+
+class Command(BaseCommand):
+    help = "Time admin image processing (decode, resize, fit under the Drive size limit) per upload size."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="800,1600,2400,4000", help="Comma-separated upload widths (square images).")
+        parser.add_argument("--format", default="jpeg", choices=["jpeg", "webp"])
+        parser.add_argument("--max-size", type=int, default=1200, help="Longest side after resizing, as in ProductAdmin.")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--workers", type=int, default=4, help="Encode processes for the parallel column (IMAGE_ENCODE_WORKERS).")
+
+    def handle(self, *args, **options):
+        fmt = options["format"]
+        max_bytes = DRIVE_MAX_SIZE_MB * 1024 * 1024
+        # Force a fit search by giving a budget the high-quality encode exceeds
+        budget = max_bytes // 4
+        mixin = ImageProcessingMixin()
+        settings.IMAGE_ENCODE_WORKERS = options["workers"]
+
+        if get_pool() is not None:
+            # Warm the pool so worker start-up is not billed to the first size
+            compress_to_fit(Image.new("RGB", (64, 64)), fmt, 1)
+
+        self.stdout.write(f"format={fmt} budget={budget // 1024}KB workers={get_worker_count()} repeat={options['repeat']}")
+        self.stdout.write(f"{'upload':>10} {'upload MB':>10} {'process_image':>14} {'linear':>10} {'search':>10} {'parallel':>10}")
+
+        for width in [int(w) for w in options["sizes"].split(",")]:
+            upload = make_upload((width, width), fmt)
+            upload_mb = upload.getbuffer().nbytes / (1024 * 1024)
+
+            img = Image.open(upload).convert("RGB")
+            img.thumbnail((options["max_size"], options["max_size"]), Image.Resampling.LANCZOS)
+
+            timings = {
+                "process_image": lambda: (upload.seek(0), mixin.process_image(
+                    upload, output_format=fmt, compression_level="high",
+                    max_size=(options["max_size"], options["max_size"]))),
+                "linear": lambda: linear_scan(img, fmt, budget),
+                "search": lambda: compress_to_fit(img, fmt, budget, parallel=False),
+                "parallel": lambda: compress_to_fit(img, fmt, budget, parallel=True),
+            }
+            results = {}
+            for name, run in timings.items():
+                start = time.perf_counter()
+                for _ in range(options["repeat"]):
+                    run()
+                results[name] = (time.perf_counter() - start) / options["repeat"]
+
+            self.stdout.write(
+                f"{width:>8}px {upload_mb:>10.2f} "
+                f"{results['process_image']:>13.3f}s {results['linear']:>9.3f}s "
+                f"{results['search']:>9.3f}s {results['parallel']:>9.3f}s"
+            )
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from store.home_feed import build_all
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed home feed snapshots served by best_deals_view."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0, help="Keep running and rebuild every N seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            try:
+                count = build_all()
+                self.stdout.write(f"Built {count} home feed snapshots in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                if not options["interval"]:
+                    raise
+                self.stderr.write(f"Home feed rebuild failed: {e}")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
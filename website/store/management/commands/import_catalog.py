@@ -0,0 +1,322 @@
+import csv
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from store import changes
+from store.cache import bump_catalog_version
+from store.forms import ImageProcessingMixin
+from store.models import Category, Product
+from store.utils.google_drive import upload_file_to_drive
+from users.cart import invalidate_product_carts
+
+PRODUCT_FIELDS = ["description", "original_price", "discounted_price", "unit", "quantity", "stock", "is_active"]
+IMAGE_FIELDS = ["google_file_id", "image_uuid", "image_renditions", "upload_status"]
+IMAGE_MAX_SIZE = {"category": (800, 800), "product": (1200, 1200)}
+CONTENT_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+
+
+class RecordError(ValueError):
+    pass
+
+
+def read_records(path):
+    """Yield catalog records from a .csv or .jsonl file, one at a time."""
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, encoding="utf-8", newline="") as f:
+            yield from csv.DictReader(f)
+
+
+def parse_bool(value, default=True):
+    if value in (None, ""):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+
+def parse_product(record):
+    try:
+        product = {
+            "name": str(record["name"]).strip(),
+            "category": str(record["category"]).strip(),
+            "description": record.get("description") or None,
+            "original_price": int(record["original_price"]),
+            "discounted_price": int(record.get("discounted_price") or record["original_price"]),
+            "unit": record.get("unit") or "g",
+            "quantity": Decimal(str(record.get("quantity") or 1)),
+            "stock": int(record.get("stock") or 0),
+            "is_active": parse_bool(record.get("is_active")),
+        }
+    except (KeyError, ValueError, InvalidOperation) as e:
+        raise RecordError(f"invalid product field: {e}")
+    if not product["name"] or not product["category"]:
+        raise RecordError("product name and category are required")
+    if product["discounted_price"] > product["original_price"]:
+        raise RecordError("discounted price cannot be greater than original price")
+    if product["unit"] not in dict(Product.UNIT_CHOICES):
+        raise RecordError(f"unknown unit {product['unit']!r}")
+    return product
+
+
+def _init_image_worker():
+    # Each import worker is already one of N processes; don't nest encode pools
+    settings.IMAGE_ENCODE_WORKERS = 1
+
+
+def prepare_image(path, max_size, output_format, compression_level):
+    """Process one image file like the admin does. Runs in the process pool."""
+    with open(path, "rb") as f:
+        upload = io.BytesIO(f.read())
+    upload.content_type = CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), "image/jpeg")
+
+    mixin = ImageProcessingMixin()
+    processed, ext = mixin.process_image(upload, output_format=output_format, compression_level=compression_level, max_size=max_size)
+    renditions = [(width, fmt, buffer.getvalue()) for width, fmt, buffer in mixin.generate_renditions(upload, max_size=max_size)]
+    return processed.getvalue(), ext, renditions
+
+
+def upload_image(prepared):
+    """Upload an image and its renditions; returns the model's image fields."""
+    data, ext, renditions = prepared
+    google_id, uuid_val = upload_file_to_drive(io.BytesIO(data), ext=ext)
+    manifest = {}
+    for width, fmt, rendition in renditions:
+        rendition_id, _ = upload_file_to_drive(io.BytesIO(rendition), ext=fmt)
+        manifest.setdefault(fmt, {})[str(width)] = rendition_id
+    return {
+        "google_file_id": google_id,
+        "image_uuid": uuid_val,
+        "image_renditions": manifest,
+        "upload_status": "uploaded",
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Import categories and products from a CSV or JSONL file plus a directory of images. "
+        "Rows need a 'type' (category/product); products are matched on (category, name)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="Catalog .csv or .jsonl file.")
+        parser.add_argument("--images", default="", help="Directory the 'image' column is relative to.")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Rows written per bulk_create/bulk_update.")
+        parser.add_argument("--image-workers", type=int, default=os.cpu_count() or 1, help="Processes encoding images.")
+        parser.add_argument("--upload-concurrency", type=int, default=8, help="Drive uploads in flight at once.")
+        parser.add_argument("--format", default="webp", choices=["original", "jpg", "jpeg", "png", "webp"])
+        parser.add_argument("--compression", default="high", choices=["high", "auto", "medium", "low", "none"])
+        parser.add_argument("--checkpoint", default="", help="Progress file (default: <file>.checkpoint.json).")
+        parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint.")
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        self.options = options
+        self.checkpoint_path = options["checkpoint"] or f"{path}.checkpoint.json"
+
+        done, failed = (0, set()) if options["restart"] else self.load_checkpoint(path)
+        if done:
+            self.stdout.write(f"Resuming after record {done}")
+
+        self.categories = {}
+        self.stats = {"categories": 0, "products_created": 0, "products_updated": 0, "images": 0, "errors": 0}
+        # Numbers of records whose image failed, kept in the checkpoint and retried on resume
+        self.failed = set()
+
+        records = enumerate(read_records(path), start=1)
+        for _ in islice(records, done):
+            pass
+
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(options["image_workers"], mp_context=context, initializer=_init_image_worker) as image_pool, \
+                ThreadPoolExecutor(options["upload_concurrency"]) as upload_pool:
+            self.image_pool, self.upload_pool = image_pool, upload_pool
+            if failed:
+                self.stdout.write(f"Retrying {len(failed)} records whose images failed")
+                retry = [item for item in islice(enumerate(read_records(path), start=1), max(failed)) if item[0] in failed]
+                for start in range(0, len(retry), options["chunk_size"]):
+                    self.import_chunk(retry[start:start + options["chunk_size"]])
+                self.save_checkpoint(path, done)
+
+            while True:
+                chunk = list(islice(records, options["chunk_size"]))
+                if not chunk:
+                    break
+                self.import_chunk(chunk)
+                done = chunk[-1][0]
+                self.save_checkpoint(path, done)
+                self.stdout.write(f"{done} records imported ({self.stats})")
+
+        if self.failed:
+            self.stdout.write(self.style.WARNING(f"{len(self.failed)} records are missing their image; run again to retry them"))
+        self.stdout.write(self.style.SUCCESS(f"Import finished: {self.stats}"))
+
+    # Checkpoints --------------------------------------------------------------
+
+    def load_checkpoint(self, path):
+        """(records done, numbers of records whose image failed)"""
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return 0, set()
+        if checkpoint.get("file") != os.path.abspath(path):
+            raise CommandError(f"{self.checkpoint_path} belongs to {checkpoint.get('file')}; use --restart or --checkpoint")
+        return int(checkpoint.get("records_done", 0)), set(checkpoint.get("failed_images", []))
+
+    def save_checkpoint(self, path, done):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"file": os.path.abspath(path), "records_done": done, "failed_images": sorted(self.failed)}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # Import -------------------------------------------------------------------
+
+    def import_chunk(self, chunk):
+        """Import [(record number, record)]."""
+        category_rows, product_rows = {}, []
+        for number, record in chunk:
+            kind = str(record.get("type", "product")).strip().lower()
+            try:
+                if kind == "category":
+                    name = str(record.get("name", "")).strip()
+                    if not name:
+                        raise RecordError("category name is required")
+                    category_rows[name] = (number, record)
+                elif kind == "product":
+                    product_rows.append((parse_product(record), number, record))
+                else:
+                    raise RecordError(f"unknown type {kind!r}")
+            except RecordError as e:
+                self.stats["errors"] += 1
+                self.stderr.write(f"record {number}: {e}")
+
+        images = self.process_images(
+            [("category", name, number, record) for name, (number, record) in category_rows.items()]
+            + [("product", (product["category"], product["name"]), number, record) for product, number, record in product_rows]
+        )
+
+        # bulk_create/bulk_update skip post_save, so log the changes and
+        # invalidate the catalog cache and the carts holding these products here
+        with transaction.atomic():
+            category_ids = self.write_categories(category_rows, images)
+            product_ids = self.write_products(product_rows, images)
+            changes.record("category", category_ids)
+            changes.record("product", product_ids)
+        bump_catalog_version()
+        invalidate_product_carts(product_ids)
+
+    def process_images(self, items):
+        """
+        Encode (process pool) then upload (thread pool) every image in the
+        chunk. Records whose image fails are added to self.failed.
+        """
+        encoded, numbers = {}, {}
+        for kind, key, number, record in items:
+            filename = (record.get("image") or "").strip()
+            if not filename:
+                continue
+            image_path = os.path.join(self.options["images"], filename)
+            numbers[(kind, key)] = number
+            encoded[(kind, key)] = self.image_pool.submit(
+                prepare_image, image_path, IMAGE_MAX_SIZE[kind], self.options["format"], self.options["compression"]
+            )
+
+        uploads = {}
+        for item_key, future in encoded.items():
+            try:
+                uploads[item_key] = self.upload_pool.submit(upload_image, future.result())
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.failed.add(numbers[item_key])
+                self.stderr.write(f"image for {item_key[0]} {item_key[1]}: {e}")
+
+        images = {}
+        for item_key, future in uploads.items():
+            try:
+                images[item_key] = future.result()
+                self.stats["images"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.failed.add(numbers[item_key])
+                self.stderr.write(f"upload for {item_key[0]} {item_key[1]}: {e}")
+        return images
+
+    def write_categories(self, category_rows, images):
+        existing = Category.objects.in_bulk(list(category_rows), field_name="name")
+        to_create, to_update = [], []
+        for name in category_rows:
+            category = existing.get(name) or Category(name=name)
+            image = images.get(("category", name))
+            for field, value in (image or {}).items():
+                setattr(category, field, value)
+            if not category.pk:
+                to_create.append(category)
+            elif image:
+                to_update.append(category)
+            else:
+                self.categories[name] = category.pk
+
+        Category.objects.bulk_create(to_create, batch_size=self.options["chunk_size"])
+        Category.objects.bulk_update(to_update, IMAGE_FIELDS, batch_size=self.options["chunk_size"])
+        self.stats["categories"] += len(to_create) + len(to_update)
+        for category in to_create + to_update:
+            self.categories[category.name] = category.pk
+        return [category.pk for category in to_create + to_update]
+
+    def category_ids(self, names):
+        missing = [name for name in names if name not in self.categories]
+        if missing:
+            self.categories.update(Category.objects.filter(name__in=missing).values_list("name", "id"))
+        return self.categories
+
+    def write_products(self, product_rows, images):
+        category_ids = self.category_ids({product["category"] for product, _, _ in product_rows})
+
+        rows = []
+        for product, _, _ in product_rows:
+            if product["category"] not in category_ids:
+                self.stats["errors"] += 1
+                self.stderr.write(f"product {product['name']}: unknown category {product['category']!r}")
+                continue
+            rows.append(product)
+
+        existing = {
+            (p.category_id, p.name): p
+            for p in Product.objects.filter(
+                category_id__in={category_ids[row["category"]] for row in rows},
+                name__in={row["name"] for row in rows},
+            )
+        }
+
+        now = timezone.now()
+        to_create, to_update = {}, {}
+        for row in rows:
+            key = (category_ids[row["category"]], row["name"])
+            product = existing.get(key) or to_create.get(key) or Product(category_id=key[0], name=row["name"])
+            for field in PRODUCT_FIELDS:
+                setattr(product, field, row[field])
+            product.updated_at = now
+            for field, value in images.get(("product", (row["category"], row["name"])), {}).items():
+                setattr(product, field, value)
+            (to_update if product.pk else to_create)[key] = product
+
+        Product.objects.bulk_create(to_create.values(), batch_size=self.options["chunk_size"])
+        Product.objects.bulk_update(to_update.values(), PRODUCT_FIELDS + IMAGE_FIELDS + ["updated_at"], batch_size=self.options["chunk_size"])
+        self.stats["products_created"] += len(to_create)
+        self.stats["products_updated"] += len(to_update)
+        return [product.pk for product in [*to_create.values(), *to_update.values()]]
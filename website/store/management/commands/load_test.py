@@ -0,0 +1,123 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SERVER_COMMANDS = {
+    "wsgi": ["gunicorn", "website.wsgi:application"],
+    "asgi": ["gunicorn", "website.asgi:application", "-k", "uvicorn.workers.UvicornWorker"],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f"server exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"server did not start listening on {port}")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+async def run_load(base_url, paths, headers, concurrency, duration):
+    """Keep `concurrency` requests in flight for `duration` seconds; returns latencies and status counts."""
+    latencies, statuses = [], {}
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=30) as client:
+        async def user(n):
+            i = n
+            while time.monotonic() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        await asyncio.gather(*(user(n) for n in range(concurrency)))
+    return latencies, statuses
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test GET endpoints with many concurrent clients and report throughput and latency. "
+        "Use --serve wsgi asgi to start each server mode locally and compare them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", action="append", dest="paths", help="Path to request (repeatable). Default: /store/get_categories/")
+        parser.add_argument("--base-url", default="http://127.0.0.1:8001", help="Server to test when --serve is not given.")
+        parser.add_argument("--serve", nargs="+", choices=list(SERVER_COMMANDS), help="Start these server modes locally, one after another.")
+        parser.add_argument("--workers", type=int, default=3, help="Server workers for --serve (as in the dockerfile).")
+        parser.add_argument("--concurrency", type=int, default=100)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run.")
+        parser.add_argument("--header", action="append", default=[], help="Extra 'Name: value' header (repeatable).")
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or ["/store/get_categories/"]
+        headers = {}
+        for header in options["header"]:
+            name, _, value = header.partition(":")
+            headers[name.strip()] = value.strip()
+
+        if not options["serve"]:
+            self.report(options["base_url"], self.run(options["base_url"], paths, headers, options))
+            return
+
+        for mode in options["serve"]:
+            port = free_port()
+            command = SERVER_COMMANDS[mode] + ["--bind", f"127.0.0.1:{port}", f"--workers={options['workers']}"]
+            process = subprocess.Popen(
+                [sys.executable, "-m"] + command,
+                cwd=settings.BASE_DIR,
+                env=os.environ.copy(),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                wait_for_port(port, process)
+                self.report(mode, self.run(f"http://127.0.0.1:{port}", paths, headers, options))
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+    def run(self, base_url, paths, headers, options):
+        started = time.perf_counter()
+        latencies, statuses = asyncio.run(run_load(base_url, paths, headers, options["concurrency"], options["duration"]))
+        return latencies, statuses, time.perf_counter() - started
+
+    def report(self, label, result):
+        latencies, statuses, elapsed = result
+        latencies.sort()
+        ms = lambda pct: percentile(latencies, pct) * 1000
+        self.stdout.write(
+            f"{label}: {len(latencies)} requests in {elapsed:.1f}s = {len(latencies) / elapsed:.1f} req/s | "
+            f"p50 {ms(50):.1f}ms p95 {ms(95):.1f}ms p99 {ms(99):.1f}ms | status {statuses}"
+        )
@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from store.search import build_index, get_index_path, save_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product search index from the database and save it for the web workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="", help="Where to write the index (default: SEARCH_INDEX_PATH, or search-index.json in RUNTIME_DIR).")
+        parser.add_argument("--query", action="append", default=[], help="Time this query against the new index (repeatable).")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        index = build_index()
+        path = options["path"] or get_index_path()
+        save_index(index, path)
+        self.stdout.write(
+            f"Indexed {len(index)} products ({len(index.terms)} terms) at catalog version {index.version} "
+            f"in {time.perf_counter() - start:.2f}s -> {path}"
+        )
+
+        for query in options["query"]:
+            start = time.perf_counter()
+            total, products = index.page(query, 1, 5)
+            elapsed = (time.perf_counter() - start) * 1000
+            names = ", ".join(p["name"] for p in products)
+            self.stdout.write(f"{query!r}: {total} results in {elapsed:.3f}ms: {names}")
@@ -0,0 +1,64 @@
+import multiprocessing
+import signal
+import time
+from django import db
+from django.core.management.base import BaseCommand
+from store.upload_queue import claim_next_job, run_job
+from store.utils.google_drive import get_drive_metrics
+
+
+class Command(BaseCommand):
+    help = "Process queued Drive uploads from the store admin."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1, help="Worker processes to run side by side.")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty instead of polling.")
+
+    def handle(self, *args, **options):
+        if options["processes"] <= 1:
+            self.work(options["poll_interval"], options["once"])
+            return
+
+        # Children must not share the parent's database connection
+        db.connections.close_all()
+        context = multiprocessing.get_context("fork")
+        workers = [
+            context.Process(target=self.work, args=(options["poll_interval"], options["once"]))
+            for _ in range(options["processes"])
+        ]
+        for worker in workers:
+            worker.start()
+
+        def stop(signum, frame):
+            # Each child finishes its current job, then exits
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+        previous = {signum: signal.signal(signum, stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            for worker in workers:
+                worker.join()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+    def work(self, poll_interval, once):
+        stopping = []
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stopping.append(True))
+
+        while not stopping:
+            job = claim_next_job()
+            if job is None:
+                if once:
+                    break
+                db.close_old_connections()
+                time.sleep(poll_interval)
+                continue
+
+            ok = run_job(job)
+            self.stdout.write(f"{'done' if ok else 'retry/failed'}: {job}")
+
+        self.stdout.write(f"Drive metrics: {get_drive_metrics()}")
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:37
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_banner_image_renditions_category_image_renditions_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='banner',
+            name='upload_status',
+            field=models.CharField(blank=True, choices=[('', 'No upload'), ('pending', 'Pending'), ('uploaded', 'Uploaded'), ('failed', 'Failed')], default='', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='upload_status',
+            field=models.CharField(blank=True, choices=[('', 'No upload'), ('pending', 'Pending'), ('uploaded', 'Uploaded'), ('failed', 'Failed')], default='', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='upload_status',
+            field=models.CharField(blank=True, choices=[('', 'No upload'), ('pending', 'Pending'), ('uploaded', 'Uploaded'), ('failed', 'Failed')], default='', editable=False, max_length=10),
+        ),
+        migrations.CreateModel(
+            name='DriveUploadJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_model', models.CharField(choices=[('category', 'Category'), ('product', 'Product'), ('banner', 'Banner')], max_length=20)),
+                ('target_id', models.PositiveBigIntegerField()),
+                ('batch', models.UUIDField(default=uuid.uuid4)),
+                ('kind', models.CharField(choices=[('image', 'Image'), ('rendition', 'Rendition')], default='image', max_length=10)),
+                ('rendition_format', models.CharField(blank=True, default='', max_length=10)),
+                ('rendition_width', models.PositiveIntegerField(blank=True, null=True)),
+                ('ext', models.CharField(max_length=10)),
+                ('payload', models.BinaryField()),
+                ('google_file_id', models.CharField(blank=True, default='', max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='idx_upload_job_due'), models.Index(fields=['target_model', 'target_id'], name='idx_upload_job_target')],
+            },
+        ),
+    ]
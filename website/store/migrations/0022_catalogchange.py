@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def log_existing_objects(apps, schema_editor):
+    """Seed the change log so that since=0 returns the whole catalog."""
+    CatalogChange = apps.get_model("store", "CatalogChange")
+    for kind, model in (("category", "Category"), ("product", "Product"), ("banner", "Banner")):
+        ids = apps.get_model("store", model).objects.values_list("id", flat=True).iterator()
+        CatalogChange.objects.bulk_create((CatalogChange(kind=kind, object_id=pk) for pk in ids), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_banner_upload_status_category_upload_status_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('category', 'Category'), ('product', 'Product'), ('banner', 'Banner')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['kind', 'object_id'], name='idx_catalog_change_object')],
+            },
+        ),
+        migrations.RunPython(log_existing_objects, migrations.RunPython.noop),
+    ]
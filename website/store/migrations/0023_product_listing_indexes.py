@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:02
+
+import django.db.models.expressions
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_catalogchange'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.F('category'), django.db.models.functions.text.Lower('name'), models.F('id'), condition=models.Q(('is_active', True)), name='idx_product_cat_name'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.F('category'), models.OrderBy(models.F('created_at'), descending=True), models.OrderBy(models.F('id'), descending=True), condition=models.Q(('is_active', True)), name='idx_product_cat_newest'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.F('category'), models.F('discounted_price'), models.F('id'), condition=models.Q(('is_active', True)), name='idx_product_cat_price'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.F('category'), models.OrderBy(models.Case(models.When(original_price=0, then=models.Value(0)), default=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('original_price'), '-', models.F('discounted_price')), '*', models.Value(100)), '/', models.F('original_price')), output_field=models.IntegerField()), descending=True), models.OrderBy(models.F('id'), descending=True), condition=models.Q(('is_active', True)), name='idx_product_cat_discount'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.OrderBy(models.Case(models.When(original_price=0, then=models.Value(0)), default=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('original_price'), '-', models.F('discounted_price')), '*', models.Value(100)), '/', models.F('original_price')), output_field=models.IntegerField()), descending=True), models.OrderBy(models.F('id'), descending=True), condition=models.Q(('is_active', True)), name='idx_product_discount'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:36
+
+from django.db import migrations, models
+
+
+def keep_existing_versions(apps, schema_editor):
+    # Clients hold ids as their `since`: existing rows keep them as positions
+    CatalogChange = apps.get_model("store", "CatalogChange")
+    CatalogChange.objects.update(position=models.F("id"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogchange',
+            name='position',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(keep_existing_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0024_catalogchange_position'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='driveuploadjob',
+            name='kind',
+            field=models.CharField(choices=[('image', 'Image'), ('rendition', 'Rendition'), ('source', 'Rendition source')], default='image', max_length=10),
+        ),
+    ]
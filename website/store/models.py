@@ -1,12 +1,37 @@
 from django.db import models
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Lower
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 import uuid
 
+UPLOAD_STATUS_CHOICES = [
+    ("", "No upload"),
+    ("pending", "Pending"),
+    ("uploaded", "Uploaded"),
+    ("failed", "Failed"),
+]
+
+
+def discount_percent():
+    """
+    Whole-percent discount as a SQL expression. Listings sort by it and
+    Product has an index on it; both must use this same expression.
+    """
+    return Case(
+        When(original_price=0, then=Value(0)),
+        default=(F("original_price") - F("discounted_price")) * 100 / F("original_price"),
+        output_field=IntegerField(),
+    )
+
 
 class Category(models.Model):
     name = models.CharField(max_length=1000, unique=True)
     image_uuid = models.UUIDField(default=uuid.uuid4, editable=False)
     google_file_id = models.CharField(max_length=255, blank=True, default="")
+    # Drive file ids of the pre-encoded widths, see store.forms.RENDITION_WIDTHS
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    upload_status = models.CharField(max_length=10, choices=UPLOAD_STATUS_CHOICES, blank=True, default="", editable=False)
 
     def __str__(self):
         return self.name
@@ -34,11 +59,25 @@ class Product(models.Model):
 
     image_uuid = models.UUIDField(default=uuid.uuid4, editable=False)
     google_file_id = models.CharField(max_length=255, blank=True, default="")
+    # Drive file ids of the pre-encoded widths, see store.forms.RENDITION_WIDTHS
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    upload_status = models.CharField(max_length=10, choices=UPLOAD_STATUS_CHOICES, blank=True, default="", editable=False)
 
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Partial indexes over active products, one per listing sort
+        # (store.pagination.SORTS) within a category, plus best deals overall
+        indexes = [
+            models.Index(F("category"), Lower("name"), F("id"), name="idx_product_cat_name", condition=Q(is_active=True)),
+            models.Index(F("category"), F("created_at").desc(), F("id").desc(), name="idx_product_cat_newest", condition=Q(is_active=True)),
+            models.Index(F("category"), F("discounted_price"), F("id"), name="idx_product_cat_price", condition=Q(is_active=True)),
+            models.Index(F("category"), discount_percent().desc(), F("id").desc(), name="idx_product_cat_discount", condition=Q(is_active=True)),
+            models.Index(discount_percent().desc(), F("id").desc(), name="idx_product_discount", condition=Q(is_active=True)),
+        ]
+
     def discount_percentage(self):
         if self.original_price > 0:
             return round(((self.original_price - self.discounted_price) / self.original_price) * 100, 2)
@@ -65,10 +104,100 @@ class Banner(models.Model):
 
     image_uuid = models.UUIDField(default=uuid.uuid4, editable=False)
     google_file_id = models.CharField(max_length=255, blank=True, default="")
+    # Drive file ids of the pre-encoded widths, see store.forms.RENDITION_WIDTHS
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    upload_status = models.CharField(max_length=10, choices=UPLOAD_STATUS_CHOICES, blank=True, default="", editable=False)
 
     search_query = models.CharField(max_length=2000)
 
     is_active = models.BooleanField(default=True)
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+
+class CatalogChange(models.Model):
+    """
+    A Category, Product or Banner that was saved or deleted. The position,
+    given once the row has committed (changes.publish), orders the change
+    feed (store/changes/): clients pass the last position they saw as
+    `since`. Only the latest change per object is kept.
+    """
+    KIND_CHOICES = [
+        ("category", "Category"),
+        ("product", "Product"),
+        ("banner", "Banner"),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    changed_at = models.DateTimeField(default=timezone.now)
+    position = models.PositiveBigIntegerField(null=True, blank=True, unique=True, editable=False)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["kind", "object_id"], name="idx_catalog_change_object"),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.kind} {self.object_id}"
+
+
+class DriveUploadJob(models.Model):
+    """
+    One file waiting to be uploaded to Drive for a Category, Product or Banner.
+
+    All files of one admin upload (the image and its renditions) share a batch
+    id, which becomes the target's image_uuid once every job of the batch is done.
+    A "source" job holds the uploaded file until the worker encodes the renditions.
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+    TARGET_CHOICES = [
+        ("category", "Category"),
+        ("product", "Product"),
+        ("banner", "Banner"),
+    ]
+    KIND_CHOICES = [
+        ("image", "Image"),
+        ("rendition", "Rendition"),
+        # The uploaded file, encoded into rendition jobs by the worker
+        ("source", "Rendition source"),
+    ]
+
+    target_model = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    target_id = models.PositiveBigIntegerField()
+    batch = models.UUIDField(default=uuid.uuid4)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default="image")
+    rendition_format = models.CharField(max_length=10, blank=True, default="")
+    rendition_width = models.PositiveIntegerField(null=True, blank=True)
+
+    ext = models.CharField(max_length=10)
+    payload = models.BinaryField()
+    # Set as soon as the upload succeeds, so a retry only repeats the permission grant
+    google_file_id = models.CharField(max_length=255, blank=True, default="")
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    # When a pending job may run next; for a running job, when its lease expires
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="idx_upload_job_due"),
+            models.Index(fields=["target_model", "target_id"], name="idx_upload_job_target"),
+        ]
+
+    def __str__(self):
+        label = f"{self.kind} {self.rendition_format}{self.rendition_width or ''}".strip()
+        return f"{self.target_model} #{self.target_id} {label} ({self.status})"
@@ -0,0 +1,140 @@
+"""
+Keyset (cursor) pagination for product listings.
+
+A page is the first `page_size` products after the cursor in (sort key, id)
+order, so every page costs the same index range scan no matter how deep it
+is. Cursors are opaque to clients: base64 of the sort name and the last
+row's (sort key, id).
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from django.db.models import Q
+from django.db.models.functions import Lower
+from .models import Product, discount_percent
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# sort name -> (field or annotation, descending)
+SORTS = {
+    "name": ("sort_name", False),
+    "newest": ("created_at", True),
+    "price": ("discounted_price", False),
+    "discount": ("discount", True),
+}
+DEFAULT_SORT = "name"
+
+PRODUCT_FIELDS = [
+    "id", "name", "description", "original_price", "discounted_price", "discount", "unit",
+    "quantity", "stock", "image_uuid", "google_file_id", "category_id", "category__name",
+]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def parse_page_size(value):
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    page_size = int(value)
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    return page_size
+
+
+def parse_bool(value, default=True):
+    if value in (None, ""):
+        return default
+    return value.strip().lower() not in ("0", "false", "no")
+
+
+def product_queryset():
+    """Active products with the annotations the sorts and filters use."""
+    return (
+        Product.objects.filter(is_active=True)
+        .annotate(
+            sort_name=Lower("name"),
+            # Computed in SQL so cursors compare exactly (and the index matches)
+            discount=discount_percent(),
+        )
+    )
+
+
+def encode_cursor(sort, row):
+    field, _ = SORTS[sort]
+    key = row[field]
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    payload = json.dumps({"s": sort, "k": [key, row["id"]]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    """The (sort key, id) a cursor points after, or None for the first page."""
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        key, last_id = payload["k"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if payload.get("s") != sort:
+        raise InvalidCursor("Cursor was issued for a different sort")
+    if SORTS[sort][0] == "created_at":
+        try:
+            key = datetime.fromisoformat(key)
+        except (ValueError, TypeError):
+            raise InvalidCursor("Invalid cursor")
+    return key, last_id
+
+
+def after(queryset, sort, position):
+    field, descending = SORTS[sort]
+    queryset = queryset.order_by(f"-{field}", "-id") if descending else queryset.order_by(field, "id")
+    if position is None:
+        return queryset
+    key, last_id = position
+    # The plain bound on the sort key is redundant, but it is what lets the
+    # planner start an index range scan at the cursor instead of filtering
+    # the whole category and sorting it
+    if descending:
+        return queryset.filter(**{f"{field}__lte": key}).filter(Q(**{f"{field}__lt": key}) | Q(**{field: key, "id__lt": last_id}))
+    return queryset.filter(**{f"{field}__gte": key}).filter(Q(**{f"{field}__gt": key}) | Q(**{field: key, "id__gt": last_id}))
+
+
+def serialize(row):
+    product = {k: v for k, v in row.items() if k not in ("category__name", "sort_name")}
+    product["category_name"] = row["category__name"]
+    product["image_uuid"] = str(row["image_uuid"])
+    product["quantity"] = float(row["quantity"])
+    return product
+
+
+async def keyset_page(queryset, sort, cursor, page_size, include_total=False):
+    """One page of products after `cursor`, in the shape the listing views return."""
+    if sort not in SORTS:
+        raise InvalidCursor(f"sort must be one of {', '.join(SORTS)}")
+    position = decode_cursor(cursor, sort)
+
+    fields = PRODUCT_FIELDS + ([SORTS[sort][0]] if SORTS[sort][0] not in PRODUCT_FIELDS else [])
+    # One extra row tells whether there is a next page without counting
+    rows = [row async for row in after(queryset, sort, position).values(*fields)[:page_size + 1]]
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    page = {
+        "status": "success",
+        "page_size": page_size,
+        "sort": sort,
+        "products": [serialize(row) for row in rows],
+        "next_cursor": encode_cursor(sort, rows[-1]) if has_more else None,
+        "has_more": has_more,
+    }
+    if include_total:
+        total_count = await queryset.acount()
+        page["total_count"] = total_count
+        page["total_pages"] = (total_count + page_size - 1) // page_size
+    return page
@@ -0,0 +1,380 @@
+"""
+In-process product search.
+
+SearchIndex is an inverted index over product name, category name and
+description (weighted in that order) with BM25 ranking. Each query word
+matches its exact term, terms it is a prefix of and, when neither exists,
+terms sharing enough trigrams with it or within one or two edits (typos).
+Every word has to match.
+
+Each worker holds one index tagged with the catalog version it was built
+at. Product/category saves in this process update it in place (signals.py);
+changes made elsewhere bump the catalog version, which makes the index stale:
+search_products then falls back to an unranked database match while a
+background thread reloads the index from SEARCH_INDEX_PATH or, failing that,
+rebuilds it from the database and saves it there for the other workers. Only
+the worker holding BUILD_LOCK_KEY in the shared cache builds; the others wait
+for the file it saves. The file is plain JSON (products and their weighted terms), so loading it never
+runs code, and by default it lives in the private RUNTIME_DIR.
+"""
+import bisect
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from website.responses import dumps
+from website.runtime import private_dir
+from .cache import get_catalog_version
+from .pagination import PRODUCT_FIELDS, product_queryset, serialize
+
+logger = logging.getLogger(__name__)
+
+FIELD_WEIGHTS = {"name": 3.0, "category_name": 2.0, "description": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_WEIGHT = 0.7
+FUZZY_WEIGHT = 0.5
+FUZZY_MIN_SIMILARITY = 0.3
+MAX_EXPANSIONS = 20
+
+TOKEN_RE = re.compile(r"\w+")
+
+BUILD_LOCK_KEY = "store:search:build:lock"
+# Seconds a build may hold the lock, and other workers wait for its file
+BUILD_LOCK_TIMEOUT = 5 * 60
+BUILD_WAIT = 60
+
+
+def get_index_path():
+    path = getattr(settings, "SEARCH_INDEX_PATH", "")
+    return path or os.path.join(private_dir(settings.RUNTIME_DIR), "search-index.json")
+
+
+def tokenize(text):
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return TOKEN_RE.findall(text)
+
+
+def edit_distance(a, b):
+    """Levenshtein distance counting an adjacent transposition as one edit."""
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (a[i - 1] != b[j - 1]),
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    def __init__(self, version=None):
+        self.version = version
+        self.docs = {}                       # product id -> serialized product
+        self.doc_terms = {}                  # product id -> {term: weighted tf}
+        self.doc_lengths = {}                # product id -> weighted length
+        self.total_length = 0.0
+        self.postings = defaultdict(dict)    # term -> {product id: weighted tf}
+        self.terms = []                      # sorted, for prefix lookups
+        self.term_trigrams = defaultdict(set)  # trigram -> terms
+
+    def __len__(self):
+        return len(self.docs)
+
+    # Updates ------------------------------------------------------------------
+
+    def add(self, product, keep_sorted=True):
+        """
+        Index a serialized product, replacing any previous version of it. Bulk
+        loads pass keep_sorted=False and call finish() once at the end.
+        """
+        self.remove(product["id"])
+        weighted = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(product.get(field)):
+                weighted[term] += weight
+        self.insert(product, weighted, keep_sorted)
+
+    def insert(self, product, weighted, keep_sorted=True):
+        """Index a product (not yet in the index) under its {term: weighted tf}."""
+        doc_id = product["id"]
+        self.docs[doc_id] = product
+        self.doc_terms[doc_id] = dict(weighted)
+        self.doc_lengths[doc_id] = sum(weighted.values())
+        self.total_length += self.doc_lengths[doc_id]
+        for term, tf in weighted.items():
+            if term not in self.postings:
+                if keep_sorted:
+                    bisect.insort(self.terms, term)
+                else:
+                    self.terms.append(term)
+                for gram in trigrams(term):
+                    self.term_trigrams[gram].add(term)
+            self.postings[term][doc_id] = tf
+
+    def finish(self):
+        self.terms.sort()
+
+    def to_data(self):
+        """The index as plain JSON-serializable data; the lookup tables are rebuilt on load."""
+        return {"version": self.version, "docs": [[self.docs[doc_id], terms] for doc_id, terms in self.doc_terms.items()]}
+
+    @classmethod
+    def from_data(cls, data):
+        index = cls(data["version"])
+        for product, terms in data["docs"]:
+            index.insert(product, terms, keep_sorted=False)
+        index.finish()
+        return index
+
+    def remove(self, doc_id):
+        if doc_id not in self.docs:
+            return
+        del self.docs[doc_id]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for term in self.doc_terms.pop(doc_id):
+            postings = self.postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+                for gram in trigrams(term):
+                    self.term_trigrams[gram].discard(term)
+
+    # Queries ------------------------------------------------------------------
+
+    def expand(self, word):
+        """[(term, weight)] that a query word matches."""
+        matches = {}
+        if word in self.postings:
+            matches[word] = 1.0
+        start = bisect.bisect_left(self.terms, word)
+        for term in self.terms[start:start + MAX_EXPANSIONS + 1]:
+            if not term.startswith(word):
+                break
+            matches.setdefault(term, PREFIX_WEIGHT)
+        if matches or len(word) < 3:
+            return list(matches.items())
+
+        word_grams = trigrams(word)
+        shared = defaultdict(int)
+        for gram in word_grams:
+            for term in self.term_trigrams.get(gram, ()):
+                shared[term] += 1
+        similar = []
+        max_edits = 1 if len(word) <= 5 else 2
+        for term, count in shared.items():
+            similarity = count / (len(word_grams) + len(trigrams(term)) - count)
+            # Trigrams miss short-word transpositions ("mnago"), edit distance catches them
+            if similarity < FUZZY_MIN_SIMILARITY and count >= 2 and abs(len(term) - len(word)) <= max_edits:
+                distance = edit_distance(word, term)
+                if distance <= max_edits:
+                    similarity = max(similarity, 1 - distance / len(word))
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                similar.append((similarity, term))
+        similar.sort(reverse=True)
+        return [(term, FUZZY_WEIGHT * similarity) for similarity, term in similar[:MAX_EXPANSIONS]]
+
+    def search(self, query, min_discount=None):
+        """Ids of matching products, best first."""
+        words = tokenize(query)
+        if not words or not self.docs:
+            return []
+        n = len(self.docs)
+        avg_length = self.total_length / n
+
+        scores = None
+        for word in words:
+            word_scores = {}
+            for term, weight in self.expand(word):
+                postings = self.postings[term]
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / avg_length)
+                    score = weight * idf * tf * (BM25_K1 + 1) / norm
+                    # A word counts once per product, through its best matching term
+                    if score > word_scores.get(doc_id, 0):
+                        word_scores[doc_id] = score
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {doc_id: score + word_scores[doc_id] for doc_id, score in scores.items() if doc_id in word_scores}
+            if not scores:
+                return []
+
+        if min_discount is not None:
+            scores = {doc_id: score for doc_id, score in scores.items() if self.docs[doc_id]["discount"] >= min_discount}
+        return sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+
+    def page(self, query, page, page_size, min_discount=None):
+        """(total_count, products) for one page of results."""
+        ids = self.search(query, min_discount)
+        start = (page - 1) * page_size
+        return len(ids), [self.docs[doc_id] for doc_id in ids[start:start + page_size]]
+
+
+# Worker-wide index ------------------------------------------------------------
+
+_index = None
+_lock = threading.Lock()
+_refreshing = threading.Event()
+
+
+def build_index():
+    """A fresh index of every active product, tagged with the current catalog version."""
+    # Read the version first: a change committed while rows load makes it stale
+    index = SearchIndex(get_catalog_version())
+    for row in product_queryset().values(*PRODUCT_FIELDS).iterator(chunk_size=2000):
+        index.add(serialize(row), keep_sorted=False)
+    index.finish()
+    return index
+
+
+def save_index(index, path=None):
+    path = path or get_index_path()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(dumps(index.to_data()))
+    os.replace(tmp_path, path)
+
+
+def load_index(path=None):
+    try:
+        with open(path or get_index_path(), "rb") as f:
+            return SearchIndex.from_data(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def database_matches(query, min_discount=None):
+    """
+    Active products matching every word of `query` in their name, description
+    or category, unranked. Used for cursor pages and while the index loads.
+    """
+    products = product_queryset()
+    for term in query.split():
+        products = products.filter(
+            Q(name__icontains=term) | Q(description__icontains=term) | Q(category__name__icontains=term)
+        )
+    if min_discount is not None:
+        products = products.filter(discount__gte=min_discount)
+    return products
+
+
+def wait_for_saved_index(version):
+    """Wait for the worker holding the build lock to save its index; None if it never does."""
+    # Watches the file rather than the lock, which this worker's local cache may hold on to
+    path = get_index_path()
+    deadline = time.monotonic() + BUILD_WAIT
+    seen = None
+    while time.monotonic() < deadline:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if mtime != seen:
+            seen = mtime
+            index = load_index(path)
+            if index is not None and index.version == version:
+                return index
+        time.sleep(0.2)
+    return None
+
+
+def refresh_index():
+    """Swap in an index for the current catalog version, from disk if possible."""
+    global _index
+    try:
+        version = get_catalog_version()
+        index = load_index()
+        if index is None or index.version != version:
+            if cache.add(BUILD_LOCK_KEY, os.getpid(), timeout=BUILD_LOCK_TIMEOUT):
+                try:
+                    index = build_index()
+                    save_index(index)
+                finally:
+                    cache.delete(BUILD_LOCK_KEY)
+            else:
+                # Another worker is building it; if it fails, build it here
+                index = wait_for_saved_index(version)
+                if index is None:
+                    index = build_index()
+                    save_index(index)
+        with _lock:
+            _index = index
+        logger.info("Search index ready: %s products, catalog version %s", len(index), index.version)
+    except Exception:
+        logger.exception("Search index refresh failed")
+    finally:
+        connection.close()
+        _refreshing.clear()
+
+
+def get_fresh_index(version):
+    """The index if it matches catalog `version`; otherwise None, and a refresh is started."""
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    if not _refreshing.is_set():
+        _refreshing.set()
+        threading.Thread(target=refresh_index, name="search-index-refresh", daemon=True).start()
+    return None
+
+
+def search_page(index, query, page, page_size, min_discount=None):
+    """
+    One page of ranked results. CPU-bound: async views call it through
+    sync_to_async(thread_sensitive=False), off the event loop.
+    """
+    # Held briefly so a concurrent apply_change() never mutates mid-query
+    with _lock:
+        return index.page(query, page, page_size, min_discount)
+
+
+def apply_change(product_ids=(), category_id=None, old_version=None, new_version=None):
+    """
+    Re-index products changed in this process after their commit. The index
+    only moves to new_version if it was at old_version, i.e. nothing else
+    changed the catalog in between; otherwise it stays stale and is rebuilt.
+    """
+    index = _index
+    if index is None:
+        return
+    queryset = product_queryset().values(*PRODUCT_FIELDS)
+    if category_id is not None:
+        queryset = queryset.filter(category_id=category_id)
+    else:
+        queryset = queryset.filter(id__in=product_ids)
+    rows = {row["id"]: serialize(row) for row in queryset}
+
+    with _lock:
+        if category_id is not None:
+            stale_ids = [doc_id for doc_id, doc in index.docs.items() if doc["category_id"] == category_id]
+        else:
+            stale_ids = list(product_ids)
+        for doc_id in stale_ids:
+            index.remove(doc_id)
+        for product in rows.values():
+            index.add(product)
+        if index.version == old_version:
+            index.version = new_version
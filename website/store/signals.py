@@ -0,0 +1,36 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Category, Product, Banner
+from .cache import bump_catalog_version
+from . import autocomplete, changes, home_feed, search
+
+# Saved by the upload worker as a job moves along; no catalog payload shows it
+UNSERVED_FIELDS = {"upload_status"}
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+def invalidate_catalog_cache(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= UNSERVED_FIELDS:
+        return
+    # pk is cleared on delete before on_commit callbacks run
+    changed = {"product_ids": [instance.pk]} if sender is Product else {}
+    if sender is Category:
+        changed = {"category_id": instance.pk}
+    # Logged in the saving transaction, so the change feed can't miss a commit
+    changes.record(sender._meta.model_name, [instance.pk])
+
+    def on_commit():
+        # Bump only once the admin transaction commits, otherwise a concurrent
+        # request could re-cache the old rows under the new version.
+        version = bump_catalog_version()
+        search.apply_change(old_version=version - 1, new_version=version, **changed)
+        autocomplete.apply_change(old_version=version - 1, new_version=version, **changed)
+        home_feed.rebuild_in_background()
+
+    transaction.on_commit(on_commit)
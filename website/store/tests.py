@@ -1,3 +1,836 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import pickle
+import random
+import signal
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+from PIL import Image
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from website.tests import CacheIsolationMixin
+from . import autocomplete, changes, home_feed, image_cache, search
+from .cache import bump_catalog_version, get_catalog_version
+from .decorators import catalog_cached
+from .forms import ImageProcessingMixin
+from .models import Banner, CatalogChange, Category, DriveUploadJob, Product
+from .pagination import SORTS, after, decode_cursor, encode_cursor, product_queryset
+from .upload_queue import admin_update_fields, claim_next_job, enqueue_image_upload, retry_jobs, run_job
+from .utils import image_encoding
+from .utils.image_encoding import QUALITY_RANGE, compress_to_fit, encode, encode_params, get_worker_count
+from .views import pick_rendition
 
-# Create your tests here.
+
+def analyze(*models):
+    """Refresh planner statistics for rows inserted by the test (autovacuum never sees them)."""
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+
+@skipUnless(connection.vendor == "postgresql", "query plans are checked on PostgreSQL only")
+class ProductIndexPlanTests(TestCase):
+    """
+    The listing queries (RPC equivalents) must be answered from their partial
+    indexes, with the planner's default settings and statistics for a
+    catalog-sized table.
+    """
+    CATEGORIES = 25
+    PRODUCTS_PER_CATEGORY = 800
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create(Category(name=f"Category {i}") for i in range(cls.CATEGORIES))
+        cls.category = categories[0]
+        # Interleaved like a real catalog, where a category's rows are spread over the table
+        Product.objects.bulk_create(
+            (
+                Product(
+                    category=category,
+                    name=f"Product {i:05d}",
+                    original_price=100 + i % 400,
+                    discounted_price=100 + i % 400 - (i * 7) % 60,
+                    stock=i % 50,
+                    is_active=i % 5 != 0,
+                )
+                for i in range(cls.PRODUCTS_PER_CATEGORY)
+                for category in categories
+            ),
+            batch_size=2000,
+        )
+        analyze(Category, Product)
+
+    def assertUsesIndex(self, queryset, index_name, from_cursor=False):
+        plan = queryset.explain()
+        self.assertIn(f"using {index_name} on", plan)
+        self.assertNotIn("Sort", plan)
+        if from_cursor:
+            # The scan starts at the cursor rather than at the start of the category
+            index_cond = next(line for line in plan.splitlines() if "Index Cond" in line)
+            self.assertRegex(index_cond, "[<>]=")
+
+    def test_category_listing_sorts(self):
+        indexes = {
+            "name": "idx_product_cat_name",
+            "newest": "idx_product_cat_newest",
+            "price": "idx_product_cat_price",
+            "discount": "idx_product_cat_discount",
+        }
+        self.assertEqual(set(indexes), set(SORTS))
+        for sort, index_name in indexes.items():
+            products = product_queryset().filter(category_id=self.category.pk)
+            field = SORTS[sort][0]
+            deep_row = after(products, sort, None).values(field, "id")[200]
+            for position in (None, (deep_row[field], deep_row["id"])):
+                with self.subTest(sort=sort, page="first" if position is None else "deep"):
+                    self.assertUsesIndex(after(products, sort, position).values("id")[:20], index_name, from_cursor=position is not None)
+
+    def test_best_deals(self):
+        self.assertUsesIndex(product_queryset().order_by("-discount", "-id").values("id")[:20], "idx_product_discount")
+
+
+class UploadQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Fruits")
+
+    def test_admin_save_keeps_worker_fields(self):
+        product = Product.objects.create(category=self.category, name="Mango", original_price=100, discounted_price=90)
+        # finish_batch applies an upload while the admin form is open
+        Product.objects.filter(pk=product.pk).update(google_file_id="drive-id", upload_status="uploaded")
+        product.name = "Alphonso Mango"
+        product.save(update_fields=admin_update_fields(product, changed_data=["name"]))
+
+        product.refresh_from_db()
+        self.assertEqual((product.name, product.google_file_id, product.upload_status), ("Alphonso Mango", "drive-id", "uploaded"))
+
+    def test_admin_save_writes_changed_worker_fields(self):
+        self.assertIn("google_file_id", admin_update_fields(Product(), changed_data=["google_file_id"]))
+        self.assertNotIn("image_renditions", admin_update_fields(Product(), changed_data=["google_file_id"]))
+
+    def test_worker_encodes_the_renditions(self):
+        product = Product.objects.create(category=self.category, name="Mango", original_price=100, discounted_price=90)
+        source = io.BytesIO()
+        Image.new("RGB", (500, 300), "orange").save(source, format="PNG")
+        enqueue_image_upload(product, io.BytesIO(b"processed"), "jpg", source=source)
+        self.assertEqual(list(DriveUploadJob.objects.values_list("kind", flat=True).order_by("id")), ["image", "source"])
+
+        uploads = iter(range(1000))
+        with mock.patch("store.upload_queue.upload_file_to_drive", side_effect=lambda *args, **kwargs: (f"drive-{next(uploads)}", None)), \
+                mock.patch("store.upload_queue.grant_public_read"):
+            while (job := claim_next_job()) is not None:
+                self.assertTrue(run_job(job))
+
+        product.refresh_from_db()
+        self.assertEqual(product.upload_status, "uploaded")
+        for fmt in ("webp", "jpeg"):
+            self.assertEqual(sorted(product.image_renditions[fmt], key=int), ["100", "200", "400", "500"])
+        self.assertEqual(DriveUploadJob.objects.filter(kind="rendition").count(), 8)
+        self.assertFalse(DriveUploadJob.objects.exclude(payload=b"").exists())
+
+    def test_retry_skips_running_and_done_jobs(self):
+        jobs = {
+            status: DriveUploadJob.objects.create(target_model="category", target_id=self.category.pk, ext="jpg", payload=b"x", status=status, attempts=3)
+            for status in ("pending", "running", "done", "failed")
+        }
+        self.assertEqual(retry_jobs(DriveUploadJob.objects.all()), 2)
+        for status, job in jobs.items():
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, 0 if status in ("pending", "failed") else 3, status)
+
+
+class RenditionTests(SimpleTestCase):
+    def renditions(self, size, mode="RGB", max_size=(1200, 1200)):
+        upload = io.BytesIO()
+        Image.new(mode, size, (255, 165, 0, 128) if mode == "RGBA" else "orange").save(upload, format="PNG")
+        return [
+            (width, fmt, Image.open(buffer)) for width, fmt, buffer in ImageProcessingMixin().generate_renditions(upload, max_size=max_size)
+        ]
+
+    def test_ladder(self):
+        renditions = self.renditions((1000, 500))
+        self.assertEqual([(width, fmt) for width, fmt, _ in renditions], [
+            (1000, "webp"), (1000, "jpeg"), (800, "webp"), (800, "jpeg"), (400, "webp"), (400, "jpeg"),
+            (200, "webp"), (200, "jpeg"), (100, "webp"), (100, "jpeg"),
+        ])
+        for width, fmt, image in renditions:
+            self.assertEqual((image.format.lower(), image.size), (fmt, (width, width // 2)))
+
+    def test_large_images_stop_at_the_bounding_box(self):
+        widths = {width for width, _, _ in self.renditions((2400, 1200))}
+        self.assertEqual(max(widths), 1200)
+        widths = {width for width, _, _ in self.renditions((1600, 600), max_size=(1600, 600))}
+        self.assertEqual(max(widths), 1200)
+
+    def test_transparency_is_kept_in_webp_only(self):
+        renditions = self.renditions((150, 150), mode="RGBA")
+        self.assertEqual({(fmt, image.mode) for _, fmt, image in renditions}, {("webp", "RGBA"), ("jpeg", "RGB")})
+
+    def test_pick_rendition(self):
+        renditions = {"webp": {"100": "w100", "400": "w400", "800": "w800"}, "jpeg": {"400": "j400"}}
+        self.assertEqual(pick_rendition(renditions, "webp", 100), ("w100", 100))
+        # Snapped up to the next width, never down
+        self.assertEqual(pick_rendition(renditions, "webp", 101), ("w400", 400))
+        self.assertEqual(pick_rendition(renditions, "webp", 400), ("w400", 400))
+        # Wider than any: the largest there is
+        self.assertEqual(pick_rendition(renditions, "webp", 2000), ("w800", 800))
+        self.assertEqual(pick_rendition(renditions, "jpeg", 100), ("j400", 400))
+        self.assertEqual(pick_rendition({"webp": renditions["webp"]}, "jpeg", 100), (None, None))
+        self.assertEqual(pick_rendition({}, "webp", 100), (None, None))
+
+
+class CompressToFitTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.image = Image.frombytes("RGB", (120, 90), bytes(random.Random(4).randrange(256) for _ in range(120 * 90 * 3)))
+        cls.sizes = {q: len(encode(cls.image, "jpeg", encode_params("jpeg", q))) for q in range(*QUALITY_RANGE[:1], QUALITY_RANGE[1] + 1)}
+
+    def assertHighestFit(self, parallel):
+        for quality in (50, 63, 80, 95):
+            with self.subTest(quality=quality, parallel=parallel):
+                budget = self.sizes[quality] + 1
+                expected = max(q for q, size in self.sizes.items() if size <= budget)
+                data = compress_to_fit(self.image, "jpeg", budget, parallel=parallel).getvalue()
+                self.assertEqual(data, encode(self.image, "jpeg", encode_params("jpeg", expected)))
+
+    def test_serial(self):
+        self.assertHighestFit(parallel=False)
+
+    @override_settings(IMAGE_ENCODE_WORKERS=2)
+    def test_pool(self):
+        if get_worker_count() < 2:
+            self.skipTest("needs two CPUs")
+        self.addCleanup(image_encoding._reset_pool)
+        self.assertHighestFit(parallel=True)
+
+    def test_shared_image_round_trip(self):
+        shared = image_encoding.SharedImage(self.image)
+        self.addCleanup(shared.unlink)
+        copy = pickle.loads(pickle.dumps(shared))
+        self.assertLess(len(pickle.dumps(shared)), 200)
+        self.assertEqual(copy.open().tobytes(), self.image.tobytes())
+
+
+class ImageCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(RUNTIME_DIR=os.path.join(directory.name, "runtime")))
+
+    def drive_response(self, body=b"jpeg-bytes"):
+        response = mock.MagicMock(status_code=200, headers={"Content-Type": "image/jpeg"})
+        response.__enter__.return_value = response
+        response.iter_content.return_value = [body]
+        return response
+
+    def test_store_and_get(self):
+        key = image_cache.cache_key("drive-id", 400, 400)
+        self.assertIsNone(image_cache.get_cached_image(key))
+        path = image_cache.store_image(key, [b"ab", b"cd"], "image/webp; charset=binary")
+
+        self.assertEqual(image_cache.get_cached_image(key), (path, "image/webp"))
+        self.assertTrue(path.startswith(os.path.join(image_cache.get_cache_dir(), key[:2])))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"abcd")
+        self.assertEqual(os.stat(image_cache.get_cache_dir()).st_mode & 0o777, 0o700)
+
+    def test_too_large_leaves_nothing_behind(self):
+        key = image_cache.cache_key("drive-id", 400, 400)
+        with mock.patch.object(image_cache, "MAX_IMAGE_BYTES", 3), self.assertRaises(image_cache.ImageTooLarge):
+            image_cache.store_image(key, [b"ab", b"cd"], "image/jpeg")
+        self.assertIsNone(image_cache.get_cached_image(key))
+        self.assertEqual(os.listdir(os.path.dirname(image_cache._base_path(key))), [])
+
+    def test_evict_least_recently_served(self):
+        paths = {}
+        for n, name in enumerate(("old", "served", "new")):
+            paths[name] = image_cache.store_image(image_cache.cache_key(name, 1, 1), [b"x" * 100], "image/jpeg")
+            os.utime(paths[name], (1000 + n, 1000 + n))
+        image_cache.get_cached_image(image_cache.cache_key("served", 1, 1))
+
+        # 300 bytes over a 250 budget: drop files until under 225, oldest served first
+        image_cache.evict(250)
+        self.assertEqual({name for name, path in paths.items() if os.path.exists(path)}, {"served", "new"})
+
+    def test_view_serves_from_the_cache_and_revalidates(self):
+        with mock.patch("store.views.drive_session.get", return_value=self.drive_response()) as get:
+            first = self.client.get("/store/images/", {"id": "drive-id", "w": 400, "h": 300})
+            second = self.client.get("/store/images/", {"id": "drive-id", "w": 400, "h": 300})
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(b"".join(second.streaming_content), b"jpeg-bytes")
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertIn("Last-Modified", second)
+
+        with mock.patch("store.views.drive_session.get") as get:
+            response = self.client.get(
+                "/store/images/", {"id": "drive-id", "w": 400, "h": 300}, HTTP_IF_NONE_MATCH=first["ETag"]
+            )
+        get.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], first["ETag"])
+
+        # Another format is another representation
+        with mock.patch("store.views.drive_session.get", return_value=self.drive_response()):
+            webp = self.client.get(
+                "/store/images/", {"id": "drive-id", "w": 400, "h": 300}, HTTP_ACCEPT="image/webp", HTTP_IF_NONE_MATCH=first["ETag"]
+            )
+        self.assertEqual(webp.status_code, 200)
+        self.assertNotEqual(webp["ETag"], first["ETag"])
+
+
+class UploadWorkerCommandTests(SimpleTestCase):
+    def test_signals_stop_the_child_processes(self):
+        class Process:
+            def __init__(self, target, args):
+                self.alive = False
+
+            def start(self):
+                self.alive = True
+
+            def is_alive(self):
+                return self.alive
+
+            def terminate(self):
+                self.alive = False
+
+            def join(self):
+                # A supervisor's SIGTERM arrives while the parent waits
+                if self.alive:
+                    signal.raise_signal(signal.SIGTERM)
+                joined.append(self.alive)
+
+        joined = []
+        before = signal.getsignal(signal.SIGTERM), signal.getsignal(signal.SIGINT)
+        context = mock.Mock(Process=mock.Mock(side_effect=Process))
+        with mock.patch("multiprocessing.get_context", return_value=context), mock.patch("django.db.connections.close_all"):
+            call_command("run_drive_upload_worker", "--processes", "3", stdout=io.StringIO())
+        # Every child was stopped before it was joined
+        self.assertEqual(joined, [False, False, False])
+        self.assertEqual((signal.getsignal(signal.SIGTERM), signal.getsignal(signal.SIGINT)), before)
+
+
+class ImportCatalogTests(CacheIsolationMixin, TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "catalog.csv")
+        self.images = directory.name
+        for name in ("apple.png", "mango.png"):
+            Image.new("RGB", (40, 40), "orange").save(os.path.join(directory.name, name))
+        with open(self.path, "w") as f:
+            f.write(
+                "type,name,category,original_price,image\n"
+                "category,Fruits,,,\n"
+                "product,Apple,Fruits,100,apple.png\n"
+                "product,Mango,Fruits,120,mango.png\n"
+                "product,Banana,Fruits,40,\n"
+            )
+
+    def run_import(self, upload):
+        with mock.patch("store.management.commands.import_catalog.upload_file_to_drive", upload):
+            call_command("import_catalog", self.path, "--images", self.images, "--chunk-size", "2",
+                         "--image-workers", "1", "--format", "png", stdout=io.StringIO(), stderr=io.StringIO())
+        with open(f"{self.path}.checkpoint.json") as f:
+            return json.load(f)
+
+    def test_failed_images_are_retried_on_resume(self):
+        def failing_upload(buffer, ext=None, share=True):
+            raise OSError("Drive unavailable")
+
+        checkpoint = self.run_import(failing_upload)
+        self.assertEqual((checkpoint["records_done"], checkpoint["failed_images"]), (4, [2, 3]))
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertFalse(Product.objects.exclude(google_file_id="").exists())
+
+        uploads = iter(range(1000))
+
+        def upload(buffer, ext=None, share=True):
+            n = next(uploads)
+            return f"drive-{n}", f"00000000-0000-0000-0000-{n:012d}"
+
+        checkpoint = self.run_import(upload)
+        self.assertEqual((checkpoint["records_done"], checkpoint["failed_images"]), (4, []))
+        self.assertEqual(
+            set(Product.objects.exclude(google_file_id="").values_list("name", flat=True)), {"Apple", "Mango"}
+        )
+
+
+class KeysetPaginationTests(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Fruits")
+        prices = [(100, 90), (100, 90), (50, 50), (80, 40), (120, 60), (200, 190), (60, 30), (100, 100), (90, 45), (70, 70), (40, 20)]
+        for i, (original_price, discounted_price) in enumerate(prices):
+            Product.objects.create(
+                category=cls.category,
+                name=f"{'Apple' if i % 2 else 'apple'} {i:02d}",
+                original_price=original_price,
+                discounted_price=discounted_price,
+                is_active=i != 5,
+            )
+        Product.objects.create(category=Category.objects.create(name="Dairy"), name="Milk", original_price=50, discounted_price=40)
+
+    def expected_ids(self, sort):
+        products = Product.objects.filter(category=self.category, is_active=True)
+        keys = {
+            "name": lambda p: (p.name.lower(), p.id),
+            "newest": lambda p: (p.created_at, p.id),
+            "price": lambda p: (p.discounted_price, p.id),
+            "discount": lambda p: ((p.original_price - p.discounted_price) * 100 // p.original_price, p.id),
+        }
+        return [p.id for p in sorted(products, key=keys[sort], reverse=SORTS[sort][1])]
+
+    def walk(self, url, params, sort):
+        ids, cursor = [], ""
+        while True:
+            response = self.client.get(url, {**params, "cursor": cursor, "sort": sort, "page_size": 3, "include_total": "false"})
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertNotIn("total_count", page)
+            self.assertLessEqual(len(page["products"]), 3)
+            ids += [product["id"] for product in page["products"]]
+            if not page["has_more"]:
+                self.assertIsNone(page["next_cursor"])
+                return ids
+            cursor = page["next_cursor"]
+
+    def test_category_pages_follow_each_sort(self):
+        for sort in SORTS:
+            with self.subTest(sort=sort):
+                ids = self.walk("/store/get_products/", {"category_id": self.category.pk}, sort)
+                self.assertEqual(ids, self.expected_ids(sort))
+
+    def test_search_pages(self):
+        ids = self.walk("/store/search_products/", {"query": "apple"}, "price")
+        self.assertEqual(ids, self.expected_ids("price"))
+
+    def test_first_page_counts_by_default(self):
+        page = self.client.get("/store/get_products/", {"category_id": self.category.pk, "cursor": "", "page_size": 4}).json()
+        self.assertEqual((page["total_count"], page["total_pages"]), (10, 3))
+
+    def test_cursor_round_trip(self):
+        row = product_queryset().values("id", "created_at").first()
+        self.assertEqual(decode_cursor(encode_cursor("newest", row), "newest"), (row["created_at"], row["id"]))
+
+    def test_bad_cursors(self):
+        cursor = encode_cursor("price", {"id": 1, "discounted_price": 10})
+        for params in ({"cursor": "not-a-cursor"}, {"cursor": cursor, "sort": "name"}, {"cursor": "", "sort": "rating"}):
+            with self.subTest(params=params):
+                response = self.client.get("/store/get_products/", {"category_id": self.category.pk, **params})
+                self.assertEqual(response.status_code, 400)
+
+
+    def test_errors_name_the_bad_parameter(self):
+        bad_date = base64.urlsafe_b64encode(json.dumps({"s": "newest", "k": ["yesterday", 1]}).encode()).decode()
+        cases = [
+            ("/store/get_products/", {"category_id": "fruits", "cursor": ""}, "category_id must be an integer"),
+            ("/store/get_products/", {"category_id": "fruits"}, "category_id must be an integer"),
+            ("/store/get_products/", {"category_id": self.category.pk, "cursor": bad_date, "sort": "newest"}, "Invalid cursor"),
+            ("/store/search_products/", {"query": "apple", "min_discount": "lots", "cursor": ""}, "min_discount must be an integer"),
+            ("/store/search_products/", {"query": "apple", "min_discount": "lots"}, "min_discount must be an integer"),
+            ("/store/search_products/", {"query": "apple", "cursor": bad_date, "sort": "newest"}, "Invalid cursor"),
+        ]
+        for url, params, message in cases:
+            with self.subTest(url=url, params=params):
+                response = self.client.get(url, params)
+                self.assertEqual((response.status_code, response.json()["message"]), (400, message))
+
+def indexed(id, name, category_name="Fruits", description="", discount=0, category_id=1):
+    return {"id": id, "name": name, "category_name": category_name, "description": description,
+            "discount": discount, "category_id": category_id}
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.index = search.SearchIndex("v1")
+        for product in (
+            indexed(1, "Alphonso Mango", description="Sweet summer fruit", discount=10),
+            indexed(2, "Mango Pickle", category_name="Pickles", category_id=2),
+            indexed(3, "Green Apple", description="Crisp, not a mango"),
+            indexed(4, "Crème Fraîche", category_name="Dairy", category_id=3),
+        ):
+            self.index.add(product)
+
+    def test_name_matches_rank_above_description_matches(self):
+        ids = self.index.search("mango")
+        self.assertEqual((set(ids[:2]), ids[2]), ({1, 2}, 3))
+
+    def test_every_word_has_to_match(self):
+        self.assertEqual(self.index.search("mango pickle"), [2])
+
+    def test_prefix_typo_and_accent_matches(self):
+        self.assertEqual(self.index.search("alph"), [1])
+        self.assertEqual(set(self.index.search("mnago")), {1, 2, 3})
+        self.assertEqual(self.index.search("creme"), [4])
+
+    def test_min_discount_and_pages(self):
+        self.assertEqual(self.index.search("mango", min_discount=5), [1])
+        total_count, products = self.index.page("mango", 2, 2)
+        self.assertEqual((total_count, [p["id"] for p in products]), (3, [3]))
+
+    def test_replace_and_remove(self):
+        self.index.add(indexed(2, "Lime Pickle", category_name="Pickles", category_id=2))
+        self.assertEqual(self.index.search("mango"), [1, 3])
+        self.assertEqual(self.index.search("lime"), [2])
+        self.index.remove(1)
+        self.assertEqual(self.index.search("alphonso"), [])
+        self.assertNotIn("alphonso", self.index.terms)
+
+    def test_saved_index_loads_as_data(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.json")
+            search.save_index(self.index, path)
+            with open(path) as f:
+                self.assertEqual(json.load(f)["version"], "v1")
+            loaded = search.load_index(path)
+            with open(path, "w") as f:
+                f.write("not json")
+            self.assertIsNone(search.load_index(path))
+        self.assertEqual(loaded.version, "v1")
+        self.assertEqual(loaded.terms, self.index.terms)
+        for query in ("mango", "alph", "mnago"):
+            self.assertEqual(loaded.search(query), self.index.search(query))
+
+
+class SearchTests(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fruits = Category.objects.create(name="Fruits")
+        cls.mango = Product.objects.create(category=cls.fruits, name="Mango", original_price=100, discounted_price=80)
+        cls.apple = Product.objects.create(category=cls.fruits, name="Apple", original_price=100, discounted_price=100)
+
+    def setUp(self):
+        super().setUp()
+        index = search.build_index()
+        patcher = mock.patch.object(search, "_index", index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = index
+
+    def test_apply_change_reindexes_changed_products(self):
+        Product.objects.filter(pk=self.mango.pk).update(name="Alphonso")
+        Product.objects.filter(pk=self.apple.pk).update(is_active=False)
+        search.apply_change([self.mango.pk, self.apple.pk], old_version=self.index.version, new_version="v2")
+        self.assertEqual(self.index.search("alphonso"), [self.mango.pk])
+        self.assertEqual(self.index.search("mango"), [])
+        self.assertEqual(self.index.search("apple"), [])
+        self.assertEqual(self.index.version, "v2")
+
+    def test_apply_change_reindexes_a_category(self):
+        Category.objects.filter(pk=self.fruits.pk).update(name="Produce")
+        search.apply_change(category_id=self.fruits.pk, old_version="elsewhere", new_version="v2")
+        self.assertEqual(sorted(self.index.search("produce")), [self.mango.pk, self.apple.pk])
+        # Another change came in between: the index stays stale until it is rebuilt
+        self.assertNotEqual(self.index.version, "v2")
+
+    def test_page_mode_has_one_shape_while_the_index_loads(self):
+        ranked = self.client.get("/store/search_products/", {"query": "mango"})
+        with mock.patch.object(search, "get_fresh_index", return_value=None):
+            interim = self.client.get("/store/search_products/", {"query": "mango"})
+        self.assertEqual(ranked.json(), interim.json())
+        self.assertIn("ETag", ranked)
+        self.assertNotIn("ETag", interim)
+        self.assertEqual(interim["Cache-Control"], "no-store")
+
+
+    def test_one_worker_builds_the_others_load_its_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(SEARCH_INDEX_PATH=os.path.join(directory.name, "index.json")))
+        self.index.version = get_catalog_version()
+        caches["default"].add(search.BUILD_LOCK_KEY, "other worker")
+
+        def other_worker():
+            time.sleep(0.2)
+            search.save_index(self.index)
+            caches["default"].delete(search.BUILD_LOCK_KEY)
+
+        # Run where the test transaction can't be closed under it
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        with mock.patch.object(search, "_index", None), mock.patch.object(search, "build_index") as build_index:
+            self.assertIsNone(search.get_fresh_index(self.index.version))
+            deadline = time.monotonic() + 5
+            while search._refreshing.is_set() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            loaded = search._index
+        thread.join()
+        build_index.assert_not_called()
+        self.assertEqual((loaded.version, loaded.search("mango")), (self.index.version, [self.mango.pk]))
+
+    def test_errors_are_not_sent_to_the_client(self):
+        with mock.patch.object(search, "search_page", side_effect=RuntimeError("connection to 10.0.0.5 refused")), \
+                self.assertLogs("store.views", "ERROR"):
+            response = self.client.get("/store/search_products/", {"query": "mango"})
+        self.assertEqual(response.status_code, 500)
+        self.assertNotIn("10.0.0.5", response.json()["message"])
+
+
+class AutocompleteIndexTests(TestCase):
+    def setUp(self):
+        self.index = autocomplete.AutocompleteIndex("v1")
+        self.index.add(("product", 1), "Green Apple Juice", "product", 1, 1.0)
+        self.index.add(("product", 2), "Apricot Jam", "product", 2, 3.0)
+        self.index.add(("category", 1), "Apples", "category", 1, 2.0)
+
+    def texts(self, query, limit=10):
+        return [suggestion["text"] for suggestion in self.index.suggest(query, limit)]
+
+    def test_matches_any_word_by_weight(self):
+        self.assertEqual(self.texts("ap"), ["Apricot Jam", "Apples", "Green Apple Juice"])
+        self.assertEqual(self.texts("apple j"), ["Green Apple Juice"])
+        self.assertEqual(self.texts("juice"), ["Green Apple Juice"])
+
+    def test_short_prefixes_are_memoized(self):
+        self.assertEqual(self.texts("ap", limit=1), ["Apricot Jam"])
+        self.assertIn("ap", self.index.memo)
+        # The memo keeps the top MAX_LIMIT, so a larger limit is still served from it
+        self.assertEqual(self.texts("ap", limit=3), ["Apricot Jam", "Apples", "Green Apple Juice"])
+        self.texts("appl")
+        self.assertEqual(list(self.index.memo), ["ap"])
+
+    def test_changes_clear_the_memo(self):
+        self.texts("ap")
+        self.index.add(("product", 3), "Apple Cider", "product", 3, 5.0)
+        self.assertEqual(self.index.memo, {})
+        self.assertEqual(self.texts("ap")[0], "Apple Cider")
+
+        self.index.remove(("product", 3))
+        self.assertEqual(self.index.memo, {})
+        self.assertNotIn("Apple Cider", self.texts("ap"))
+
+
+class AutocompleteViewTests(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.create(category=Category.objects.create(name="Fruits"), name="Mango", original_price=100, discounted_price=90)
+
+    def setUp(self):
+        super().setUp()
+        # Pretend a rebuild is already running, so no thread starts
+        autocomplete._refreshing.set()
+        self.addCleanup(autocomplete._refreshing.clear)
+
+    def suggest(self, index):
+        with mock.patch.object(autocomplete, "_index", index):
+            return self.client.get("/store/autocomplete/", {"q": "man"})
+
+    def test_current_index_gets_the_catalog_etag(self):
+        response = self.suggest(autocomplete.build_index())
+        self.assertEqual([s["text"] for s in response.json()["suggestions"]], ["Mango"])
+        self.assertIn("ETag", response)
+
+    def test_stale_index_and_fallback_are_not_cached(self):
+        stale = autocomplete.build_index()
+        stale.version = "older"
+        for index in (stale, None):
+            with self.subTest(index=index):
+                response = self.suggest(index)
+                self.assertEqual([s["text"] for s in response.json()["suggestions"]], ["Mango"])
+                self.assertNotIn("ETag", response)
+                self.assertEqual(response["Cache-Control"], "no-store")
+
+
+class CatalogCachedTests(CacheIsolationMixin, SimpleTestCase):
+    def get(self, view, **headers):
+        return catalog_cached(max_age=60)(view)(RequestFactory().get("/", headers=headers))
+
+    def test_not_modified(self):
+        view = mock.Mock(return_value=HttpResponse("{}"))
+        etag = self.get(view)["ETag"]
+        self.assertEqual(etag, f'"catalog-{get_catalog_version()}"')
+
+        response = self.get(view, if_none_match=f'"other", {etag}')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(view.call_count, 1)
+
+        bump_catalog_version()
+        self.assertEqual(self.get(view, if_none_match=etag).status_code, 200)
+
+    def test_encoded_responses_get_a_suffix(self):
+        def view(request):
+            response = HttpResponse(b"gzipped")
+            response["Content-Encoding"] = "gzip"
+            return response
+
+        etag = self.get(view)["ETag"]
+        self.assertEqual(etag, f'"catalog-{get_catalog_version()}-gzip"')
+        # Any coding of the current version is still current
+        self.assertEqual(self.get(view, if_none_match=etag).status_code, 304)
+
+    def test_async_view(self):
+        async def view(request):
+            return HttpResponse("{}")
+
+        response = async_to_sync(catalog_cached(max_age=60)(view))(RequestFactory().get("/"))
+        self.assertEqual(response["ETag"], f'"catalog-{get_catalog_version()}"')
+        self.assertEqual(response["Cache-Control"], "public, max-age=60, stale-while-revalidate=300")
+
+    def test_errors_and_views_own_headers_are_left_alone(self):
+        def interim(request):
+            response = HttpResponse("{}")
+            response["Cache-Control"] = "no-store"
+            return response
+
+        def prepared(request):
+            response = HttpResponse("{}")
+            response["ETag"] = 'W/"abc"'
+            return response
+
+        for status in (400, 500):
+            response = self.get(lambda request: HttpResponse("error", status=status))
+            self.assertFalse(response.has_header("ETag"))
+            self.assertFalse(response.has_header("Cache-Control"))
+        response = self.get(interim)
+        self.assertFalse(response.has_header("ETag"))
+        self.assertEqual(response["Cache-Control"], "no-store")
+        self.assertEqual(self.get(prepared)["ETag"], 'W/"abc"')
+
+
+class CatalogInvalidationTests(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(category=Category.objects.create(name="Fruits"), name="Mango", original_price=100, discounted_price=90)
+
+    def test_upload_status_saves_do_not_invalidate(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.upload_status = "pending"
+            self.product.save(update_fields=["upload_status"])
+        self.assertEqual(callbacks, [])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.google_file_id = "drive-id"
+            self.product.save(update_fields=["google_file_id", "upload_status"])
+        self.assertEqual(len(callbacks), 1)
+
+    @override_settings(HOME_FEED_REBUILD_DELAY=0)
+    def test_home_feed_rebuild_catches_up_with_changes_made_meanwhile(self):
+        built = []
+
+        def build_all(version):
+            built.append(version)
+            if len(built) == 1:
+                # Committed mid-rebuild: its own rebuild_in_background() finds this one running
+                bump_catalog_version()
+                home_feed.rebuild_in_background()
+
+        with mock.patch.object(home_feed, "build_all", side_effect=build_all):
+            home_feed.rebuild_in_background()
+            deadline = time.monotonic() + 5
+            while home_feed._rebuilding.is_set() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(built, [built[0], built[0] + 1])
+        self.assertEqual(built[-1], get_catalog_version())
+
+    @override_settings(HOME_FEED_REBUILD_DELAY=0)
+    def test_home_feed_rebuild_runs_in_one_process_at_a_time(self):
+        caches["default"].add(home_feed.REBUILD_LOCK_KEY, 1)
+        with mock.patch.object(home_feed, "build_all") as build_all:
+            home_feed.rebuild_in_background()
+            deadline = time.monotonic() + 5
+            while home_feed._rebuilding.is_set() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        build_all.assert_not_called()
+
+
+class ChangeFeedTests(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fruits = Category.objects.create(name="Fruits")
+        cls.mango = Product.objects.create(category=cls.fruits, name="Mango", original_price=100, discounted_price=90)
+        cls.apple = Product.objects.create(category=cls.fruits, name="Apple", original_price=100, discounted_price=100)
+        cls.banner = Banner.objects.create(title="Summer", text="Mangoes are here", banner_type=Banner.BANNER_TYPES[0][0], search_query="mango")
+
+    def feed(self, since=0, limit=changes.DEFAULT_LIMIT):
+        response = self.client.get("/store/changes/", {"since": since, "limit": limit})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_saves_are_logged_in_their_transaction(self):
+        self.assertEqual(
+            set(CatalogChange.objects.values_list("kind", "object_id")),
+            {("category", self.fruits.pk), ("product", self.mango.pk), ("product", self.apple.pk), ("banner", self.banner.pk)},
+        )
+        self.mango.save()
+        self.mango.save()
+        # Publishing keeps only the latest
+        self.feed()
+        self.assertEqual(CatalogChange.objects.filter(kind="product", object_id=self.mango.pk).count(), 1)
+
+    def test_full_sync_then_tombstones(self):
+        page = self.feed()
+        self.assertEqual({p["id"] for p in page["products"]}, {self.mango.pk, self.apple.pk})
+        self.assertEqual([c["id"] for c in page["categories"]], [self.fruits.pk])
+        self.assertEqual([b["id"] for b in page["banners"]], [self.banner.pk])
+
+        self.apple.is_active = False
+        self.apple.save()
+        banner_id = self.banner.pk
+        self.banner.delete()
+        later = self.feed(page["version"])
+        self.assertEqual(later["products"], [])
+        self.assertEqual(later["deleted"], {"products": [self.apple.pk], "categories": [], "banners": [banner_id]})
+        self.assertEqual(self.feed(later["version"])["version"], later["version"])
+
+    def test_pages(self):
+        positions = []
+        page = {"version": 0, "has_more": True}
+        while page["has_more"]:
+            page = self.feed(page["version"], limit=3)
+            positions.append(page["version"])
+        self.assertEqual(positions, [3, 4])
+
+    def test_late_commit_with_a_lower_id_is_not_skipped(self):
+        # A transaction takes an id, then stays open while later changes are served
+        reserved = CatalogChange.objects.create(kind="product", object_id=self.mango.pk)
+        reserved.delete()
+        changes.record("product", [self.apple.pk])
+        version = self.feed()["version"]
+
+        CatalogChange.objects.create(id=reserved.id, kind="product", object_id=self.mango.pk)
+        page = self.feed(version)
+        self.assertEqual([p["id"] for p in page["products"]], [self.mango.pk])
+        self.assertGreater(page["version"], version)
+
+
+@skipUnless(connection.vendor == "postgresql", "needs concurrent write transactions")
+class ChangeFeedConcurrencyTests(CacheIsolationMixin, TransactionTestCase):
+    @mock.patch("store.home_feed.rebuild_in_background")
+    def test_long_open_transaction(self, rebuild):
+        fruits = Category.objects.create(name="Fruits")
+        mango = Product.objects.create(category=fruits, name="Mango", original_price=100, discounted_price=90)
+        version = async_to_sync(changes.changes_since)(0)["version"]
+
+        recorded, release = threading.Event(), threading.Event()
+
+        def slow_admin_save():
+            try:
+                with transaction.atomic():
+                    changes.record("product", [mango.pk])
+                    recorded.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=slow_admin_save)
+        thread.start()
+        recorded.wait(5)
+        # Takes a higher id and commits first
+        apple = Product.objects.create(category=fruits, name="Apple", original_price=100, discounted_price=100)
+        page = async_to_sync(changes.changes_since)(version)
+        self.assertEqual([p["id"] for p in page["products"]], [apple.pk])
+
+        release.set()
+        thread.join()
+        later = async_to_sync(changes.changes_since)(page["version"])
+        self.assertEqual([p["id"] for p in later["products"]], [mango.pk])
@@ -0,0 +1,201 @@
+"""
+Database-backed queue for Drive uploads started from the store admin.
+
+The admin stores the processed image bytes as DriveUploadJob rows and returns
+immediately; `manage.py run_drive_upload_worker` uploads them, grants public
+read access and, once every file of an upload is done, points the Category,
+Product or Banner at the new image. Failed steps are retried with exponential
+backoff. The renditions are encoded by the worker too: the admin only queues
+the uploaded file as a "source" job, which the worker turns into one
+rendition job per width and format of the same batch.
+"""
+import io
+import logging
+import random
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .forms import IMAGE_MAX_SIZES, ImageProcessingMixin
+from .models import Category, Product, Banner, DriveUploadJob
+from .utils.google_drive import upload_file_to_drive, grant_public_read
+
+logger = logging.getLogger(__name__)
+
+TARGET_MODELS = {
+    "category": Category,
+    "product": Product,
+    "banner": Banner,
+}
+
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 15
+BACKOFF_MAX_SECONDS = 60 * 60
+# A running job whose worker died becomes claimable again after this long
+LEASE_SECONDS = 10 * 60
+# Target fields finish_batch writes, possibly while an admin form is open on the target
+WORKER_FIELDS = ("google_file_id", "image_uuid", "image_renditions", "upload_status")
+
+
+def enqueue_image_upload(obj, image_buffer, ext, source=None):
+    """
+    Queue an image for upload to obj, plus the uploaded `source` file its
+    renditions are encoded from, and mark obj as pending. Returns the batch id.
+    """
+    target_model = obj._meta.model_name
+    if target_model not in TARGET_MODELS:
+        raise ValueError(f"Cannot queue uploads for {target_model}")
+
+    jobs = [DriveUploadJob(target_model=target_model, target_id=obj.pk, kind="image", ext=ext, payload=image_buffer.getvalue())]
+    if source is not None:
+        source.seek(0)
+        jobs.append(DriveUploadJob(target_model=target_model, target_id=obj.pk, kind="source", payload=source.read()))
+        source.seek(0)
+    batch = jobs[0].batch
+    for job in jobs:
+        job.batch = batch
+
+    with transaction.atomic():
+        DriveUploadJob.objects.bulk_create(jobs)
+        type(obj).objects.filter(pk=obj.pk).update(upload_status="pending")
+    obj.upload_status = "pending"
+    return batch
+
+
+def rendition_jobs(job):
+    """Unsaved rendition jobs of a source job's batch, encoded from its payload."""
+    renditions = ImageProcessingMixin().generate_renditions(
+        io.BytesIO(bytes(job.payload)), max_size=IMAGE_MAX_SIZES[job.target_model]
+    )
+    return [
+        DriveUploadJob(
+            target_model=job.target_model,
+            target_id=job.target_id,
+            batch=job.batch,
+            kind="rendition",
+            rendition_format=fmt,
+            rendition_width=width,
+            ext=fmt,
+            payload=buffer.getvalue(),
+        )
+        for width, fmt, buffer in renditions
+    ]
+
+
+def claim_next_job():
+    """Atomically take the next due job, or return None. Safe to call from many workers."""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            DriveUploadJob.objects.select_for_update(skip_locked=True)
+            .filter(status__in=["pending", "running"], next_attempt_at__lte=now)
+            .order_by("next_attempt_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = "running"
+        job.attempts += 1
+        job.next_attempt_at = now + timedelta(seconds=LEASE_SECONDS)
+        job.save(update_fields=["status", "attempts", "next_attempt_at", "updated_at"])
+    return job
+
+
+def backoff_seconds(attempts):
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_job(job):
+    """
+    Upload and share one job's file (or encode a source job's renditions),
+    recording success or scheduling a retry.
+    """
+    renditions = []
+    try:
+        if job.kind == "source":
+            renditions = rendition_jobs(job)
+        elif not job.google_file_id:
+            google_id, _ = upload_file_to_drive(io.BytesIO(bytes(job.payload)), ext=job.ext, share=False)
+            job.google_file_id = google_id
+            job.save(update_fields=["google_file_id", "updated_at"])
+        if job.kind != "source":
+            grant_public_read(job.google_file_id)
+    except Exception as e:
+        logger.warning("Drive upload job %s failed (attempt %s): %s", job.pk, job.attempts, e)
+        job.last_error = str(e)
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = "failed"
+        else:
+            job.status = "pending"
+            job.next_attempt_at = timezone.now() + timedelta(seconds=backoff_seconds(job.attempts))
+        job.save(update_fields=["status", "next_attempt_at", "last_error", "updated_at"])
+        if job.status == "failed":
+            finish_batch(job)
+        return False
+
+    job.status = "done"
+    job.last_error = ""
+    job.payload = b""
+    # Together, so a retried source job never queues its renditions twice
+    with transaction.atomic():
+        DriveUploadJob.objects.bulk_create(renditions)
+        job.save(update_fields=["status", "last_error", "payload", "updated_at"])
+    finish_batch(job)
+    return True
+
+
+def finish_batch(job):
+    """
+    Apply a batch to its target once all of its jobs are done, or mark the
+    target failed if any job gave up. Batches superseded by a newer upload for
+    the same target are left alone.
+    """
+    model = TARGET_MODELS[job.target_model]
+    with transaction.atomic():
+        target = model.objects.select_for_update().filter(pk=job.target_id).first()
+        if target is None or str(target.image_uuid) == str(job.batch):
+            return
+
+        siblings = DriveUploadJob.objects.filter(target_model=job.target_model, target_id=job.target_id)
+        batch_jobs = list(siblings.filter(batch=job.batch))
+        if siblings.filter(created_at__gt=max(j.created_at for j in batch_jobs)).exclude(batch=job.batch).exists():
+            return
+
+        statuses = {j.status for j in batch_jobs}
+        if "failed" in statuses:
+            target.upload_status = "failed"
+            target.save(update_fields=["upload_status"])
+            return
+        if statuses != {"done"}:
+            return
+
+        renditions = {}
+        for j in batch_jobs:
+            if j.kind == "image":
+                target.google_file_id = j.google_file_id
+            elif j.kind == "rendition":
+                renditions.setdefault(j.rendition_format, {})[str(j.rendition_width)] = j.google_file_id
+        target.image_uuid = job.batch
+        target.image_renditions = renditions
+        target.upload_status = "uploaded"
+        # save(), not update(), so post_save receivers (cache invalidation) run
+        target.save(update_fields=["google_file_id", "image_uuid", "image_renditions", "upload_status"])
+
+
+def admin_update_fields(obj, changed_data=()):
+    """
+    The fields an admin save of an existing target writes: everything but
+    WORKER_FIELDS, except those the admin changed in the form.
+    """
+    return [
+        field.name for field in obj._meta.concrete_fields
+        if not field.primary_key and (field.name not in WORKER_FIELDS or field.name in changed_data)
+    ]
+
+
+def retry_jobs(queryset):
+    """Make failed or waiting jobs due now (used by the admin action); running jobs are left alone."""
+    updated = queryset.filter(status__in=["failed", "pending"]).update(status="pending", attempts=0, next_attempt_at=timezone.now())
+    for target_model, target_id in queryset.values_list("target_model", "target_id").distinct():
+        TARGET_MODELS[target_model].objects.filter(pk=target_id, upload_status="failed").update(upload_status="pending")
+    return updated
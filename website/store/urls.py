@@ -1,10 +1,12 @@
 from django.urls import path
-from .views import get_products_by_category, get_products_by_search, get_categories, stream_drive_image, best_deals_view, get_banners
+from .views import get_products_by_category, get_products_by_search, get_categories, stream_drive_image, best_deals_view, get_banners, autocomplete_view, get_catalog_changes
 
 urlpatterns = [
     path('get_products/', get_products_by_category),
     path("search_products/", get_products_by_search, name="search_products"),
+    path("autocomplete/", autocomplete_view, name="autocomplete"),
     path("get_categories/", get_categories),
+    path("changes/", get_catalog_changes, name="catalog_changes"),
     path("images/", stream_drive_image, name="stream_google_image"),
     path("best_deals/", best_deals_view),
     path("banners/", get_banners)
@@ -1,43 +1,112 @@
 # your_app/utils/google_drive.py
 import io
+import logging
+import threading
+import time
 import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+import requests
 from django.conf import settings
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 
+logger = logging.getLogger(__name__)
+
 # Make sure these env vars exist in your Render settings:
 # GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_REFRESH_TOKEN, GOOGLE_DRIVE_FOLDER_ID
 # and optionally: GOOGLE_SCOPES (list) but below we set default scope.
 
 DEFAULT_SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 
+# Refresh the access token this long before Google says it expires
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# One set of credentials per process, shared by all threads. The discovery-based
+# service and its httplib2 connection are not thread-safe, so each thread builds
+# its own once and keeps reusing it (and its keep-alive connection).
+_lock = threading.Lock()
+_credentials = None
+_token_session = requests.Session()
+_thread_local = threading.local()
+
+_metrics = {
+    "token_refreshes": 0,
+    "services_built": 0,
+    "uploads": 0,
+    "upload_bytes_total": 0,
+    "upload_seconds_total": 0.0,
+    "last_upload_seconds": None,
+}
+
+
+def _token_needs_refresh(creds):
+    if not creds.token or creds.expiry is None:
+        return True
+    now = datetime.now(dt_timezone.utc).replace(tzinfo=None)  # Credentials.expiry is naive UTC
+    return creds.expiry - TOKEN_REFRESH_MARGIN <= now
+
+
+def get_credentials():
+    """Process-wide Drive credentials, refreshed only shortly before the token expires."""
+    global _credentials
+    with _lock:
+        if _credentials is None:
+            _credentials = Credentials(
+                token=None,
+                refresh_token=getattr(settings, "GOOGLE_REFRESH_TOKEN"),
+                token_uri="https://oauth2.googleapis.com/token",
+                client_id=getattr(settings, "GOOGLE_CLIENT_ID"),
+                client_secret=getattr(settings, "GOOGLE_CLIENT_SECRET"),
+                scopes=getattr(settings, "GOOGLE_SCOPES", DEFAULT_SCOPES),
+            )
+        if _token_needs_refresh(_credentials):
+            _credentials.refresh(Request(_token_session))
+            _metrics["token_refreshes"] += 1
+        return _credentials
+
+
 def get_drive_service():
     """
-    Build a google drive service using client_id/secret and refresh_token from env.
-    This uses an in-memory Credentials object and refreshes automatically when needed.
+    Return this thread's Drive service, building it on first use.
+    Credentials are shared across threads and refreshed ahead of expiry.
     """
-    creds = Credentials(
-        token=None,
-        refresh_token=getattr(settings, "GOOGLE_REFRESH_TOKEN"),
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=getattr(settings, "GOOGLE_CLIENT_ID"),
-        client_secret=getattr(settings, "GOOGLE_CLIENT_SECRET"),
-        scopes=getattr(settings, "GOOGLE_SCOPES", DEFAULT_SCOPES),
-    )
-
-    if not creds.valid or creds.expired:
-        creds.refresh(Request())
-
-    return build("drive", "v3", credentials=creds)
-
-
-def upload_file_to_drive(file_obj, ext=None):
+    creds = get_credentials()
+    service = getattr(_thread_local, "service", None)
+    if service is None:
+        # static_discovery uses the discovery document bundled with the client
+        service = build("drive", "v3", credentials=creds, cache_discovery=False, static_discovery=True)
+        _thread_local.service = service
+        with _lock:
+            _metrics["services_built"] += 1
+    return service
+
+
+def get_drive_metrics():
+    """Snapshot of token refresh and upload latency counters for this process."""
+    with _lock:
+        metrics = dict(_metrics)
+    if metrics["uploads"]:
+        metrics["upload_seconds_avg"] = metrics["upload_seconds_total"] / metrics["uploads"]
+    return metrics
+
+
+def _record_upload(seconds, size):
+    with _lock:
+        _metrics["uploads"] += 1
+        _metrics["upload_bytes_total"] += size
+        _metrics["upload_seconds_total"] += seconds
+        _metrics["last_upload_seconds"] = seconds
+    logger.info("Drive upload of %d bytes took %.3fs", size, seconds)
+
+
+def upload_file_to_drive(file_obj, ext=None, share=True):
     """
     Upload file to Google Drive.
     ext is auto-detected if not provided.
     Supports: jpg, jpeg, png, webp
+    With share=False the caller grants public read access itself (grant_public_read).
     """
     service = get_drive_service()
     generated_uuid = str(uuid.uuid4())
@@ -66,14 +135,14 @@ def upload_file_to_drive(file_obj, ext=None):
     try:
         # webp needs correct mimetype: image/webp
         media = MediaIoBaseUpload(file_bytes, mimetype=f"image/{ext}", resumable=False)
+        started = time.perf_counter()
         uploaded = service.files().create(
             body=metadata, media_body=media, fields="id"
         ).execute()
+        _record_upload(time.perf_counter() - started, file_bytes.getbuffer().nbytes)
 
-        service.permissions().create(
-            fileId=uploaded["id"],
-            body={"role": "reader", "type": "anyone"},
-        ).execute()
+        if share:
+            grant_public_read(uploaded["id"], service=service)
 
         return uploaded["id"], generated_uuid
 
@@ -81,5 +150,14 @@ def upload_file_to_drive(file_obj, ext=None):
         file_bytes.close()
 
 
+def grant_public_read(google_file_id, service=None):
+    """Make an uploaded file readable by anyone with the link."""
+    service = service or get_drive_service()
+    service.permissions().create(
+        fileId=google_file_id,
+        body={"role": "reader", "type": "anyone"},
+    ).execute()
+
+
 def get_public_url(google_file_id):
     return f"https://drive.google.com/uc?id={google_file_id}"
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+Fit an image under a byte budget with as few encodes as possible.
+
+Quality is found with a k-ary search instead of a linear scan, and the
+candidate encodes of each round run concurrently in a shared process pool.
+All attempts start from the same decoded, already resized base image, whose
+pixels are copied into shared memory once per compress_to_fit() call, so
+pool tasks carry its name rather than a pickled copy of the image.
+
+The pool is only started where IMAGE_ENCODE_WORKERS > 1 (1 by default), so a
+web worker does not spawn encoders unless it is configured to.
+"""
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from PIL import Image
+
+QUALITY_RANGE = (50, 95)
+SCALE_STEPS = (0.95, 0.9, 0.85, 0.8, 0.75, 0.7)
+PNG_COMPRESS_LEVELS = range(2, 7)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_count():
+    from django.conf import settings
+    return min(int(getattr(settings, "IMAGE_ENCODE_WORKERS", 1)), os.cpu_count() or 1)
+
+
+def get_pool():
+    """Process pool shared by all uploads in this process, or None when running serially."""
+    global _pool
+    workers = get_worker_count()
+    if workers <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the web worker may have threads and open sockets
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+class SharedImage:
+    """
+    An image's pixels in shared memory. Pickles as the segment's name, so
+    each pool task sends a few bytes instead of the whole image.
+    """
+
+    def __init__(self, img):
+        data = img.tobytes()
+        self.mode, self.size, self.nbytes = img.mode, img.size, len(data)
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, self.nbytes))
+        self.memory.buf[:self.nbytes] = data
+        self.name = self.memory.name
+
+    @classmethod
+    def supports(cls, img):
+        # Palette images would need their palette sent too
+        return img.mode in ("L", "LA", "RGB", "RGBA")
+
+    def __getstate__(self):
+        return {"mode": self.mode, "size": self.size, "nbytes": self.nbytes, "name": self.name}
+
+    def open(self):
+        memory = shared_memory.SharedMemory(name=self.name)
+        try:
+            return Image.frombytes(self.mode, self.size, bytes(memory.buf[:self.nbytes]))
+        finally:
+            memory.close()
+
+    def unlink(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+def encode_params(format, quality):
+    if format.lower() == "webp":
+        return {"quality": quality, "method": 4}
+    return {"quality": quality, "optimize": True, "progressive": True}
+
+
+def encode(img, format, params, scale=1.0):
+    """Encode img (optionally downscaled) and return the bytes. Runs in pool workers."""
+    if isinstance(img, SharedImage):
+        img = img.open()
+    if scale != 1.0:
+        img = img.copy()
+        img.thumbnail((int(img.width * scale), int(img.height * scale)), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG" if format.lower() == "jpg" else format.upper(), **params)
+    return buffer.getvalue()
+
+
+def encode_many(img, format, attempts, parallel=True):
+    """Encode every (params, scale) attempt, concurrently when a pool is available."""
+    pool = get_pool() if parallel and len(attempts) > 1 else None
+    if pool is not None:
+        try:
+            futures = [pool.submit(encode, img, format, params, scale) for params, scale in attempts]
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            _reset_pool()
+    return [encode(img, format, params, scale) for params, scale in attempts]
+
+
+def first_fit(img, format, attempts, max_bytes, parallel=True):
+    """Bytes of the first attempt (in order) that fits max_bytes, or None."""
+    if parallel and get_pool() is not None:
+        results = encode_many(img, format, attempts, parallel)
+    else:
+        # Serially there is no point encoding past the first fit
+        results = (encode(img, format, params, scale) for params, scale in attempts)
+    for data in results:
+        if len(data) <= max_bytes:
+            return data
+    return None
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def search_quality(img, format, max_bytes, parallel=True):
+    """
+    Highest quality in QUALITY_RANGE whose encode fits max_bytes, as (quality, bytes),
+    or None. Each round encodes `fanout` evenly spaced qualities and narrows the
+    range to the gap between the best fit and the first miss; with one worker
+    this is a plain binary search.
+    """
+    lo, hi = QUALITY_RANGE
+    fanout = max(1, get_worker_count()) if parallel else 1
+    best = None
+    while lo <= hi:
+        span = hi - lo + 1
+        count = min(fanout, span)
+        qualities = sorted({lo + (span * (i + 1)) // (count + 1) for i in range(count)})
+        results = encode_many(img, format, [(encode_params(format, q), 1.0) for q in qualities], parallel)
+
+        fits = [(q, data) for q, data in zip(qualities, results) if len(data) <= max_bytes]
+        misses = [q for q, data in zip(qualities, results) if len(data) > max_bytes]
+        if fits:
+            best = max(fits, key=lambda fit: fit[0])
+            lo = best[0] + 1
+        if misses:
+            hi = min(misses) - 1
+    return best
+
+
+def compress_to_fit(img, format, max_bytes, parallel=True):
+    """Return a BytesIO of img encoded under max_bytes, trading quality before size."""
+    shared = SharedImage(img) if parallel and get_pool() is not None and SharedImage.supports(img) else None
+    try:
+        return fit(shared or img, format, max_bytes, parallel)
+    finally:
+        if shared is not None:
+            shared.unlink()
+
+
+def fit(img, format, max_bytes, parallel=True):
+    if format.lower() in ["jpg", "jpeg", "webp"]:
+        found = search_quality(img, format, max_bytes, parallel)
+        if found:
+            return io.BytesIO(found[1])
+    else:
+        attempts = [({"compress_level": level, "optimize": True}, 1.0) for level in PNG_COMPRESS_LEVELS]
+        data = first_fit(img, format, attempts, max_bytes, parallel)
+        if data is not None:
+            return io.BytesIO(data)
+
+    # Only reduce dimensions if compression isn't enough
+    if format.lower() in ["jpg", "jpeg", "webp"]:
+        params = encode_params(format, 85)
+    else:
+        params = {"compress_level": 3, "optimize": True}
+    data = first_fit(img, format, [(params, scale) for scale in SCALE_STEPS], max_bytes, parallel)
+    if data is not None:
+        return io.BytesIO(data)
+
+    # Last resort - but still maintain reasonable quality
+    if format.lower() in ["jpg", "jpeg", "webp"]:
+        params = encode_params(format, 65)
+    else:
+        params = {"compress_level": 6, "optimize": True}
+    return io.BytesIO(encode(img, format, params))
@@ -1,16 +1,27 @@
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
-from django.conf import settings
-from supabase import create_client
+from website.responses import prepared_response
+from website.supabase_client import get_async_supabase
+import logging
 import math
+import os
 import httpx
 from django.views.decorators.csrf import csrf_exempt
+from .cache import acached_json, aget_catalog_version
+from .decorators import catalog_cached
+from . import autocomplete, changes, home_feed, search
+from .pagination import (
+    DEFAULT_SORT, MAX_PAGE_SIZE, PRODUCT_FIELDS, InvalidCursor, keyset_page, parse_bool, parse_page_size,
+    product_queryset, serialize,
+)
+
+logger = logging.getLogger(__name__)
 
-# Initialize Supabase client once
-supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
 
 @require_http_methods(["GET"])
-def get_products_by_category(request):
+@catalog_cached(max_age=60)
+async def get_products_by_category(request):
     category_id = request.GET.get("category_id")
     category_name = request.GET.get("category_name")
     page = request.GET.get("page", "1")
@@ -21,6 +32,36 @@ def get_products_by_category(request):
             status=400,
         )
 
+    try:
+        page_size = parse_page_size(request.GET.get("page_size"))
+    except ValueError:
+        return JsonResponse({"status": "error", "message": f"page_size must be an integer between 1 and {MAX_PAGE_SIZE}"}, status=400)
+
+    if category_id:
+        try:
+            category_id = int(category_id)
+        except ValueError:
+            return JsonResponse({"status": "error", "message": "category_id must be an integer"}, status=400)
+
+    if "cursor" in request.GET:
+        try:
+            products = product_queryset()
+            if category_id:
+                products = products.filter(category_id=category_id)
+            if category_name:
+                products = products.filter(category__name__iexact=category_name.strip())
+            return JsonResponse(await keyset_page(
+                products,
+                request.GET.get("sort", DEFAULT_SORT),
+                request.GET["cursor"],
+                page_size,
+                include_total=parse_bool(request.GET.get("include_total")),
+            ))
+        except InvalidCursor as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+        except Exception:
+            return JsonResponse({"status": "error", "message": "Could not load products. Try again later."}, status=500)
+
     try:
         page_int = int(page)
         if page_int < 1:
@@ -29,37 +70,33 @@ def get_products_by_category(request):
         return JsonResponse({"status": "error", "message": "page must be an integer"}, status=400)
 
     try:
-        params = {"p_page": page_int, "p_page_size": 20}
+        params = {"p_page": page_int, "p_page_size": page_size}
         if category_id:
-            params["p_category_id"] = int(category_id)
+            params["p_category_id"] = category_id
         if category_name:
             params["p_category_name"] = category_name.strip()
 
-        resp = supabase.rpc("get_products_by_category", params).execute()
-
-        if getattr(resp, "error", None):
-            # return JsonResponse({"status": "error", "message": resp.error.message}, status=400)  # DEV
-            return JsonResponse({"status": "error", "message": "Could not load products. Try again later."}, status=400)
-
-        products = resp.data or []
-        total_count = products[0]["total_count"] if products else 0
+        def render(products):
+            products = products or []
+            total_count = products[0]["total_count"] if products else 0
 
-        cleaned_products = [
-            {k: v for k, v in product.items() if k != "total_count"}
-            for product in products
-        ]
+            cleaned_products = [
+                {k: v for k, v in product.items() if k != "total_count"}
+                for product in products
+            ]
 
-        return JsonResponse(
-            {
+            return {
                 "status": "success",
                 "page": page_int,
-                "page_size": 20,
+                "page_size": page_size,
                 "total_count": total_count,
-                "total_pages": (total_count + 19) // 20,
+                "total_pages": (total_count + page_size - 1) // page_size,
                 "products": cleaned_products,
-            },
-            status=200,
-        )
+            }
+
+        # Encoded once per catalog version, not per request
+        prepared = await acached_json(get_async_supabase(), "get_products_by_category", params, render)
+        return prepared_response(request, prepared)
 
     except Exception as e:
         # return JsonResponse({"status": "error", "message": str(e)}, status=500)  # DEV
@@ -67,7 +104,8 @@ def get_products_by_category(request):
 
 
 @require_http_methods(["GET"])
-def get_products_by_search(request):
+@catalog_cached(max_age=60)
+async def get_products_by_search(request):
     query = request.GET.get("query")
     page = request.GET.get("page", "1")
     min_discount = request.GET.get("min_discount")  # optional
@@ -78,6 +116,32 @@ def get_products_by_search(request):
             status=400
         )
 
+    try:
+        page_size = parse_page_size(request.GET.get("page_size"))
+    except ValueError:
+        return JsonResponse({"status": "error", "message": f"page_size must be an integer between 1 and {MAX_PAGE_SIZE}"}, status=400)
+
+    try:
+        min_discount = int(min_discount) if min_discount else None
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "min_discount must be an integer"}, status=400)
+
+    if "cursor" in request.GET:
+        try:
+            products = search.database_matches(query, min_discount)
+            return JsonResponse(await keyset_page(
+                products,
+                request.GET.get("sort", DEFAULT_SORT),
+                request.GET["cursor"],
+                page_size,
+                include_total=parse_bool(request.GET.get("include_total")),
+            ))
+        except InvalidCursor as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+        except Exception:
+            logger.exception("Product search failed")
+            return JsonResponse({"status": "error", "message": "Could not search products. Try again later."}, status=500)
+
     try:
         page_int = int(page)
         if page_int < 1:
@@ -86,57 +150,102 @@ def get_products_by_search(request):
         return JsonResponse({"status": "error", "message": "page must be an integer"}, status=400)
 
     try:
-        params = {
-            "p_search": query.strip().lower(),
-            "p_page": page_int,
-            "p_page_size": 20,
-            "p_min_discount": int(min_discount) if min_discount else None
-        }
-
-        resp = supabase.rpc("get_products_by_search", params).execute()
-
-        if getattr(resp, "error", None):
-            return JsonResponse({"status": "error", "message": resp.error.message}, status=400)
-
-        products = resp.data or []
-        if not products:
-            return JsonResponse({
-                "status": "success",
-                "page": page_int,
-                "page_size": 20,
-                "total_count": 0,
-                "total_pages": 0,
-                "products": []
-            })
-
-        total_count = products[0].pop("total_count", 0)
-        total_pages = math.ceil(total_count / 20)
-
-        return JsonResponse({
+        index = search.get_fresh_index(await aget_catalog_version())
+        if index is not None:
+            total_count, products = await sync_to_async(search.search_page, thread_sensitive=False)(
+                index, query, page_int, page_size, min_discount
+            )
+        else:
+            # The index is (re)loading: answer from the database meanwhile, in
+            # the same shape but unranked
+            matches = search.database_matches(query, min_discount)
+            total_count = await matches.acount()
+            offset = (page_int - 1) * page_size
+            products = [
+                serialize(row)
+                async for row in matches.order_by("sort_name", "id").values(*PRODUCT_FIELDS)[offset:offset + page_size]
+            ]
+
+        response = JsonResponse({
             "status": "success",
             "page": page_int,
-            "page_size": 20,
+            "page_size": page_size,
             "total_count": total_count,
-            "total_pages": total_pages,
+            "total_pages": math.ceil(total_count / page_size),
             "products": products
         }, status=200)
+        if index is None:
+            # Not the ranked page the catalog ETag stands for: don't let it be cached as one
+            response["Cache-Control"] = "no-store"
+        return response
 
-    except ValueError:
-        return JsonResponse({"status": "error", "message": "min_discount must be an integer"}, status=400)
-    except Exception as e:
-        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+    except Exception:
+        logger.exception("Product search failed")
+        return JsonResponse({"status": "error", "message": "Could not search products. Try again later."}, status=500)
 
 
 
 
 @require_http_methods(["GET"])
-def get_categories(request):
+@catalog_cached(max_age=60)
+async def autocomplete_view(request):
+    query = request.GET.get("q", "").strip()
+    try:
+        limit = int(request.GET.get("limit", "8"))
+        if not 1 <= limit <= autocomplete.MAX_LIMIT:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({"status": "error", "message": f"limit must be an integer between 1 and {autocomplete.MAX_LIMIT}"}, status=400)
+
+    if not query:
+        return JsonResponse({"status": "success", "query": query, "suggestions": []})
+
+    index, stale = autocomplete.get_index(await aget_catalog_version())
+    if index is not None:
+        suggestions = autocomplete.suggest(index, query, limit)
+    else:
+        # First request of this worker: the index is still being built
+        suggestions = [
+            {"text": name, "type": "product", "id": product_id}
+            async for product_id, name in product_queryset()
+            .filter(name__istartswith=query)
+            .order_by("-discount", "id")
+            .values_list("id", "name")[:limit]
+        ]
+    response = JsonResponse({"status": "success", "query": query, "suggestions": suggestions})
+    if stale:
+        # Not the suggestions the catalog ETag stands for: don't let it be cached as them
+        response["Cache-Control"] = "no-store"
+    return response
+
+
+@require_http_methods(["GET"])
+async def get_catalog_changes(request):
     try:
-        response = supabase.rpc("get_categories").execute()
+        since = int(request.GET.get("since", "0"))
+        limit = int(request.GET.get("limit", changes.DEFAULT_LIMIT))
+        if since < 0 or not 1 <= limit <= changes.MAX_LIMIT:
+            raise ValueError
+    except ValueError:
         return JsonResponse(
-            {"status": "success", "data": response.data or []},
-            status=200
+            {"status": "error", "message": f"since must be a non-negative integer and limit between 1 and {changes.MAX_LIMIT}"},
+            status=400,
+        )
+
+    try:
+        return JsonResponse(await changes.changes_since(since, limit))
+    except Exception:
+        return JsonResponse({"status": "error", "message": "Could not load changes. Try again later."}, status=500)
+
+
+@require_http_methods(["GET"])
+@catalog_cached(max_age=60 * 5)
+async def get_categories(request):
+    try:
+        prepared = await acached_json(
+            get_async_supabase(), "get_categories", render=lambda data: {"status": "success", "data": data or []}
         )
+        return prepared_response(request, prepared)
     except Exception as e:
         # return JsonResponse({"status": "error", "message": str(e)}, status=500)  # DEV
         return JsonResponse(
@@ -145,50 +254,143 @@ def get_categories(request):
         )
     
 import requests
-from django.http import StreamingHttpResponse, HttpResponse
-from .models import Product
+from django.core.exceptions import ValidationError
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date
+from .models import Product, Category, Banner
+from . import image_cache
 
 DRIVE_BASE_URL = "https://drive.google.com/thumbnail?id="  # or uc?id= for full image
+DRIVE_DOWNLOAD_URL = "https://drive.google.com/uc?export=download&id="
 DEFAULT_WIDTH = 800
 DEFAULT_HEIGHT = 800
+MAX_DIMENSION = 2000
+
+# Images are addressed by an immutable Drive file id (or image_uuid, which is
+# regenerated on every upload), so clients and CDNs may keep them forever.
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# The home feed changes with prices, so clients revalidate it on every launch
+HOME_FEED_CACHE_CONTROL = "no-cache"
+
+# Reused across requests so Drive connections are kept alive.
+drive_session = requests.Session()
+drive_session.headers["User-Agent"] = "Mozilla/5.0"
+
+
+def find_image_by_uuid(uuid_val):
+    """Return (google_file_id, image_renditions) for a product, category or banner image."""
+    for model in (Product, Category, Banner):
+        try:
+            return model.objects.values_list("google_file_id", "image_renditions").get(image_uuid=uuid_val)
+        except model.DoesNotExist:
+            continue
+    return None
+
+
+def pick_rendition(renditions, fmt, width):
+    """Snap width to the smallest pre-encoded rendition that covers it (else the largest)."""
+    widths = sorted(int(w) for w in renditions.get(fmt, {}))
+    if not widths:
+        return None, None
+    chosen = next((w for w in widths if w >= width), widths[-1])
+    return renditions[fmt][str(chosen)], chosen
+
+
+def parse_dimension(value, default):
+    if value in (None, ""):
+        return default
+    value = int(value)
+    if not 1 <= value <= MAX_DIMENSION:
+        raise ValueError
+    return value
 
+
+@require_http_methods(["GET", "HEAD"])
 def stream_drive_image(request):
     file_id = request.GET.get("id")
     uuid_val = request.GET.get("uuid")
 
     # Width and height from query params, fallback to defaults
-    width = request.GET.get("w", DEFAULT_WIDTH)
-    height = request.GET.get("h", DEFAULT_HEIGHT)
+    try:
+        width = parse_dimension(request.GET.get("w"), DEFAULT_WIDTH)
+        height = parse_dimension(request.GET.get("h"), DEFAULT_HEIGHT)
+    except ValueError:
+        return HttpResponse(f"w and h must be integers between 1 and {MAX_DIMENSION}", status=400)
+
+    if not file_id and not uuid_val:
+        return HttpResponse("Missing id or uuid param", status=400)
 
-    # If UUID is provided, look up the corresponding product
+    # Clients that accept WebP get the WebP rendition, others the JPEG fallback
+    fmt = "webp" if "image/webp" in request.headers.get("Accept", "") else "jpeg"
+
+    # The URL identity alone decides the ETag, so revalidation needs no lookup
+    etag = '"%s"' % image_cache.cache_key(uuid_val or file_id, width, f"{height}.{fmt}")
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        response["Cache-Control"] = IMAGE_CACHE_CONTROL
+        response["Vary"] = "Accept"
+        return response
+
+    renditions = {}
+    # If UUID is provided, look up the corresponding product, category or banner
     if uuid_val:
         try:
-            product = Product.objects.get(image_uuid=uuid_val)
-            file_id = product.google_file_id
-        except Product.DoesNotExist:
+            found = find_image_by_uuid(uuid_val)
+        except ValidationError:
+            found = None
+        if found is None:
             return HttpResponse("Image not found", status=404)
+        file_id, renditions = found
 
     if not file_id:
-        return HttpResponse("Missing id or uuid param", status=400)
+        return HttpResponse("Image not found", status=404)
 
-    # Build Drive URL with sz parameter
-    url = f"{DRIVE_BASE_URL}{file_id}&sz=w{width}-h{height}"
+    rendition_id, rendition_width = pick_rendition(renditions or {}, fmt, width)
+    if rendition_id:
+        # Pre-encoded at upload time: fetch it as-is, no resizing by Drive
+        key = image_cache.cache_key(rendition_id, rendition_width, fmt)
+        url = f"{DRIVE_DOWNLOAD_URL}{rendition_id}"
+    else:
+        key = image_cache.cache_key(file_id, width, height)
+        # Build Drive URL with sz parameter
+        url = f"{DRIVE_BASE_URL}{file_id}&sz=w{width}-h{height}"
 
-    try:
-        resp = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, stream=True, timeout=20)
-    except requests.RequestException as e:
-        return HttpResponse(f"Error fetching image: {e}", status=500)
+    cached = image_cache.get_cached_image(key)
+
+    if cached is None:
+        try:
+            resp = drive_session.get(url, stream=True, timeout=20)
+        except requests.RequestException as e:
+            return HttpResponse(f"Error fetching image: {e}", status=500)
+
+        with resp:
+            if resp.status_code != 200:
+                return HttpResponse("Image not found", status=resp.status_code)
 
-    if resp.status_code != 200:
-        return HttpResponse("Image not found", status=resp.status_code)
+            content_type = resp.headers.get("Content-Type", "image/jpeg")
+            if rendition_id:
+                content_type = f"image/{fmt}"
+            try:
+                path = image_cache.store_image(key, resp.iter_content(chunk_size=64 * 1024), content_type)
+            except (requests.RequestException, image_cache.ImageTooLarge) as e:
+                return HttpResponse(f"Error fetching image: {e}", status=502)
+        cached = (path, content_type)
 
-    content_type = resp.headers.get("Content-Type", "image/jpeg")
-    return StreamingHttpResponse(resp.iter_content(chunk_size=1024), content_type=content_type)
+    path, content_type = cached
+    # FileResponse hands the open file to the server's file wrapper (sendfile)
+    response = FileResponse(open(path, "rb"), content_type=content_type)
+    response["ETag"] = etag
+    response["Cache-Control"] = IMAGE_CACHE_CONTROL
+    response["Last-Modified"] = http_date(os.path.getmtime(path))
+    response["Vary"] = "Accept"
+    return response
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
-def best_deals_view(request):
+async def best_deals_view(request):
     try:
         # Extract query params
         category_id = request.GET.get("category_id")
@@ -204,27 +406,12 @@ def best_deals_view(request):
                     "message": "Invalid category_id"
                 }, status=400)
 
-        # Call Supabase RPC
-        response = supabase.rpc(
-            "get_home_data",
-            {
-                "p_category_id": category_id,
-                "p_category_name": category_name
-            }
-        ).execute()
-
-        # Handle Supabase errors
-        if hasattr(response, "error") and response.error:
-            return JsonResponse({
-                "status": "error",
-                "message": str(response.error)
-            }, status=500)
+        if category_name is not None:
+            category_name = category_name.strip() or None
 
-        # Return response data
-        return JsonResponse({
-            "status": "success",
-            "data": response.data
-        }, safe=False, status=200)
+        # Pre-serialized snapshot, rebuilt whenever the catalog changes
+        snapshot = await home_feed.aget_snapshot(category_id, category_name)
+        return prepared_response(request, snapshot, cache_control=HOME_FEED_CACHE_CONTROL)
 
     except Exception as e:
         return JsonResponse({
@@ -234,14 +421,13 @@ def best_deals_view(request):
     
 
 @csrf_exempt
-def get_banners(request):
+@catalog_cached(max_age=60 * 5)
+async def get_banners(request):
     try:
-        response = supabase.rpc("get_banners").execute()
-
-        if hasattr(response, "error") and response.error:
-            return JsonResponse({"status": "error", "message": response.error.message}, status=400)
-
-        return JsonResponse({"status": "success", "data": response.data}, safe=False)
+        prepared = await acached_json(
+            get_async_supabase(), "get_banners", render=lambda data: {"status": "success", "data": data}
+        )
+        return prepared_response(request, prepared)
 
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
\ No newline at end of file
@@ -1,11 +1,14 @@
 from django.contrib import admin
+from store.admin_utils import AutocompleteFilter, AutocompleteFilterMixin, LargeTableAdminMixin
 from .models import Address, CartItem, WishlistItem
 
 
 @admin.register(Address)
 class AddressAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'full_name', 'phone_number', 'city', 'pincode', 'created_at')
-    search_fields = ('full_name', 'phone_number', 'city', 'pincode', 'user__email', 'user__username')
+    list_select_related = ('user',)
+    search_fields = ('full_name', 'phone_number', 'city', 'pincode', '=user__phone_number')
+    autocomplete_fields = ('user',)
     list_filter = ('city', 'created_at')
     ordering = ('-created_at',)
     readonly_fields = ('created_at', 'updated_at')
@@ -13,10 +16,12 @@ class AddressAdmin(admin.ModelAdmin):
 
 
 @admin.register(CartItem)
-class CartItemAdmin(admin.ModelAdmin):
+class CartItemAdmin(LargeTableAdminMixin, AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'product', 'quantity', 'subtotal', 'added_at')
-    search_fields = ('user__email', 'user__username', 'product__name')
-    list_filter = ('added_at',)
+    list_select_related = ('user', 'product')
+    search_fields = ('=user__phone_number', 'product__name')
+    list_filter = (('product', AutocompleteFilter), 'added_at')
+    autocomplete_fields = ('user', 'product')
     ordering = ('-added_at',)
     readonly_fields = ('added_at',)
     list_per_page = 20
@@ -27,10 +32,12 @@ class CartItemAdmin(admin.ModelAdmin):
 
 
 @admin.register(WishlistItem)
-class WishlistItemAdmin(admin.ModelAdmin):
+class WishlistItemAdmin(LargeTableAdminMixin, AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'product', 'added_at')
-    search_fields = ('user__email', 'user__username', 'product__name')
-    list_filter = ('added_at',)
+    list_select_related = ('user', 'product')
+    search_fields = ('=user__phone_number', 'product__name')
+    list_filter = (('product', AutocompleteFilter), 'added_at')
+    autocomplete_fields = ('user', 'product')
     ordering = ('-added_at',)
     readonly_fields = ('added_at',)
     list_per_page = 20
@@ -0,0 +1,182 @@
+"""
+Cart snapshots and batched cart mutations.
+
+get_cart responses are cached per user as a PreparedJSON tagged with the
+user's cart version, which is also the response ETag, so polling clients
+get 304s without an RPC. Any change to a cart drops the version (the next
+read starts a new one): the cart endpoints do it after each successful
+mutation, and signals.py does it for every cart holding a product whose
+price, stock or availability changed, found through the CartItem.product
+index; CartItem signals catch admin edits and import_catalog invalidates
+the products it writes. Versions expire with the snapshots, so changes made
+outside Django (the create_order RPC cutting stock) show within
+CART_SNAPSHOT_TTL. Cart keys live in the "shared" cache, not the tiered
+default, so no worker serves a version another worker already dropped.
+
+A cart/batch/ batch is a list of {"op": "add" | "set" | "remove",
+"product_id", "quantity"} operations applied in order. They are folded into
+one final quantity per product, checked against the products' stock, then
+written in a single transaction as one upsert on the (user, product) pair
+plus one delete, whatever the number of items. The endpoint answers with
+the get_cart RPC's payload, so clients parse one cart shape.
+
+The batch writes CartItem rows directly instead of going through the
+add_to_cart / update_cart_quantity / remove_from_cart RPCs, so it has to
+enforce the same rules they do:
+  - add adds a positive quantity to what is in the cart (or starts at 0),
+  - set replaces the quantity, and set 0 removes the item like remove does,
+  - removing an item that isn't in the cart is a no-op,
+  - the product must exist and be active, and
+  - the resulting quantity may not exceed the product's stock.
+CartBatchTests checks each rule; a rule changed in the RPCs (which live in
+Supabase, not in this repository) has to be changed in apply_operations too.
+"""
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from authentication.models import User
+from store.models import Product
+from .models import CartItem
+
+MAX_OPERATIONS = 100
+OPERATIONS = ("add", "set", "remove")
+# Column ranges of CartItem.quantity (integer) and the product ids (bigint)
+MAX_QUANTITY = 2**31 - 1
+MAX_PRODUCT_ID = 2**63 - 1
+
+# Product fields a cart shows; editing any of them invalidates the carts holding it
+CART_PRODUCT_FIELDS = ("name", "original_price", "discounted_price", "stock", "is_active", "image_uuid")
+INVALIDATE_BATCH_SIZE = 1000
+
+
+def get_snapshot_ttl():
+    return getattr(settings, "CART_SNAPSHOT_TTL", 60 * 10)
+
+
+def version_key(user_id):
+    return f"cart:{user_id}:version"
+
+
+def snapshot_key(user_id):
+    return f"cart:{user_id}:snapshot"
+
+
+def cart_etag(user_id, version):
+    return f'"cart-{user_id}-{version}"'
+
+
+async def aget_version(user_id):
+    cache = caches["shared"]
+    version = await cache.aget(version_key(user_id))
+    if version is None:
+        # A clock value, so a dropped version never comes back as the same number
+        await cache.aadd(version_key(user_id), int(time.time() * 1000), timeout=get_snapshot_ttl())
+        version = await cache.aget(version_key(user_id))
+    return version
+
+
+async def aget_snapshot(user_id, version):
+    """The cached PreparedJSON of the cart at `version`, or None."""
+    snapshot = await caches["shared"].aget(snapshot_key(user_id))
+    if snapshot is not None and snapshot[0] == version:
+        return snapshot[1]
+    return None
+
+
+async def aset_snapshot(user_id, version, prepared):
+    await caches["shared"].aset(snapshot_key(user_id), (version, prepared), timeout=get_snapshot_ttl())
+
+
+def invalidate(user_ids):
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), INVALIDATE_BATCH_SIZE):
+        caches["shared"].delete_many([version_key(user_id) for user_id in user_ids[start:start + INVALIDATE_BATCH_SIZE]])
+
+
+async def ainvalidate(user_ids):
+    await caches["shared"].adelete_many([version_key(user_id) for user_id in user_ids])
+
+
+def invalidate_product_carts(product_ids):
+    """Invalidate every cart that holds one of these products."""
+    invalidate(CartItem.objects.filter(product_id__in=product_ids).values_list("user_id", flat=True).distinct().iterator())
+
+
+class InvalidBatch(ValueError):
+    pass
+
+
+def parse_operations(operations):
+    """[(op, product id, quantity)] from a request body, or InvalidBatch."""
+    if not isinstance(operations, list) or not operations:
+        raise InvalidBatch("operations must be a non-empty list")
+    if len(operations) > MAX_OPERATIONS:
+        raise InvalidBatch(f"At most {MAX_OPERATIONS} operations per batch")
+
+    parsed = []
+    for i, operation in enumerate(operations):
+        try:
+            op = operation["op"]
+            product_id = int(operation["product_id"])
+            quantity = int(operation.get("quantity", 1 if op == "add" else 0))
+        except (TypeError, KeyError, ValueError):
+            raise InvalidBatch(f"operations[{i}] needs op, an integer product_id and an integer quantity")
+        if op not in OPERATIONS:
+            raise InvalidBatch(f"operations[{i}].op must be one of {', '.join(OPERATIONS)}")
+        if not 0 < product_id <= MAX_PRODUCT_ID:
+            raise InvalidBatch(f"operations[{i}].product_id is not a valid product id")
+        if quantity < 0 or (op == "add" and quantity == 0):
+            raise InvalidBatch(f"operations[{i}].quantity must be positive")
+        if quantity > MAX_QUANTITY:
+            raise InvalidBatch(f"operations[{i}].quantity must be at most {MAX_QUANTITY}")
+        parsed.append((op, product_id, quantity))
+    return parsed
+
+
+def fold(operations, current):
+    """Final quantity per touched product (0 = not in cart), given current quantities."""
+    quantities = {}
+    for op, product_id, quantity in operations:
+        before = quantities.get(product_id, current.get(product_id, 0))
+        if op == "add":
+            quantities[product_id] = before + quantity
+        elif op == "set":
+            quantities[product_id] = quantity
+        else:
+            quantities[product_id] = 0
+    return quantities
+
+
+def apply_operations(user_id, operations):
+    """Apply parsed operations to a user's cart, or raise InvalidBatch and change nothing."""
+    product_ids = {product_id for _, product_id, _ in operations}
+    with transaction.atomic():
+        # Serializes concurrent batches of one user, so "add" never loses an increment
+        User.objects.select_for_update().filter(pk=user_id).values_list("pk").first()
+        current = dict(
+            CartItem.objects.filter(user_id=user_id, product_id__in=product_ids).values_list("product_id", "quantity")
+        )
+        quantities = fold(operations, current)
+
+        keep = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+        stock = dict(Product.objects.filter(id__in=keep, is_active=True).values_list("id", "stock"))
+        unknown = sorted(set(keep) - set(stock))
+        if unknown:
+            raise InvalidBatch(f"Unknown or unavailable products: {', '.join(map(str, unknown))}")
+        # Checked after folding: several "add"s can overshoot together
+        short = sorted(product_id for product_id, quantity in keep.items() if quantity > min(stock[product_id], MAX_QUANTITY))
+        if short:
+            raise InvalidBatch(f"Not enough stock for products: {', '.join(map(str, short))}")
+
+        changed = {product_id: quantity for product_id, quantity in keep.items() if current.get(product_id) != quantity}
+        if changed:
+            CartItem.objects.bulk_create(
+                [CartItem(user_id=user_id, product_id=product_id, quantity=quantity) for product_id, quantity in changed.items()],
+                update_conflicts=True,
+                unique_fields=["user", "product"],
+                update_fields=["quantity"],
+            )
+        removed = [product_id for product_id, quantity in quantities.items() if quantity == 0 and product_id in current]
+        if removed:
+            CartItem.objects.filter(user_id=user_id, product_id__in=removed).delete()
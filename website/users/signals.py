@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from store.models import Product
+from .cart import CART_PRODUCT_FIELDS, invalidate, invalidate_product_carts
+from .models import CartItem
+
+
+@receiver(pre_save, sender=Product)
+def remember_cart_fields(sender, instance, **kwargs):
+    instance._cart_fields_before = None
+    if instance.pk:
+        instance._cart_fields_before = Product.objects.filter(pk=instance.pk).values_list(*CART_PRODUCT_FIELDS).first()
+
+
+@receiver(post_save, sender=Product)
+def invalidate_carts_on_product_change(sender, instance, created, **kwargs):
+    before = getattr(instance, "_cart_fields_before", None)
+    if created or before == tuple(getattr(instance, field) for field in CART_PRODUCT_FIELDS):
+        return
+    product_id = instance.pk
+    transaction.on_commit(lambda: invalidate_product_carts([product_id]))
+
+
+@receiver(pre_delete, sender=Product)
+def invalidate_carts_on_product_delete(sender, instance, **kwargs):
+    # Read now: the cascade deletes the cart items before on_commit runs
+    user_ids = list(CartItem.objects.filter(product_id=instance.pk).values_list("user_id", flat=True))
+    transaction.on_commit(lambda: invalidate(user_ids))
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_cart_on_item_change(sender, instance, **kwargs):
+    # Admin edits and cascades; the cart endpoints invalidate on their own
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate([user_id]))
@@ -1,3 +1,167 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from authentication.models import User
+from store.models import Category, Product
+from website.tests import CacheIsolationMixin
+from . import cart
+from .models import CartItem
 
-# Create your tests here.
+
+def rpc_returning(data):
+    client = mock.Mock()
+    client.rpc.return_value.execute = mock.AsyncMock(return_value=mock.Mock(data=data, error=None))
+    return client
+
+
+class CartBatchTests(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(phone_number="9000000101")
+        category = Category.objects.create(name="Fruits")
+        cls.mango = Product.objects.create(category=category, name="Mango", original_price=100, discounted_price=90, stock=10)
+        cls.apple = Product.objects.create(category=category, name="Apple", original_price=50, discounted_price=50, stock=3)
+        cls.hidden = Product.objects.create(category=category, name="Old", original_price=50, discounted_price=50, stock=5, is_active=False)
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(user=self.user).values_list("product_id", "quantity"))
+
+    def batch(self, operations, client=None):
+        client = client or rpc_returning([])
+        with mock.patch("users.views.get_async_supabase", return_value=client):
+            return self.client.post(
+                "/user/cart/batch/", {"operations": operations},
+                content_type="application/json", HTTP_AUTHTOKEN=str(self.user.user_token),
+            )
+
+    def test_fold(self):
+        operations = [("add", 1, 2), ("add", 1, 1), ("set", 2, 5), ("remove", 3, 0), ("add", 2, 1)]
+        self.assertEqual(cart.fold(operations, {1: 1, 3: 4}), {1: 4, 2: 6, 3: 0})
+
+    def test_upsert_and_remove(self):
+        CartItem.objects.create(user=self.user, product=self.apple, quantity=1)
+        cart.apply_operations(self.user.pk, [("add", self.mango.pk, 2), ("add", self.apple.pk, 1), ("add", self.mango.pk, 1)])
+        self.assertEqual(self.quantities(), {self.mango.pk: 3, self.apple.pk: 2})
+
+        cart.apply_operations(self.user.pk, [("set", self.mango.pk, 5), ("remove", self.apple.pk, 0)])
+        self.assertEqual(self.quantities(), {self.mango.pk: 5})
+
+    def test_response_is_the_get_cart_payload(self):
+        client = rpc_returning([{"product_id": self.mango.pk, "quantity": 2}])
+        response = self.batch([{"op": "add", "product_id": self.mango.pk, "quantity": 2}], client)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"], [{"product_id": self.mango.pk, "quantity": 2}])
+        self.assertEqual(client.rpc.call_args.args, ("get_cart", {"auth_token": str(self.user.user_token)}))
+        self.assertEqual(self.quantities(), {self.mango.pk: 2})
+
+    def test_rules_shared_with_the_cart_rpcs(self):
+        # One case per rule in the cart module docstring: (cart before, operation, cart after or None if rejected)
+        cases = [
+            ({}, ("add", self.mango, 2), {self.mango.pk: 2}),
+            ({self.mango: 2}, ("add", self.mango, 3), {self.mango.pk: 5}),
+            ({self.mango: 2}, ("set", self.mango, 7), {self.mango.pk: 7}),
+            ({self.mango: 2}, ("set", self.mango, 0), {}),
+            ({self.mango: 2}, ("remove", self.mango, 0), {}),
+            ({}, ("remove", self.mango, 0), {}),
+            ({}, ("add", self.hidden, 1), None),
+            ({self.apple: 3}, ("add", self.apple, 1), None),
+            ({}, ("set", self.apple, 4), None),
+            ({}, ("add", self.mango, 0), None),
+        ]
+        for before, (op, product, quantity), after in cases:
+            with self.subTest(op=op, product=product.name, quantity=quantity, before=before):
+                CartItem.objects.filter(user=self.user).delete()
+                for item, count in before.items():
+                    CartItem.objects.create(user=self.user, product=item, quantity=count)
+                response = self.batch([{"op": op, "product_id": product.pk, "quantity": quantity}])
+                if after is None:
+                    self.assertEqual(response.status_code, 400)
+                    after = {item.pk: count for item, count in before.items()}
+                else:
+                    self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.quantities(), after)
+
+    def test_failures_are_logged(self):
+        with mock.patch.object(cart, "apply_operations", side_effect=RuntimeError("deadlock")), \
+                self.assertLogs("users.views", "ERROR") as logs:
+            response = self.batch([{"op": "add", "product_id": self.mango.pk}])
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("deadlock", logs.output[0])
+
+    def test_invalid_batches_change_nothing(self):
+        CartItem.objects.create(user=self.user, product=self.apple, quantity=2)
+        batches = [
+            # Each add fits the stock of 3, together they don't
+            [{"op": "add", "product_id": self.apple.pk, "quantity": 1}, {"op": "add", "product_id": self.apple.pk, "quantity": 1}],
+            [{"op": "set", "product_id": self.mango.pk, "quantity": cart.MAX_QUANTITY + 1}],
+            [{"op": "add", "product_id": 2**63}],
+            [{"op": "add", "product_id": self.hidden.pk}],
+            [{"op": "set", "product_id": self.mango.pk, "quantity": -1}],
+            [{"op": "clear", "product_id": self.mango.pk}],
+            [],
+        ]
+        for operations in batches:
+            with self.subTest(operations=json.dumps(operations)):
+                response = self.batch(operations)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(self.quantities(), {self.apple.pk: 2})
+
+
+class CartInvalidationTests(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(phone_number="9000000102")
+        cls.category = Category.objects.create(name="Fruits")
+        cls.mango = Product.objects.create(category=cls.category, name="Mango", original_price=100, discounted_price=90, stock=10)
+        cls.item = CartItem.objects.create(user=cls.user, product=cls.mango, quantity=1)
+
+    def version(self):
+        return async_to_sync(cart.aget_version)(self.user.pk)
+
+    def assertInvalidates(self, change):
+        before = self.version()
+        # Catalog changes also start a home feed rebuild thread, not wanted here;
+        # patched outside the capture, which runs the callbacks on exit
+        with mock.patch("store.home_feed.rebuild_in_background"), self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertIsNone(caches["shared"].get(cart.version_key(self.user.pk)))
+        time.sleep(0.002)
+        self.assertNotEqual(self.version(), before)
+
+    def test_cart_item_edits(self):
+        def edit():
+            self.item.quantity = 3
+            self.item.save()
+
+        self.assertInvalidates(edit)
+        self.assertInvalidates(self.item.delete)
+
+    def test_product_price_change(self):
+        def reprice():
+            self.mango.discounted_price = 80
+            self.mango.save()
+
+        self.assertInvalidates(reprice)
+
+    def test_import_catalog(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "catalog.csv")
+            with open(path, "w") as f:
+                f.write("type,name,category,original_price,discounted_price,stock\nproduct,Mango,Fruits,100,70,4\n")
+            self.assertInvalidates(lambda: call_command("import_catalog", path, stdout=io.StringIO(), stderr=io.StringIO()))
+        self.mango.refresh_from_db()
+        self.assertEqual((self.mango.discounted_price, self.mango.stock), (70, 4))
+
+    @override_settings(CART_SNAPSHOT_TTL=1)
+    def test_version_expires_with_the_snapshot(self):
+        # Changes made outside Django (the create_order RPC) show within the TTL
+        before = self.version()
+        time.sleep(1.1)
+        self.assertNotEqual(self.version(), before)
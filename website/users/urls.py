@@ -14,4 +14,5 @@ urlpatterns = [
     path("cart/remove/", remove_from_cart, name="remove_from_cart"),
     path("cart/", get_cart, name="get_cart"),
     path("cart/update-quantity/", update_cart_quantity, name="update_cart_quantity"),
+    path("cart/batch/", cart_batch, name="cart_batch"),
 ]
\ No newline at end of file
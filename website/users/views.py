@@ -1,12 +1,16 @@
-from supabase import create_client
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from website.responses import PreparedJSON, prepared_response
+from website.supabase_client import get_async_supabase
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.conf import settings
 import json
+import logging
 import uuid
+from . import cart
 
-supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+logger = logging.getLogger(__name__)
 
 def get_valid_auth_token(request):
     token = request.headers.get("AuthToken")
@@ -24,9 +28,9 @@ def parse_request_body(request):
     except json.JSONDecodeError:
         return None, JsonResponse({"status": "error", "message": "Invalid JSON body"}, status=400)
 
-def handle_supabase_rpc(function_name, params, success_message, error_message, raw=False):
+async def handle_supabase_rpc(function_name, params, success_message, error_message, raw=False):
     try:
-        resp = supabase.rpc(function_name, params).execute()
+        resp = await get_async_supabase().rpc(function_name, params).execute()
         if getattr(resp, "error", None):
             # 👇 TEMP: print to server logs
             print(f"[Supabase RPC Error] {function_name} => {resp.error}")
@@ -53,7 +57,7 @@ def handle_supabase_rpc(function_name, params, success_message, error_message, r
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def add_address(request):
+async def add_address(request):
     body, error = parse_request_body(request)
     if error: return error
 
@@ -64,7 +68,7 @@ def add_address(request):
     if any(f not in body for f in required_fields):
         return JsonResponse({"status": "error", "message": "All address fields are required"}, status=400)
 
-    return handle_supabase_rpc(
+    return await handle_supabase_rpc(
         "add_address",
         {
             "auth_token": auth_token,
@@ -83,10 +87,10 @@ def add_address(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
-def get_addresses(request):
+async def get_addresses(request):
     auth_token, error = get_valid_auth_token(request)
     if error: return error
-    return handle_supabase_rpc(
+    return await handle_supabase_rpc(
         "get_addresses",
         {"auth_token": auth_token},
         "Addresses fetched successfully",
@@ -95,7 +99,7 @@ def get_addresses(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def delete_address(request):
+async def delete_address(request):
     body, error = parse_request_body(request)
     if error: return error
 
@@ -106,7 +110,7 @@ def delete_address(request):
     if not address_id:
         return JsonResponse({"status": "error", "message": "address_id is required"}, status=400)
 
-    return handle_supabase_rpc(
+    return await handle_supabase_rpc(
         "delete_address",
         {"auth_token": auth_token, "p_address_id": int(address_id)},
         "Address deleted successfully",
@@ -116,7 +120,7 @@ def delete_address(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def edit_address(request):
+async def edit_address(request):
     body, error = parse_request_body(request)
     if error: return error
 
@@ -127,7 +131,7 @@ def edit_address(request):
     if not address_id:
         return JsonResponse({"status": "error", "message": "address_id is required"}, status=400)
 
-    return handle_supabase_rpc(
+    return await handle_supabase_rpc(
         "edit_address",
         {
             "auth_token": auth_token,
@@ -147,7 +151,7 @@ def edit_address(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def add_to_wishlist(request):
+async def add_to_wishlist(request):
     body, error = parse_request_body(request)
     if error: return error
 
@@ -158,7 +162,7 @@ def add_to_wishlist(request):
     if not product_id:
         return JsonResponse({"status": "error", "message": "product_id is required"}, status=400)
 
-    return handle_supabase_rpc(
+    return await handle_supabase_rpc(
         "add_to_wishlist",
         {"auth_token": auth_token, "p_product_id": int(product_id)},
         "Added to wishlist",
@@ -168,7 +172,7 @@ def add_to_wishlist(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def remove_from_wishlist(request):
+async def remove_from_wishlist(request):
     body, error = parse_request_body(request)
     if error: return error
 
@@ -179,7 +183,7 @@ def remove_from_wishlist(request):
     if not product_id:
         return JsonResponse({"status": "error", "message": "product_id is required"}, status=400)
 
-    return handle_supabase_rpc(
+    return await handle_supabase_rpc(
         "remove_from_wishlist",
         {"auth_token": auth_token, "p_product_id": int(product_id)},
         "Removed from wishlist",
@@ -188,12 +192,12 @@ def remove_from_wishlist(request):
     )
 
 @require_http_methods(["GET"])
-def get_wishlist(request):
+async def get_wishlist(request):
     auth_token, error = get_valid_auth_token(request)
     if error: return error
 
     try:
-        resp = supabase.rpc("get_wishlist", {"auth_token": auth_token}).execute()
+        resp = await get_async_supabase().rpc("get_wishlist", {"auth_token": auth_token}).execute()
         if getattr(resp, "error", None):
             return JsonResponse({
                 # "error": resp.error.message,  # debug
@@ -206,9 +210,21 @@ def get_wishlist(request):
             "error": "Cannot fetch wishlist, please try again later"
         }, status=500)
 
+def cart_headers(response, etag):
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    patch_vary_headers(response, ["AuthToken"])
+    return response
+
+async def invalidating_cart(request, response):
+    """Drop the user's cart snapshot after a successful cart mutation."""
+    if response.status_code == 200 and request.auth_user_id is not None:
+        await cart.ainvalidate([request.auth_user_id])
+    return response
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def add_to_cart(request):
+async def add_to_cart(request):
     body, error = parse_request_body(request)
     if error: return error
 
@@ -220,17 +236,17 @@ def add_to_cart(request):
     if not product_id:
         return JsonResponse({"status": "error", "message": "product_id is required"}, status=400)
 
-    return handle_supabase_rpc(
+    return await invalidating_cart(request, await handle_supabase_rpc(
         "add_to_cart",
         {"auth_token": auth_token, "p_product_id": int(product_id), "p_quantity": int(quantity)},
         "Added to cart",
         "Cannot add to cart, try again later",
         raw=True
-    )
+    ))
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def remove_from_cart(request):
+async def remove_from_cart(request):
     body, error = parse_request_body(request)
     if error: return error
 
@@ -241,29 +257,44 @@ def remove_from_cart(request):
     if not product_id:
         return JsonResponse({"status": "error", "message": "product_id is required"}, status=400)
 
-    return handle_supabase_rpc(
+    return await invalidating_cart(request, await handle_supabase_rpc(
         "remove_from_cart",
         {"auth_token": auth_token, "p_product_id": int(product_id)},
         "Removed from cart",
         "Cannot remove from cart, try again later",
         raw=True
-    )
+    ))
 
 @csrf_exempt
 @require_http_methods(["GET"])
-def get_cart(request):
+async def get_cart(request):
     auth_token, error = get_valid_auth_token(request)
     if error: return error
-    return handle_supabase_rpc(
-        "get_cart",
-        {"auth_token": auth_token},
-        "Cart fetched successfully",
-        "Cannot fetch cart, try again later"
-    )
+
+    # Snapshot of the cart, tagged with a version every cart change drops
+    user_id = request.auth_user_id
+    version = await cart.aget_version(user_id)
+    etag = cart.cart_etag(user_id, version)
+    if etag in request.headers.get("If-None-Match", ""):
+        return cart_headers(HttpResponseNotModified(), etag)
+
+    prepared = await cart.aget_snapshot(user_id, version)
+    if prepared is None:
+        response = await handle_supabase_rpc(
+            "get_cart",
+            {"auth_token": auth_token},
+            "Cart fetched successfully",
+            "Cannot fetch cart, try again later"
+        )
+        if response.status_code != 200:
+            return response
+        prepared = PreparedJSON(response.content)
+        await cart.aset_snapshot(user_id, version, prepared)
+    return cart_headers(prepared_response(request, prepared), etag)
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def update_cart_quantity(request):
+async def update_cart_quantity(request):
     body, error = parse_request_body(request)
     if error: return error
 
@@ -275,17 +306,47 @@ def update_cart_quantity(request):
     if not product_id or quantity is None:
         return JsonResponse({"status": "error", "message": "product_id and quantity are required"}, status=400)
 
-    return handle_supabase_rpc(
+    return await invalidating_cart(request, await handle_supabase_rpc(
         "update_cart_quantity",
         {"auth_token": auth_token, "p_product_id": int(product_id), "p_quantity": int(quantity)},
         "Cart updated successfully",
         "Cannot update cart, try again later",
         raw=True
+    ))
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def cart_batch(request):
+    body, error = parse_request_body(request)
+    if error: return error
+
+    auth_token, error = get_valid_auth_token(request)
+    if error: return error
+    # AuthTokenMiddleware has already resolved (or rejected) the token
+    if request.auth_user_id is None:
+        return JsonResponse({"status": "error", "message": "AuthToken is required"}, status=400)
+
+    try:
+        operations = cart.parse_operations(body.get("operations") if isinstance(body, dict) else None)
+        await sync_to_async(cart.apply_operations)(request.auth_user_id, operations)
+        await cart.ainvalidate([request.auth_user_id])
+    except cart.InvalidBatch as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    except Exception:
+        logger.exception("Cart batch failed")
+        return JsonResponse({"status": "error", "message": "Cannot update cart, try again later"}, status=500)
+
+    # The resulting cart, exactly as get_cart returns it
+    return await handle_supabase_rpc(
+        "get_cart",
+        {"auth_token": auth_token},
+        "Cart updated successfully",
+        "Cannot fetch cart, try again later"
     )
 
 
 @csrf_exempt
-def get_user_profile_view(request):
+async def get_user_profile_view(request):
     try:
         # Extract AuthToken
         auth_token = request.headers.get("AuthToken")
@@ -296,7 +357,7 @@ def get_user_profile_view(request):
             }, status=400)
 
         # Call Supabase RPC
-        response = supabase.rpc("get_user_profile", {"auth_token": auth_token}).execute()
+        response = await get_async_supabase().rpc("get_user_profile", {"auth_token": auth_token}).execute()
 
         if hasattr(response, "error") and response.error:
             return JsonResponse({
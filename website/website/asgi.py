@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'website.settings')
 
 application = get_asgi_application()
+
+# Async views share one pooled httpx.AsyncClient per worker loop
+from website.supabase_client import enable_async_pool  # noqa: E402
+
+enable_async_pool()
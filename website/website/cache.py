@@ -0,0 +1,334 @@
+"""
+Cache backends shared by the gunicorn workers.
+
+TieredCache keeps a small in-process LRU in front of another configured cache
+alias (SQLite file, Redis, ...) so hot keys are served from memory while every
+worker still sees the same data. SQLiteCache is a shared store that needs
+nothing beyond a writable path.
+"""
+import asyncio
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from django.core.cache import caches, cache as default_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from .runtime import private_dir
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    """
+    Read-through in-process LRU over a shared cache alias.
+
+    Local entries live at most LOCAL_TIMEOUT seconds, which bounds how long a
+    worker can keep serving a value another worker has replaced. Writes,
+    deletes and counters always go to the shared tier.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._shared_alias = options.get("SHARED_ALIAS", "shared")
+        self._local_max_entries = int(options.get("LOCAL_MAX_ENTRIES", 1000))
+        self._local_timeout = float(options.get("LOCAL_TIMEOUT", 5))
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # Local tier -------------------------------------------------------------
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            expires, pickled = entry
+            if expires <= time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def _local_set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        ttl = self._local_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            self._local_delete(key)
+            return
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, pickled)
+            self._local.move_to_end(key)
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+
+    # Cache API --------------------------------------------------------------
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._local_set(local_key, value)
+        return value
+
+    async def aget(self, key, default=None, version=None):
+        # Local hits are served on the event loop; only misses go to a thread
+        value = self._local_get(self.make_and_validate_key(key, version=version))
+        if value is not _MISSING:
+            return value
+        return await sync_to_async(self.get, thread_sensitive=False)(key, default, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout=timeout, version=version)
+        self._local_set(self.make_and_validate_key(key, version=version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout=timeout, version=version)
+        if added:
+            self._local_set(self.make_and_validate_key(key, version=version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.incr(key, delta, version=version)
+
+    def has_key(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        if self._local_get(local_key) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache stored in a single SQLite file, shared by every process on the host.
+
+    Unlike FileBasedCache, add() and incr() are atomic, so they can be used as
+    cross-process locks and counters. The file's directory must be private
+    to the user running the site (see website.runtime).
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._sets_since_cull = 0
+        self._cull_lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                # Values are unpickled: nobody else may be able to swap the file
+                private_dir(directory)
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entry "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _expired(self, expires):
+        return expires is not None and expires <= time.time()
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            "SELECT value, expires FROM cache_entry WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or self._expired(row[1]):
+            return default
+        return pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entry (key, value, expires) VALUES (?, ?, ?)",
+            (key, pickled, self.get_backend_timeout(timeout)),
+        )
+        self._maybe_cull(conn)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        conn = self._connection()
+        with _immediate(conn):
+            conn.execute(
+                "DELETE FROM cache_entry WHERE key = ? AND expires IS NOT NULL AND expires <= ?",
+                (key, time.time()),
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO cache_entry (key, value, expires) VALUES (?, ?, ?)",
+                (key, pickled, self.get_backend_timeout(timeout)),
+            )
+            return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            "UPDATE cache_entry SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        with _immediate(conn):
+            row = conn.execute(
+                "SELECT value, expires FROM cache_entry WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._expired(row[1]):
+                raise ValueError("Key '%s' not found" % key)
+            new_value = pickle.loads(row[0]) + delta
+            conn.execute(
+                "UPDATE cache_entry SET value = ? WHERE key = ?",
+                (pickle.dumps(new_value, self.pickle_protocol), key),
+            )
+        return new_value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute("DELETE FROM cache_entry WHERE key = ?", (key,))
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache_entry")
+
+    def close(self, **kwargs):
+        # Connections are kept per thread for reuse across requests.
+        pass
+
+    def _maybe_cull(self, conn):
+        # Threads share the counter; without the lock increments get lost and
+        # two threads can both reach 100 and cull at once
+        with self._cull_lock:
+            self._sets_since_cull += 1
+            if self._sets_since_cull < 100:
+                return
+            self._sets_since_cull = 0
+        conn.execute(
+            "DELETE FROM cache_entry WHERE expires IS NOT NULL AND expires <= ?", (time.time(),)
+        )
+        (count,) = conn.execute("SELECT COUNT(*) FROM cache_entry").fetchone()
+        if count > self._max_entries:
+            conn.execute(
+                "DELETE FROM cache_entry WHERE key IN "
+                "(SELECT key FROM cache_entry ORDER BY expires IS NULL, expires LIMIT ?)",
+                (count // self._cull_frequency,),
+            )
+
+
+class _immediate:
+    """BEGIN IMMEDIATE ... COMMIT, so read-modify-write runs under the write lock."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def get_or_compute(key, compute, timeout=DEFAULT_TIMEOUT, cache=None, lock_timeout=30, wait=5.0):
+    """
+    Return cache[key], calling compute() to fill it on a miss.
+
+    Only the caller that wins the lock (an atomic cache.add) recomputes; the
+    others poll for its result for up to `wait` seconds before computing
+    themselves. A None result is returned but never cached.
+    """
+    cache = cache or default_cache
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, timeout=lock_timeout):
+        try:
+            value = compute()
+            if value is not None:
+                cache.set(key, value, timeout=timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return compute()
+
+
+async def aget_or_compute(key, compute, timeout=DEFAULT_TIMEOUT, cache=None, lock_timeout=30, wait=5.0):
+    """get_or_compute() for async views; compute is a coroutine function."""
+    cache = cache or default_cache
+    value = await cache.aget(key)
+    if value is not None:
+        return value
+
+    lock_key = f"{key}:lock"
+    if await cache.aadd(lock_key, 1, timeout=lock_timeout):
+        try:
+            value = await compute()
+            if value is not None:
+                await cache.aset(key, value, timeout=timeout)
+            return value
+        finally:
+            await cache.adelete(lock_key)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        value = await cache.aget(key)
+        if value is not None:
+            return value
+    return await compute()
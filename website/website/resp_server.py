@@ -0,0 +1,272 @@
+"""
+A small in-memory server speaking the Redis protocol (RESP2).
+
+It implements the commands Django's RedisCache sends, so CACHE_BACKEND=redis
+can be run and tested without installing Redis:
+
+    python -m website.resp_server --port 6379
+
+Tests start it in a thread on a free port (RESPServer(port=0).start()).
+Data lives in the server process and is lost when it stops.
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class Error(Exception):
+    pass
+
+
+class Status(str):
+    """A simple-string reply, such as +OK."""
+
+
+OK = Status("OK")
+
+
+def read_command(rfile):
+    """The next command as a list of bytes, or None when the client has gone."""
+    line = rfile.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # Inline command, as typed into telnet
+        return line.split() or [b""]
+    command = []
+    for _ in range(int(line[1:])):
+        header = rfile.readline()
+        if not header.startswith(b"$"):
+            raise Error("ERR Protocol error: expected '$'")
+        size = int(header[1:])
+        command.append(rfile.read(size + 2)[:size])
+    return command
+
+
+def encode(reply):
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Error):
+        return b"-" + str(reply).encode() + b"\r\n"
+    if isinstance(reply, Status):
+        return b"+" + reply.encode() + b"\r\n"
+    if isinstance(reply, bool):
+        reply = int(reply)
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(encode(item) for item in reply)
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+
+class Store:
+    """Keys -> (value, expiry as a time.monotonic() value or None)."""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.RLock()
+
+    def execute(self, command):
+        if not command or not command[0]:
+            return Error("ERR empty command")
+        handler = getattr(self, f"cmd_{command[0].decode().lower()}", None)
+        if handler is None:
+            return Error(f"ERR unknown command '{command[0].decode()}'")
+        with self.lock:
+            try:
+                return handler(*command[1:])
+            except TypeError:
+                return Error(f"ERR wrong number of arguments for '{command[0].decode()}' command")
+            except ValueError:
+                return Error("ERR value is not an integer or out of range")
+            except Error as e:
+                return e
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+    # Connection ---------------------------------------------------------------
+
+    def cmd_ping(self, message=None):
+        return Status("PONG") if message is None else message
+
+    def cmd_echo(self, message):
+        return message
+
+    def cmd_select(self, db):
+        return OK
+
+    def cmd_client(self, *args):
+        return OK
+
+    # Keys ---------------------------------------------------------------------
+
+    def cmd_get(self, key):
+        entry = self._get(key)
+        return None if entry is None else entry[0]
+
+    def cmd_mget(self, *keys):
+        return [self.cmd_get(key) for key in keys]
+
+    def cmd_set(self, key, value, *options):
+        expires, nx, xx = None, False, False
+        options = [option.upper() for option in options]
+        i = 0
+        while i < len(options):
+            if options[i] in (b"EX", b"PX") and i + 1 < len(options):
+                amount = int(options[i + 1])
+                if amount <= 0:
+                    raise Error("ERR invalid expire time in 'set' command")
+                expires = time.monotonic() + (amount if options[i] == b"EX" else amount / 1000)
+                i += 2
+            elif options[i] in (b"NX", b"XX"):
+                nx, xx = nx or options[i] == b"NX", xx or options[i] == b"XX"
+                i += 1
+            else:
+                raise Error("ERR syntax error")
+        exists = self._get(key) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+        self.data[key] = (value, expires)
+        return OK
+
+    def cmd_mset(self, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise TypeError
+        for key, value in zip(pairs[::2], pairs[1::2]):
+            self.data[key] = (value, None)
+        return OK
+
+    def cmd_del(self, *keys):
+        return sum(self._get(key) is not None and self.data.pop(key) is not None for key in keys)
+
+    def cmd_exists(self, *keys):
+        return sum(self._get(key) is not None for key in keys)
+
+    def cmd_expire(self, key, seconds):
+        entry = self._get(key)
+        if entry is None:
+            return 0
+        if int(seconds) <= 0:
+            del self.data[key]
+        else:
+            self.data[key] = (entry[0], time.monotonic() + int(seconds))
+        return 1
+
+    def cmd_persist(self, key):
+        entry = self._get(key)
+        if entry is None or entry[1] is None:
+            return 0
+        self.data[key] = (entry[0], None)
+        return 1
+
+    def cmd_ttl(self, key):
+        entry = self._get(key)
+        if entry is None:
+            return -2
+        return -1 if entry[1] is None else round(entry[1] - time.monotonic())
+
+    def cmd_incrby(self, key, delta):
+        entry = self._get(key)
+        try:
+            value = int(entry[0] if entry else 0) + int(delta)
+        except ValueError:
+            raise Error("ERR value is not an integer or out of range")
+        self.data[key] = (str(value).encode(), entry[1] if entry else None)
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, b"1")
+
+    def cmd_decrby(self, key, delta):
+        return self.cmd_incrby(key, str(-int(delta)).encode())
+
+    def cmd_dbsize(self):
+        return sum(self._get(key) is not None for key in list(self.data))
+
+    def cmd_flushdb(self, *options):
+        self.data.clear()
+        return OK
+
+    cmd_flushall = cmd_flushdb
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store = self.server.store
+        queued = None  # commands between MULTI and EXEC
+        while True:
+            try:
+                command = read_command(self.rfile)
+            except (Error, ValueError, OSError):
+                return
+            if command is None:
+                return
+
+            name = command[0].upper()
+            if name == b"MULTI":
+                reply = Error("ERR MULTI calls can not be nested") if queued is not None else OK
+                queued = [] if queued is None else queued
+            elif name == b"EXEC":
+                if queued is None:
+                    reply = Error("ERR EXEC without MULTI")
+                else:
+                    with store.lock:
+                        reply = [store.execute(queued_command) for queued_command in queued]
+                    queued = None
+            elif name == b"DISCARD":
+                reply = OK if queued is not None else Error("ERR DISCARD without MULTI")
+                queued = None
+            elif queued is not None:
+                queued.append(command)
+                reply = Status("QUEUED")
+            else:
+                reply = store.execute(command)
+
+            try:
+                self.wfile.write(encode(reply))
+            except OSError:
+                return
+
+
+class RESPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=6379):
+        super().__init__((host, port), Handler)
+        self.store = Store()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        """Serve from a daemon thread; returns self."""
+        threading.Thread(target=self.serve_forever, name="resp-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    server = RESPServer(args.host, args.port)
+    print(f"Serving the Redis protocol on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,119 @@
+"""
+Pre-serialized JSON responses for hot, cacheable read endpoints.
+
+PreparedJSON holds a payload already encoded to bytes, plus gzip and (when
+the brotli package is installed) brotli variants compressed once up front.
+Views cache the PreparedJSON itself, so a cache hit sends stored bytes with
+no dict building, encoding or compression per request; prepared_response()
+picks the variant the client's Accept-Encoding allows and answers a matching
+If-None-Match with 304.
+
+Encoding uses orjson when it is installed and falls back to the standard
+library encoder otherwise; both produce compact JSON.
+"""
+import gzip
+import hashlib
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent as they are: compressing them saves
+# less than the headers cost
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+
+def _default(value):
+    return DjangoJSONEncoder().default(value)
+
+
+def dumps(data):
+    """data encoded as compact JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+
+
+class PreparedJSON:
+    """An encoded JSON body, its ETag and its compressed variants."""
+
+    def __init__(self, body):
+        self.body = body
+        # Weak, as one ETag covers every encoding of the same content
+        self.etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+        self.variants = {}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+            # mtime=0 keeps the gzip bytes identical across rebuilds
+            self.variants["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            self.variants = {coding: data for coding, data in self.variants.items() if len(data) < len(body)}
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(dumps(data))
+
+
+def parse_accept_encoding(header):
+    """{coding: q} from an Accept-Encoding header."""
+    qualities = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            qualities[coding.strip().lower()] = q
+    return qualities
+
+
+def choose_encoding(header, available):
+    """The best of `available` ("br" before "gzip") the client accepts, or None."""
+    qualities = parse_accept_encoding(header)
+    for coding in ("br", "gzip"):
+        if coding in available and qualities.get(coding, qualities.get("*", 0)) > 0:
+            return coding
+    return None
+
+
+def parse_etags(header):
+    """The entity tags listed in an If-None-Match header, W/ dropped (weak comparison)."""
+    return [tag.strip().removeprefix("W/") for tag in (header or "").split(",") if tag.strip()]
+
+
+def etag_matches(header, etag):
+    tags = parse_etags(header)
+    return tags == ["*"] or etag.removeprefix("W/") in tags
+
+
+def prepared_response(request, prepared, status=200, cache_control=None):
+    """An HttpResponse (or 304) sending `prepared` in the best encoding the client accepts."""
+    if status == 200 and etag_matches(request.headers.get("If-None-Match"), prepared.etag):
+        response = HttpResponseNotModified()
+    else:
+        coding = choose_encoding(request.headers.get("Accept-Encoding"), prepared.variants)
+        response = HttpResponse(prepared.variants.get(coding, prepared.body), content_type="application/json", status=status)
+        if coding:
+            response["Content-Encoding"] = coding
+    response["ETag"] = prepared.etag
+    if cache_control:
+        response["Cache-Control"] = cache_control
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
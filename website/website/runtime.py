@@ -0,0 +1,20 @@
+"""
+Local files the workers share, such as the search index, live in
+settings.RUNTIME_DIR: by default a directory under the system temp dir that
+only the user running the site may write to, so another local user can't
+plant or swap the files the workers load.
+"""
+import os
+import stat
+from django.core.exceptions import ImproperlyConfigured
+
+
+def private_dir(path):
+    """Create `path` (mode 0700) if needed and make sure no other user can write to it."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise ImproperlyConfigured(
+            f"{path} must be owned by uid {os.getuid()} and not writable by anyone else"
+        )
+    return path
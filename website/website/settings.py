@@ -2,8 +2,10 @@ from dotenv import load_dotenv
 load_dotenv(".env.production")
 
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 import os, json
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -12,6 +14,14 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SUPABASE_URL = os.getenv("DEV_DB_URL")
 SUPABASE_KEY = os.getenv("DEV_DB_API_KEY")
 
+# One pooled HTTP/2 client per worker talks to PostgREST (website/supabase_client.py)
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+SUPABASE_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SUPABASE_MAX_KEEPALIVE_CONNECTIONS", "10"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "60"))
+SUPABASE_SLOW_RPC_SECONDS = float(os.getenv("SUPABASE_SLOW_RPC_SECONDS", "1.0"))
+
 # know if the server is localhost or prod
 IS_PRODUCTION = os.getenv("PRODUCTION", "False").lower() == "true"
 
@@ -25,6 +35,29 @@ GOOGLE_REFRESH_TOKEN = os.getenv("GOOGLE_REFRESH_TOKEN")
 GOOGLE_DRIVE_FOLDER_ID = os.getenv("GOOGLE_DRIVE_FOLDER_ID")
 GOOGLE_SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 
+# WhatsApp OTP delivery (authentication/otp_outbox.py). Point the base URL at
+# `manage.py whatsapp_stub_server` to exercise the sender locally.
+WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
+WHATSAPP_PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
+WHATSAPP_API_BASE_URL = os.getenv("WHATSAPP_API_BASE_URL", "https://graph.facebook.com/v22.0")
+WHATSAPP_SEND_RATE = float(os.getenv("WHATSAPP_SEND_RATE", "20"))  # messages per second per sender
+OTP_OUTBOX_TTL = int(os.getenv("OTP_OUTBOX_TTL", "300"))  # seconds before an unsent OTP is dropped
+
+# Rate limits for the OTP endpoints live in authentication/middleware.py. Behind
+# a reverse proxy, the client IP has to come from X-Forwarded-For.
+RATE_LIMIT_TRUST_X_FORWARDED_FOR = os.getenv("RATE_LIMIT_TRUST_X_FORWARDED_FOR", "False").lower() == "true"
+
+# Per-process cache of AuthToken -> user id, checked against a per-user token
+# generation in the shared cache (authentication/tokens.py)
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv("AUTH_TOKEN_CACHE_TTL", "60"))
+AUTH_TOKEN_NEGATIVE_TTL = int(os.getenv("AUTH_TOKEN_NEGATIVE_TTL", "30"))
+
+# Processes used to try candidate image encodings concurrently (1 = serial).
+# Every process that encodes starts its own pool, so only raise it where few
+# processes serve the admin
+IMAGE_ENCODE_WORKERS = int(os.getenv("IMAGE_ENCODE_WORKERS", "1"))
+
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv('SECRET_KEY')
 
@@ -55,7 +88,9 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'website.middleware.AsyncWhiteNoiseMiddleware',
+    'authentication.middleware.RateLimitMiddleware',
+    'authentication.middleware.AuthTokenMiddleware',
     "django.contrib.admindocs.middleware.XViewMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -167,11 +202,48 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-CACHES = {
-    "default": {
+# Local files shared by the workers (the search index, the SQLite cache) go in
+# a directory only the user running the site may write to (website/runtime.py)
+RUNTIME_DIR = os.getenv("RUNTIME_DIR") or os.path.join(tempfile.gettempdir(), f"website-{os.getuid()}")
+
+# Cache: a small per-process LRU ("default") in front of a store shared by all
+# gunicorn workers ("shared"). CACHE_BACKEND picks the shared store:
+#   sqlite - a file on local disk, shared by the workers of one container (default)
+#   redis  - a Redis-protocol server at CACHE_LOCATION, shared across containers
+#            (`python -m website.resp_server` runs a local one for development)
+#   locmem - per-process only, nothing is shared
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite").lower()
+SHARED_CACHE_BACKENDS = {
+    "sqlite": {
+        "BACKEND": "website.cache.SQLiteCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", os.path.join(RUNTIME_DIR, "cache.sqlite3")),
+        "OPTIONS": {"MAX_ENTRIES": 50000},
+    },
+    "redis": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", "redis://127.0.0.1:6379/0"),
+    },
+    "locmem": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
         "LOCATION": "unique-snowflake",  # just needs to be unique per project
-    }
+    },
+}
+if CACHE_BACKEND not in SHARED_CACHE_BACKENDS:
+    raise ImproperlyConfigured(
+        f"CACHE_BACKEND must be one of {', '.join(SHARED_CACHE_BACKENDS)}, not {CACHE_BACKEND!r}"
+    )
+
+CACHES = {
+    "default": {
+        "BACKEND": "website.cache.TieredCache",
+        "OPTIONS": {
+            "SHARED_ALIAS": "shared",
+            "LOCAL_MAX_ENTRIES": int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "1000")),
+            # seconds a worker may serve a value another worker has replaced
+            "LOCAL_TIMEOUT": int(os.getenv("CACHE_LOCAL_TIMEOUT", "5")),
+        },
+    },
+    "shared": SHARED_CACHE_BACKENDS[CACHE_BACKEND],
 }
 
 #Cors Settings
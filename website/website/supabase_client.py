@@ -0,0 +1,188 @@
+"""
+The one Supabase client every app uses.
+
+Views import `supabase` from here instead of calling create_client() at import
+time, so each worker has a single HTTP/2 keep-alive pool to PostgREST. Async
+views use get_async_supabase(). Under ASGI that is a pooled httpx.AsyncClient
+for the worker's event loop. Under WSGI (runserver, SERVER_MODE=wsgi) each
+async view runs on a new event loop, so it runs RPCs on the sync pool in a
+worker thread instead of opening a new pool per request. Every `.rpc(...).execute()` is timed; get_rpc_metrics() returns
+the per-RPC numbers and calls slower than SUPABASE_SLOW_RPC_SECONDS are logged.
+"""
+import asyncio
+import logging
+import threading
+import time
+import weakref
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from postgrest import AsyncPostgrestClient, SyncPostgrestClient
+from supabase import create_client
+
+logger = logging.getLogger(__name__)
+
+_metrics_lock = threading.Lock()
+_rpc_metrics = {}
+
+
+def record_rpc(name, seconds, failed=False):
+    with _metrics_lock:
+        stats = _rpc_metrics.setdefault(name, {"calls": 0, "errors": 0, "seconds_total": 0.0, "seconds_max": 0.0})
+        stats["calls"] += 1
+        stats["errors"] += int(failed)
+        stats["seconds_total"] += seconds
+        stats["seconds_max"] = max(stats["seconds_max"], seconds)
+    if seconds >= settings.SUPABASE_SLOW_RPC_SECONDS:
+        logger.warning("Slow Supabase RPC %s took %.3fs", name, seconds)
+
+
+def get_rpc_metrics():
+    """Per-RPC call count, error count and latency (seconds) for this process."""
+    with _metrics_lock:
+        metrics = {name: dict(stats) for name, stats in _rpc_metrics.items()}
+    for stats in metrics.values():
+        stats["seconds_avg"] = stats["seconds_total"] / stats["calls"]
+    return metrics
+
+
+class TimedRPC:
+    """Wraps an RPC request builder so execute() is timed under the RPC name."""
+
+    def __init__(self, name, builder):
+        self._name = name
+        self._builder = builder
+
+    def execute(self):
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = self._builder.execute()
+            failed = False
+            return response
+        finally:
+            record_rpc(self._name, time.perf_counter() - started, failed)
+
+    def __getattr__(self, attr):
+        return getattr(self._builder, attr)
+
+
+class InstrumentedClient:
+    """
+    A Supabase client whose rpc() calls go through the pooled PostgREST client
+    and are timed; everything else is passed through to the Supabase client.
+    """
+
+    def __init__(self, client, postgrest):
+        self._client = client
+        self.postgrest = postgrest
+
+    def rpc(self, name, params=None, *args, **kwargs):
+        return TimedRPC(name, self.postgrest.rpc(name, params or {}, *args, **kwargs))
+
+    def __getattr__(self, attr):
+        return getattr(self._client, attr)
+
+
+class AsyncTimedRPC(TimedRPC):
+    async def execute(self):
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = await self._builder.execute()
+            failed = False
+            return response
+        finally:
+            record_rpc(self._name, time.perf_counter() - started, failed)
+
+
+class AsyncInstrumentedClient:
+    """The async counterpart of InstrumentedClient; only rpc() is supported."""
+
+    def __init__(self, postgrest):
+        self.postgrest = postgrest
+
+    def rpc(self, name, params=None, *args, **kwargs):
+        return AsyncTimedRPC(name, self.postgrest.rpc(name, params or {}, *args, **kwargs))
+
+
+class ThreadedRPC:
+    """An RPC of the sync client whose execute() is awaited from a worker thread."""
+
+    def __init__(self, rpc):
+        self._rpc = rpc
+
+    async def execute(self):
+        return await sync_to_async(self._rpc.execute, thread_sensitive=False)()
+
+    def __getattr__(self, attr):
+        return getattr(self._rpc, attr)
+
+
+class ThreadedClient:
+    """Async access to the sync pooled client, for event loops that last one request."""
+
+    def rpc(self, name, params=None, *args, **kwargs):
+        return ThreadedRPC(supabase.rpc(name, params, *args, **kwargs))
+
+
+def http_client_options():
+    return {
+        "http2": True,
+        "follow_redirects": True,
+        "timeout": httpx.Timeout(settings.SUPABASE_TIMEOUT, connect=settings.SUPABASE_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SUPABASE_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.SUPABASE_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def create_http_client():
+    return httpx.Client(**http_client_options())
+
+
+def create_supabase_client():
+    client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+    # Only PostgREST gets the tuned pool: it rewrites the httpx client's
+    # base_url, so the pool can't also be handed to auth/storage/functions.
+    postgrest = SyncPostgrestClient(
+        client.rest_url,
+        schema=client.options.schema,
+        headers=client.options.headers,
+        http_client=create_http_client(),
+    )
+    return InstrumentedClient(client, postgrest)
+
+
+supabase = create_supabase_client()
+_threaded_client = ThreadedClient()
+
+# httpx.AsyncClient connections belong to the loop that opened them. Under
+# uvicorn there is one loop per worker, so this is one pool per worker.
+_async_clients = weakref.WeakKeyDictionary()
+_async_pool_enabled = False
+
+
+def enable_async_pool():
+    """Called by website/asgi.py, where every request runs on the worker's one long-lived loop."""
+    global _async_pool_enabled
+    _async_pool_enabled = True
+
+
+def get_async_supabase():
+    """The pooled async client for the running event loop (see the module docstring)."""
+    if not _async_pool_enabled:
+        return _threaded_client
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        postgrest = AsyncPostgrestClient(
+            supabase.rest_url,
+            schema=supabase.options.schema,
+            headers=supabase.options.headers,
+            http_client=httpx.AsyncClient(**http_client_options()),
+        )
+        client = _async_clients[loop] = AsyncInstrumentedClient(postgrest)
+    return client
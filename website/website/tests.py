@@ -0,0 +1,240 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from . import supabase_client
+from .cache import SQLiteCache, get_or_compute
+from .resp_server import RESPServer
+from .responses import PreparedJSON, choose_encoding, prepared_response
+
+
+def tiered_caches(shared):
+    """CACHES with a TieredCache over `shared`, for override_settings."""
+    return {
+        "default": {
+            "BACKEND": "website.cache.TieredCache",
+            "OPTIONS": {"SHARED_ALIAS": "shared", "LOCAL_MAX_ENTRIES": 10, "LOCAL_TIMEOUT": 5},
+        },
+        "shared": shared,
+    }
+
+
+class CacheIsolationMixin:
+    """
+    Runs each test against empty per-process caches, so tests neither read
+    nor fill the configured shared store.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(override_settings(CACHES=tiered_caches({
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "tests",
+        })))
+        super().setUpClass()
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+
+
+class SharedCacheTestsMixin:
+    """Runs against CACHES["default"], a TieredCache over the backend under test."""
+
+    def setUp(self):
+        self.cache = caches["default"]
+        self.cache.clear()
+
+    def test_set_get_delete(self):
+        self.cache.set("key", {"a": 1})
+        self.assertEqual(self.cache.get("key"), {"a": 1})
+        self.assertEqual(caches["shared"].get("key"), {"a": 1})
+        self.assertTrue(self.cache.delete("key"))
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_add_is_atomic_across_threads(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.add("lock", 1, timeout=30))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+
+    def test_incr(self):
+        self.cache.set("counter", 1)
+        self.assertEqual(self.cache.incr("counter", 5), 6)
+        self.assertEqual(self.cache.get("counter"), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr("missing")
+
+    def test_timeout(self):
+        self.cache.set("short", "value", timeout=1)
+        self.cache.set("forever", "value", timeout=None)
+        time.sleep(1.1)
+        self.assertIsNone(caches["shared"].get("short"))
+        self.assertIsNone(self.cache.get("short"))
+        self.assertEqual(self.cache.get("forever"), "value")
+
+    def test_local_tier_serves_shared_values(self):
+        caches["shared"].set("key", "shared")
+        self.assertEqual(self.cache.get("key"), "shared")
+        # Replaced behind this worker's back: the local copy is served until it expires
+        caches["shared"].set("key", "replaced")
+        self.assertEqual(self.cache.get("key"), "shared")
+
+    def test_get_or_compute_computes_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return "value"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(get_or_compute("hot", compute, cache=self.cache))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["value"] * 8)
+        self.assertEqual(len(calls), 1)
+
+
+class SQLiteCacheTests(SharedCacheTestsMixin, SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.enterClassContext(override_settings(CACHES=tiered_caches({
+            "BACKEND": "website.cache.SQLiteCache",
+            "LOCATION": os.path.join(cls.directory.name, "cache.sqlite3"),
+        })))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.directory.cleanup()
+
+    def test_refuses_a_directory_others_can_write(self):
+        directory = os.path.join(self.directory.name, "shared")
+        os.mkdir(directory)
+        os.chmod(directory, 0o777)
+        cache = SQLiteCache(os.path.join(directory, "cache.sqlite3"), {})
+        with self.assertRaises(ImproperlyConfigured):
+            cache.get("key")
+
+
+class RedisCacheTests(SharedCacheTestsMixin, SimpleTestCase):
+    """Django's RedisCache against website.resp_server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RESPServer(port=0).start()
+        cls.enterClassContext(override_settings(CACHES=tiered_caches({
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": cls.server.url,
+        })))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.server.stop()
+
+    def test_many_and_touch(self):
+        shared = caches["shared"]
+        shared.set_many({"a": 1, "b": "two"}, timeout=60)
+        self.assertEqual(shared.get_many(["a", "b", "c"]), {"a": 1, "b": "two"})
+        self.assertTrue(shared.touch("a", timeout=None))
+        shared.delete_many(["a", "b"])
+        self.assertEqual(shared.get_many(["a", "b"]), {})
+
+
+class CacheSettingsTests(SimpleTestCase):
+    def test_unknown_backend(self):
+        result = subprocess.run(
+            [sys.executable, "-c", "import website.settings"],
+            env={**os.environ, "CACHE_BACKEND": "memcached"},
+            capture_output=True,
+            text=True,
+        )
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("ImproperlyConfigured: CACHE_BACKEND must be one of sqlite, redis, locmem, not 'memcached'", result.stderr)
+
+
+class AsyncSupabaseClientTests(SimpleTestCase):
+    def test_short_lived_loops_share_the_sync_pool(self):
+        rpc = mock.Mock()
+        rpc.execute.return_value = "response"
+
+        async def call():
+            client = supabase_client.get_async_supabase()
+            return client, await client.rpc("get_categories").execute()
+
+        with mock.patch.object(supabase_client.supabase, "rpc", return_value=rpc) as sync_rpc:
+            (first, response), (second, _) = async_to_sync(call)(), async_to_sync(call)()
+        self.assertIs(first, second)
+        self.assertEqual(response, "response")
+        self.assertEqual(sync_rpc.call_count, 2)
+
+    def test_asgi_worker_loop_gets_an_async_pool(self):
+        async def clients():
+            return supabase_client.get_async_supabase(), supabase_client.get_async_supabase()
+
+        with mock.patch.object(supabase_client, "_async_pool_enabled", True):
+            first, second = async_to_sync(clients)()
+        self.assertIsInstance(first, supabase_client.AsyncInstrumentedClient)
+        self.assertIs(first, second)
+
+
+class PreparedResponseTests(SimpleTestCase):
+    def setUp(self):
+        self.prepared = PreparedJSON.from_data({"items": [{"name": f"Product {i}"} for i in range(200)]})
+
+    def get(self, **headers):
+        return prepared_response(RequestFactory().get("/", headers=headers), self.prepared, cache_control="no-cache")
+
+    def test_body_is_sent_as_encoded(self):
+        response = self.get()
+        self.assertEqual(response.content, self.prepared.body)
+        self.assertEqual(json.loads(response.content)["items"][1], {"name": "Product 1"})
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual((response["Content-Type"], response["Cache-Control"], response["Vary"]), ("application/json", "no-cache", "Accept-Encoding"))
+
+    def test_encoding_follows_accept_encoding(self):
+        self.assertEqual(choose_encoding("gzip, deflate", {"gzip": b""}), "gzip")
+        self.assertEqual(choose_encoding("br;q=1, gzip;q=0.5", {"br": b"", "gzip": b""}), "br")
+        self.assertIsNone(choose_encoding("gzip;q=0, *;q=1", {"gzip": b""}))
+        self.assertEqual(choose_encoding("*", {"gzip": b""}), "gzip")
+        self.assertIsNone(choose_encoding("identity", {"gzip": b""}))
+
+        response = self.get(accept_encoding="gzip;q=0.8")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.prepared.body)
+
+    def test_small_bodies_are_not_compressed(self):
+        self.assertEqual(PreparedJSON.from_data({"status": "success"}).variants, {})
+
+    def test_weak_etag_revalidation(self):
+        etag = self.prepared.etag
+        self.assertRegex(etag, r'^W/"[0-9a-f]{40}"$')
+        self.assertEqual(etag, PreparedJSON(self.prepared.body).etag)
+
+        for header in (etag, etag.removeprefix("W/"), f'"other", {etag}', "*"):
+            with self.subTest(if_none_match=header):
+                response = self.get(if_none_match=header, accept_encoding="gzip")
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+        # Not a tag in the list, only a substring of one
+        response = self.get(if_none_match=f'"x{etag.removeprefix("W/")[1:-1]}x"')
+        self.assertEqual(response.status_code, 200)